@@ -1,58 +1,83 @@
-from flask import Flask, render_template, request, jsonify, send_file
-from jinja2 import Template, TemplateSyntaxError, UndefinedError
+from flask import Blueprint, Flask, current_app, render_template, request, jsonify, send_file, Response, stream_with_context, g
+from flask.logging import default_handler
+from jinja2 import TemplateSyntaxError, UndefinedError
+from jinja2.exceptions import SecurityError
 import json
-import yaml
-import pandas as pd
 from io import BytesIO
 from database import Database
+import renderer
+import excel_reader
+import jobs
+import log_reader
+from log_store import LogStore, SQLiteLogHandler
+from sheet_store import SheetStore
+import log_pipeline
+import metrics
+import profiling
 import os
 from datetime import datetime
 import logging
-from logging.handlers import RotatingFileHandler
+import queue
 from collections import deque
 import subprocess
-
-app = Flask(__name__)
-app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
-app.config['UPLOAD_FOLDER'] = 'uploads'
-
-# Get current version from git
+import atexit
+import hmac
+import re
+import time
+import tempfile
+import uuid
+import zipfile
+
+# Routes live on a blueprint; create_app() builds the application and the process-wide
+# state (logging pipeline, database pool) they use
+bp = Blueprint('main', __name__)
+
+# Per-request profiling store (see create_app for PROFILE_TOKEN); kept on disk so every worker
+# serves every profile (PROFILE_DIR='' keeps them in this process's memory only)
+profile_store = profiling.ProfileStore(max_profiles=int(os.environ.get('PROFILE_KEEP', 20)),
+                                       directory=os.environ.get('PROFILE_DIR', 'data/profiles') or None)
+
+# Sheet ingestion metrics (template/DB metrics live in renderer.py and database.py)
+EXCEL_READ_SECONDS = metrics.Histogram(
+    'excel_read_duration_seconds', 'Time to parse an uploaded sheet into rows', ['reader'])
+EXCEL_READ_ROWS = metrics.Histogram(
+    'excel_read_rows', 'Rows per uploaded sheet', ['reader'], buckets=metrics.ROW_BUCKETS)
+
+# Get current version: written to VERSION at image build time (see Dockerfile), git in a dev checkout
 def get_version():
+    app_dir = os.path.dirname(os.path.abspath(__file__))
     try:
-        version = subprocess.check_output(['git', 'describe', '--tags', '--always'], cwd=os.path.dirname(__file__)).decode('utf-8').strip()
+        with open(os.path.join(app_dir, 'VERSION')) as f:
+            version = f.read().strip()
+        if version:
+            return version
+    except OSError:
+        pass
+    try:
+        version = subprocess.check_output(['git', 'describe', '--tags', '--always'], cwd=app_dir, stderr=subprocess.DEVNULL).decode('utf-8').strip()
         return version
     except:
         return 'v1.5'  # Fallback version
 
 APP_VERSION = get_version()
 
-# Configure logging
-if not os.path.exists('logs'):
-    os.makedirs('logs')
-
-# File handler
-file_handler = RotatingFileHandler('logs/app.log', maxBytes=10485760, backupCount=10)
-file_handler.setFormatter(logging.Formatter(
-    '%(asctime)s %(levelname)s: %(message)s [in %(pathname)s:%(lineno)d]'
-))
-file_handler.setLevel(logging.INFO)
-
-# Console handler
-console_handler = logging.StreamHandler()
-console_handler.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(message)s'))
-console_handler.setLevel(logging.INFO)
-
-# Configure app logger
-app.logger.addHandler(file_handler)
-app.logger.addHandler(console_handler)
-app.logger.setLevel(logging.INFO)
-
 # In-memory log buffer for quick access (keep last 500 logs)
 log_buffer = deque(maxlen=500)
 
+# Live log tail subscribers (/api/logs/stream), fed by BufferHandler
+log_broadcaster = log_pipeline.LogBroadcaster(max_subscribers=int(os.environ.get('LOG_STREAM_MAX_CLIENTS', 20)))
+
+# High-volume debug call sites are rate limited before they reach the log queue
+log_rate_limit = log_pipeline.RateLimitFilter(
+    burst=int(os.environ.get('LOG_RATE_LIMIT_BURST', 20)),
+    interval=float(os.environ.get('LOG_RATE_LIMIT_INTERVAL', 10))
+)
+
 class BufferHandler(logging.Handler):
     def emit(self, record):
         log_entry = {
+            # Row id in the log store (set by the sqlite handler, which runs first); None below INFO
+            'id': getattr(record, 'log_id', None),
             'timestamp': datetime.fromtimestamp(record.created).strftime('%Y-%m-%d %H:%M:%S'),
             'level': record.levelname,
             'message': record.getMessage(),
@@ -60,20 +85,180 @@ class BufferHandler(logging.Handler):
             'line': record.lineno
         }
         log_buffer.append(log_entry)
+        log_broadcaster.publish(log_entry)
+
+# Process-wide state, set up once by create_app()
+db = None
+sheet_store = None
+job_store = None
+job_runner = None
+log_store = None
+log_queue = None
+log_listener = None
+queue_handler = None
+log_handlers = []
+
+def configure_logging(app):
+    """Attach the queue-based logging pipeline to app.logger and start its listener thread"""
+    global log_store, log_queue, log_listener, queue_handler, log_handlers
+
+    if not os.path.exists('logs'):
+        os.makedirs('logs')
+
+    # File handler
+    # Rotation is coordinated between processes, so several gunicorn workers can share the file
+    file_handler = log_pipeline.SharedRotatingFileHandler('logs/app.log', maxBytes=10485760, backupCount=10)
+    file_handler.setFormatter(logging.Formatter(
+        '%(asctime)s %(levelname)s: %(message)s [in %(pathname)s:%(lineno)d]'
+    ))
+    file_handler.setLevel(logging.INFO)
+    file_handler.set_name('file')
+
+    # Console handler
+    console_handler = logging.StreamHandler()
+    console_handler.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(message)s'))
+    console_handler.setLevel(logging.INFO)
+    console_handler.set_name('console')
+
+    buffer_handler = BufferHandler()
+    buffer_handler.setLevel(logging.DEBUG)
+    buffer_handler.set_name('buffer')
+
+    # Structured log sink (SQLite, indexed); bounded like the rotating files above
+    log_store = LogStore(
+        'logs/app_logs.db',
+        max_rows=int(os.environ.get('LOG_DB_MAX_ROWS', 500000)),
+        max_age=float(os.environ.get('LOG_DB_MAX_AGE_DAYS', 30)) * 86400
+    )
+    sqlite_handler = SQLiteLogHandler(log_store)
+    sqlite_handler.setLevel(logging.INFO)
+    sqlite_handler.set_name('sqlite')
+
+    # sqlite before buffer: streamed entries carry the id the store assigned
+    log_handlers = [file_handler, console_handler, sqlite_handler, buffer_handler]
+
+    # Request threads only enqueue records; a background listener runs the handlers above
+    log_queue = queue.Queue(-1)
+    queue_handler = log_pipeline.DeferredQueueHandler(log_queue)
+    queue_handler.addFilter(log_rate_limit)
+
+    # Configure app logger (Flask's default stderr handler would duplicate the console handler)
+    app.logger.removeHandler(default_handler)
+    app.logger.addHandler(queue_handler)
+    app.logger.setLevel(os.environ.get('LOG_LEVEL', 'INFO').upper())
+
+    log_listener = log_pipeline.TimedQueueListener(log_queue, *log_handlers)
+    log_listener.start()
+    atexit.register(lambda: log_listener.stop())  # whichever listener is current (see reset_after_fork)
+
+def create_app(config=None):
+    """Build the Flask application.
+
+    Logging and the database are process-wide and set up on the first call only.
+    Schema migrations run at most once per database file: Database.migrate() is a
+    single PRAGMA read when the file is current and otherwise runs under a file
+    lock, so gunicorn workers starting together never race on it.
+    """
+    global db, sheet_store, job_store, job_runner
+    app = Flask(__name__)
+    app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
+    app.config['UPLOAD_FOLDER'] = 'uploads'
+
+    # Config generation: optional parallel rendering of template groups
+    app.config['RENDER_PARALLEL'] = os.environ.get('RENDER_PARALLEL', '0') == '1'
+    app.config['RENDER_EXECUTOR'] = os.environ.get('RENDER_EXECUTOR', 'process')  # 'process' or 'thread'
+    app.config['RENDER_WORKERS'] = int(os.environ.get('RENDER_WORKERS', os.cpu_count() or 2))
+    # Seconds from submission before a parallel group is given up (see renderer.render_groups)
+    app.config['RENDER_GROUP_TIMEOUT'] = float(os.environ.get('RENDER_GROUP_TIMEOUT', 60))
+    # Per-render limits for every template (CPU time, output size, range size, loop iterations):
+    # RENDER_CPU_SECONDS etc. in renderer.py, read there so process-pool workers apply them too
+    # Reuse rendered configs for unchanged template groups (sizes/location: OUTPUT_CACHE_* in renderer.py)
+    app.config['OUTPUT_CACHE'] = os.environ.get('OUTPUT_CACHE', '1') == '1'
+
+    # Spreadsheet ingestion: 'streaming' (openpyxl read-only) or 'pandas' for .xlsx; .csv always streams
+    app.config['EXCEL_READER'] = os.environ.get('EXCEL_READER', 'streaming')
+
+    # Server-side generation: seconds an uploaded sheet stays reusable by token, and the bytes
+    # of parsed rows kept for all tokens (data/sheets.db, shared by every worker)
+    app.config['SHEET_CACHE_TTL'] = int(os.environ.get('SHEET_CACHE_TTL', 3600))
+    app.config['SHEET_STORE_MAX_BYTES'] = int(os.environ.get('SHEET_STORE_MAX_BYTES', 1024 * 1024 * 1024))
+
+    # Per-request profiling (?profile=1 or "X-Profile: 1"), admin-only: requires X-Profile-Token
+    # to match PROFILE_TOKEN; disabled when PROFILE_TOKEN is unset
+    app.config['PROFILE_TOKEN'] = os.environ.get('PROFILE_TOKEN', '')
+
+    # Background generation jobs (/api/jobs): runner threads per process, seconds finished
+    # jobs and their results are kept, and seconds without progress before a running job
+    # is considered abandoned by a dead worker
+    app.config['JOB_WORKERS'] = int(os.environ.get('JOB_WORKERS', 2))
+    app.config['JOB_RESULT_TTL'] = int(os.environ.get('JOB_RESULT_TTL', 3600))
+    app.config['JOB_STALE_SECONDS'] = int(os.environ.get('JOB_STALE_SECONDS', 600))
+
+    # Live log tail source: 'buffer' streams this process's records;
+    # 'store' polls the shared SQLite log store (multi-worker)
+    app.config['LOG_STREAM_SOURCE'] = os.environ.get('LOG_STREAM_SOURCE', 'buffer')
+    # Seconds before a live log stream is closed (the browser reconnects and resumes)
+    app.config['LOG_STREAM_MAX_SECONDS'] = int(os.environ.get('LOG_STREAM_MAX_SECONDS', 300))
+
+    if config:
+        app.config.update(config)
+
+    if log_listener is None:
+        configure_logging(app)
+    else:
+        app.logger.removeHandler(default_handler)
+        app.logger.addHandler(queue_handler)
 
-buffer_handler = BufferHandler()
-buffer_handler.setLevel(logging.DEBUG)
-app.logger.addHandler(buffer_handler)
-
-app.logger.info('Application starting...')
-
-# Initialize database
-db = Database()
-
-# Ensure upload folder exists
-os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
+    app.logger.info('Application starting...')
 
-@app.route('/')
+    if db is None:
+        db = Database()
+        db.add_change_listener(renderer.invalidate_template)
+        atexit.register(lambda: db.close())
+        atexit.register(renderer.shutdown_executors)
+
+    if sheet_store is None:
+        sheet_store = SheetStore('data/sheets.db', max_bytes=app.config['SHEET_STORE_MAX_BYTES'])
+        atexit.register(lambda: sheet_store.close())
+
+    if job_store is None:
+        job_store = jobs.JobStore('data/jobs.db', ttl=app.config['JOB_RESULT_TTL'])
+        # Threads start lazily (see ensure_job_runner), so a preloading gunicorn master never runs jobs
+        job_runner = jobs.JobRunner(job_store, {'generate': run_generation_job},
+                                    workers=app.config['JOB_WORKERS'],
+                                    stale_after=app.config['JOB_STALE_SECONDS'],
+                                    wrap=app.app_context, logger=app.logger)
+        atexit.register(lambda: job_store.close())
+        atexit.register(lambda: job_runner.stop())
+
+    # Ensure upload folder exists
+    os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
+
+    app.register_blueprint(bp)
+    return app
+
+def reset_after_fork():
+    """Re-create per-process state in a freshly forked worker (gunicorn post_fork hook).
+
+    Pooled SQLite connections, the logging listener thread and render worker pools
+    belong to the parent and must not be used in the child; locks held by the
+    parent's listener thread at fork time would never be released here.
+    Caches, the in-memory log buffer and metrics simply become per-worker.
+    """
+    global log_queue, log_listener, log_broadcaster
+    db.pool.reset_after_fork()
+    log_store.pool.reset_after_fork()
+    sheet_store.pool.reset_after_fork()
+    job_store.pool.reset_after_fork()
+    renderer.reset_after_fork()
+
+    log_broadcaster = log_pipeline.LogBroadcaster(max_subscribers=log_broadcaster.max_subscribers)
+    log_queue = queue.Queue(-1)
+    queue_handler.queue = log_queue
+    log_listener = log_pipeline.TimedQueueListener(log_queue, *log_handlers)
+    log_listener.start()
+
+@bp.route('/')
 def index():
     response = render_template('index.html', version=APP_VERSION)
     from flask import make_response
@@ -83,7 +268,7 @@ def index():
     resp.headers['Expires'] = '0'
     return resp
 
-@app.route('/render', methods=['POST'])
+@bp.route('/render', methods=['POST'])
 def render_jinja():
     try:
         data = request.get_json()
@@ -95,6 +280,7 @@ def render_jinja():
             # First try JSON
             variables = json.loads(variables_str)
         except json.JSONDecodeError:
+            import yaml  # Imported on first use to keep startup fast
             try:
                 # Then try YAML
                 variables = yaml.safe_load(variables_str)
@@ -108,9 +294,11 @@ def render_jinja():
                         key, value = line.split('=', 1)
                         variables[key.strip()] = value.strip()
 
-        # Create and render template
-        template = Template(template_str)
-        output = template.render(**variables)
+        # Create and render template (compiled once per distinct source)
+        template = renderer.compile_source(template_str)
+        with renderer.RENDER_SECONDS.time(path='tester'):
+            output = renderer.render_limited(template, variables)
+        renderer.record_output('tester', output)
 
         return jsonify({
             'success': True,
@@ -118,21 +306,35 @@ def render_jinja():
         })
 
     except TemplateSyntaxError as e:
-        app.logger.error(f'Template syntax error in Jinja Tester: {str(e)}')
+        current_app.logger.error(f'Template syntax error in Jinja Tester: {str(e)}')
         return jsonify({
             'success': False,
             'error': f'Template Syntax Error: {str(e)}'
         }), 400
 
     except UndefinedError as e:
-        app.logger.error(f'Undefined variable in Jinja Tester: {str(e)}')
+        current_app.logger.error(f'Undefined variable in Jinja Tester: {str(e)}')
         return jsonify({
             'success': False,
             'error': f'Undefined Variable: {str(e)}'
         }), 400
 
+    except renderer.RenderAborted as e:
+        current_app.logger.warning(f'Jinja Tester render stopped: {e.reason}')
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
+
+    except SecurityError as e:
+        current_app.logger.warning(f'Unsafe operation in Jinja Tester: {str(e)}')
+        return jsonify({
+            'success': False,
+            'error': f'Security Error: {str(e)}'
+        }), 400
+
     except Exception as e:
-        app.logger.error(f'Error in Jinja Tester: {str(e)}')
+        current_app.logger.error(f'Error in Jinja Tester: {str(e)}')
         return jsonify({
             'success': False,
             'error': f'Error: {str(e)}'
@@ -140,19 +342,19 @@ def render_jinja():
 
 # ========== Config Generator API Endpoints ==========
 
-@app.route('/api/host-types', methods=['GET'])
+@bp.route('/api/host-types', methods=['GET'])
 def get_host_types():
     return jsonify(db.get_host_types())
 
-@app.route('/api/port-types', methods=['GET'])
+@bp.route('/api/port-types', methods=['GET'])
 def get_port_types():
     return jsonify(db.get_port_types())
 
-@app.route('/api/switch-os-types', methods=['GET'])
+@bp.route('/api/switch-os-types', methods=['GET'])
 def get_switch_os_types():
     return jsonify(db.get_switch_os_types())
 
-@app.route('/api/templates', methods=['GET'])
+@bp.route('/api/templates', methods=['GET'])
 def get_templates():
     host_type = request.args.get('host_type')
     port_type = request.args.get('port_type')
@@ -165,7 +367,7 @@ def get_templates():
 
     return jsonify(templates)
 
-@app.route('/api/templates/<int:template_id>', methods=['GET'])
+@bp.route('/api/templates/<int:template_id>', methods=['GET'])
 def get_template(template_id):
     template = db.get_template(template_id)
     if template:
@@ -174,11 +376,21 @@ def get_template(template_id):
         return jsonify(template)
     return jsonify({'error': 'Template not found'}), 404
 
-@app.route('/api/templates', methods=['POST'])
+def precompile_template(template_content):
+    """Compile saved source into the template code store now, so its first render loads code instead"""
+    if not template_content:
+        return
+    try:
+        renderer.precompile(template_content)
+    except Exception as e:
+        # Saving is still allowed; rendering will report the error
+        current_app.logger.warning(f"Saved template does not compile: {str(e)}")
+
+@bp.route('/api/templates', methods=['POST'])
 def create_template():
     try:
         data = request.get_json()
-        app.logger.info(f"User creating template: {data['name']} ({data['host_type']}/{data['port_type']}/{data['switch_os']})")
+        current_app.logger.info(f"User creating template: {data['name']} ({data['host_type']}/{data['port_type']}/{data['switch_os']})")
         template_id = db.create_template(
             name=data['name'],
             host_type=data['host_type'],
@@ -187,37 +399,38 @@ def create_template():
             template_content=data['template_content'],
             version_description=data.get('version_description', '')
         )
-        app.logger.info(f"Template created successfully with ID: {template_id}")
+        precompile_template(data['template_content'])
+        current_app.logger.info(f"Template created successfully with ID: {template_id}")
         return jsonify({'success': True, 'template_id': template_id})
     except Exception as e:
-        app.logger.error(f"Error creating template: {str(e)}")
+        current_app.logger.error(f"Error creating template: {str(e)}")
         return jsonify({'success': False, 'error': str(e)}), 400
 
-@app.route('/api/templates/<int:template_id>', methods=['PUT'])
+@bp.route('/api/templates/<int:template_id>', methods=['PUT'])
 def update_template(template_id):
     try:
         data = request.get_json()
-        app.logger.info(f"User updating template ID {template_id}: {data}")
+        current_app.logger.info(f"User updating template ID {template_id}: {data}")
         db.update_template(template_id, **data)
-        app.logger.info(f"Template {template_id} updated successfully")
+        current_app.logger.info(f"Template {template_id} updated successfully")
         return jsonify({'success': True})
     except Exception as e:
-        app.logger.error(f"Error updating template {template_id}: {str(e)}")
+        current_app.logger.error(f"Error updating template {template_id}: {str(e)}")
         return jsonify({'success': False, 'error': str(e)}), 400
 
-@app.route('/api/templates/<int:template_id>', methods=['DELETE'])
+@bp.route('/api/templates/<int:template_id>', methods=['DELETE'])
 def delete_template(template_id):
     try:
         template = db.get_template(template_id)
-        app.logger.warning(f"User deleting template ID {template_id}: {template['name'] if template else 'Unknown'}")
+        current_app.logger.warning(f"User deleting template ID {template_id}: {template['name'] if template else 'Unknown'}")
         db.delete_template(template_id)
-        app.logger.info(f"Template {template_id} deleted successfully")
+        current_app.logger.info(f"Template {template_id} deleted successfully")
         return jsonify({'success': True})
     except Exception as e:
-        app.logger.error(f"Error deleting template {template_id}: {str(e)}")
+        current_app.logger.error(f"Error deleting template {template_id}: {str(e)}")
         return jsonify({'success': False, 'error': str(e)}), 400
 
-@app.route('/api/templates/<int:template_id>/versions', methods=['GET'])
+@bp.route('/api/templates/<int:template_id>/versions', methods=['GET'])
 def get_template_versions(template_id):
     try:
         versions = db.get_template_versions(template_id)
@@ -225,24 +438,25 @@ def get_template_versions(template_id):
     except Exception as e:
         return jsonify({'error': str(e)}), 400
 
-@app.route('/api/templates/<int:template_id>/versions', methods=['POST'])
+@bp.route('/api/templates/<int:template_id>/versions', methods=['POST'])
 def create_template_version(template_id):
     try:
         data = request.get_json()
-        app.logger.info(f"User creating new version for template ID {template_id}: {data.get('version_name')}")
+        current_app.logger.info(f"User creating new version for template ID {template_id}: {data.get('version_name')}")
         version_num = db.create_template_version(
             template_id,
             data.get('template_content'),
             data.get('version_name'),
             data.get('version_description', '')
         )
-        app.logger.info(f"Version {version_num} created for template {template_id}")
+        precompile_template(data.get('template_content'))
+        current_app.logger.info(f"Version {version_num} created for template {template_id}")
         return jsonify({'success': True, 'version': version_num})
     except Exception as e:
-        app.logger.error(f"Error creating version for template {template_id}: {str(e)}")
+        current_app.logger.error(f"Error creating version for template {template_id}: {str(e)}")
         return jsonify({'success': False, 'error': str(e)}), 400
 
-@app.route('/api/templates/<int:template_id>/versions/<int:version>', methods=['GET'])
+@bp.route('/api/templates/<int:template_id>/versions/<int:version>', methods=['GET'])
 def get_template_version(template_id, version):
     try:
         version_data = db.get_template_version(template_id, version)
@@ -250,184 +464,687 @@ def get_template_version(template_id, version):
             return jsonify(version_data)
         return jsonify({'error': 'Version not found'}), 404
     except Exception as e:
-        app.logger.error(f"Error getting version {version} for template {template_id}: {str(e)}")
+        current_app.logger.error(f"Error getting version {version} for template {template_id}: {str(e)}")
         return jsonify({'error': str(e)}), 400
 
-@app.route('/api/templates/<int:template_id>/versions/<int:version>', methods=['PUT'])
+@bp.route('/api/templates/<int:template_id>/versions/<int:version>', methods=['PUT'])
 def update_template_version(template_id, version):
     try:
         data = request.get_json()
-        app.logger.info(f"User updating version {version} for template {template_id}")
+        current_app.logger.info(f"User updating version {version} for template {template_id}")
         db.update_template_version(template_id, version, **data)
-        app.logger.info(f"Version {version} updated for template {template_id}")
+        precompile_template(data.get('template_content'))
+        current_app.logger.info(f"Version {version} updated for template {template_id}")
         return jsonify({'success': True})
     except Exception as e:
-        app.logger.error(f"Error updating version {version} for template {template_id}: {str(e)}")
+        current_app.logger.error(f"Error updating version {version} for template {template_id}: {str(e)}")
         return jsonify({'success': False, 'error': str(e)}), 400
 
-@app.route('/api/templates/<int:template_id>/versions/<int:version>', methods=['DELETE'])
+@bp.route('/api/templates/<int:template_id>/versions/<int:version>', methods=['DELETE'])
 def delete_template_version(template_id, version):
     try:
-        app.logger.warning(f"User deleting version {version} for template {template_id}")
+        current_app.logger.warning(f"User deleting version {version} for template {template_id}")
         db.delete_template_version(template_id, version)
-        app.logger.info(f"Version {version} deleted for template {template_id}")
+        current_app.logger.info(f"Version {version} deleted for template {template_id}")
         return jsonify({'success': True})
     except Exception as e:
-        app.logger.error(f"Error deleting version {version} for template {template_id}: {str(e)}")
+        current_app.logger.error(f"Error deleting version {version} for template {template_id}: {str(e)}")
         return jsonify({'success': False, 'error': str(e)}), 400
 
-@app.route('/api/templates/<int:template_id>/active-version/<int:version>', methods=['POST'])
+@bp.route('/api/templates/<int:template_id>/active-version/<int:version>', methods=['POST'])
 def set_active_version(template_id, version):
     try:
-        app.logger.info(f"User setting active version to {version} for template {template_id}")
+        current_app.logger.info(f"User setting active version to {version} for template {template_id}")
         db.set_active_version(template_id, version)
-        app.logger.info(f"Active version set to {version} for template {template_id}")
+        current_app.logger.info(f"Active version set to {version} for template {template_id}")
         return jsonify({'success': True})
     except Exception as e:
-        app.logger.error(f"Error setting active version for template {template_id}: {str(e)}")
+        current_app.logger.error(f"Error setting active version for template {template_id}: {str(e)}")
         return jsonify({'success': False, 'error': str(e)}), 400
 
-@app.route('/api/upload-excel', methods=['POST'])
-def upload_excel():
-    try:
-        if 'file' not in request.files:
-            app.logger.warning("Excel upload attempt with no file")
-            return jsonify({'success': False, 'error': 'No file uploaded'}), 400
+def read_excel_rows(file):
+    """Parse an uploaded workbook or CSV file into (rows, columns)"""
+    filename = file.filename.lower()
+    if filename.endswith('.csv'):
+        reader = 'csv'
+    elif filename.endswith('.xlsx') and current_app.config['EXCEL_READER'] == 'streaming':
+        reader = 'streaming'
+    else:
+        reader = 'pandas'
 
-        file = request.files['file']
-        if file.filename == '':
-            app.logger.warning("Excel upload attempt with empty filename")
-            return jsonify({'success': False, 'error': 'No file selected'}), 400
+    with EXCEL_READ_SECONDS.time(reader=reader):
+        if reader != 'pandas':
+            # Stream rows straight into dicts without building a DataFrame
+            columns, rows = excel_reader.open_sheet(file.stream, filename)
+            rows = list(rows)
+        else:
+            import pandas as pd  # Heavy import, only needed for the pandas reader
+
+            # Read Excel file
+            df = pd.read_excel(file, engine='openpyxl')
+
+            # Replace NaN values with empty strings to avoid template errors
+            df = df.fillna('')
+
+            # Convert to list of dictionaries
+            rows, columns = df.to_dict('records'), list(df.columns)
+
+    EXCEL_READ_ROWS.observe(len(rows), reader=reader)
+    return rows, columns
+
+
+def validate_excel_upload():
+    """Return the uploaded workbook, or an error response tuple for a missing/invalid file"""
+    if 'file' not in request.files:
+        current_app.logger.warning("Excel upload attempt with no file")
+        return None, (jsonify({'success': False, 'error': 'No file uploaded'}), 400)
 
-        if not file.filename.endswith(('.xlsx', '.xls')):
-            app.logger.warning(f"Invalid file type uploaded: {file.filename}")
-            return jsonify({'success': False, 'error': 'Invalid file type. Please upload Excel file.'}), 400
+    file = request.files['file']
+    if file.filename == '':
+        current_app.logger.warning("Excel upload attempt with empty filename")
+        return None, (jsonify({'success': False, 'error': 'No file selected'}), 400)
 
-        app.logger.info(f"User uploaded Excel file: {file.filename}")
+    if not file.filename.lower().endswith(('.xlsx', '.xls', '.csv')):
+        current_app.logger.warning(f"Invalid file type uploaded: {file.filename}")
+        return None, (jsonify({'success': False, 'error': 'Invalid file type. Please upload an Excel or CSV file.'}), 400)
 
-        # Read Excel file
-        df = pd.read_excel(file, engine='openpyxl')
+    return file, None
 
-        # Replace NaN values with empty strings to avoid template errors
-        df = df.fillna('')
 
-        # Convert to list of dictionaries
-        data = df.to_dict('records')
+@bp.route('/api/upload-excel', methods=['POST'])
+def upload_excel():
+    try:
+        file, error_response = validate_excel_upload()
+        if error_response:
+            return error_response
+
+        current_app.logger.info(f"User uploaded Excel file: {file.filename}")
+
+        data, columns = read_excel_rows(file)
+        # Keep the prepared rows server-side too: the page can then generate by token
+        # instead of posting every row back (see sheet_rows)
+        token, _ = save_sheet(prepare_sheet_rows(as_posted_rows(data)), columns, file.filename)
 
-        app.logger.info(f"Excel file processed successfully: {len(data)} rows loaded")
+        current_app.logger.info(f"Excel file processed successfully: {len(data)} rows loaded")
 
-        return jsonify({'success': True, 'data': data, 'columns': list(df.columns)})
+        return jsonify({'success': True, 'data': data, 'columns': columns, 'token': token})
 
     except Exception as e:
-        app.logger.error(f"Error uploading Excel file: {str(e)}")
+        current_app.logger.error(f"Error uploading Excel file: {str(e)}")
         return jsonify({'success': False, 'error': str(e)}), 400
 
-@app.route('/api/generate-configs', methods=['POST'])
+def group_rows(excel_data):
+    """Group rows by template name; returns (grouped_data, skipped_count)"""
+    from collections import defaultdict
+    grouped_data = defaultdict(list)
+    skipped_count = 0
+
+    for row in excel_data:
+        template_name = row.get('template')
+        switch_name = row.get('switch_name')
+        switch_port = row.get('switch_port')
+
+        # Skip rows missing required fields
+        if not template_name or not switch_name or switch_port is None or str(switch_port).strip() == '':
+            # Lazy %-args: formatted only when debug logging is enabled (and not rate limited)
+            current_app.logger.debug("Skipping row - template=%s, switch_name=%s, switch_port=%s", template_name, switch_name, switch_port)
+            skipped_count += 1
+            continue
+
+        # Normalize template name for grouping
+        key = str(template_name).strip()
+        grouped_data[key].append(row)
+
+    return grouped_data, skipped_count
+
+
+def iter_group_configs(grouped_data, parallel=False, use_cache=True):
+    """Render every template group, yielding (config entries, success rows, error rows) per group in order.
+
+    With use_cache, groups whose template version and rows match an earlier run are
+    served from renderer.output_cache (their entries carry cached=True) and only the
+    rest are rendered; in those, templates with a port_row macro re-render only the
+    rows that changed (renderer.row_fragments).
+    """
+    # Resolve every template group with a single query
+    templates_by_name = db.get_templates_by_names(grouped_data.keys())
+
+    if profiling.current():
+        # Worker threads/processes are invisible to the profiler; keep each group's work on this thread
+        parallel = False
+
+    cached_outputs = {}
+    cache_keys = {}
+    renderable = []
+    for name, rows in grouped_data.items():
+        template_obj = templates_by_name[name]
+        if not template_obj:
+            continue
+        if use_cache:
+            cache_keys[name] = renderer.output_cache.key(template_obj, rows)
+            output = renderer.output_cache.get(cache_keys[name])
+            if output is not None:
+                cached_outputs[name] = output
+                continue
+        renderable.append((template_obj, rows))
+
+    results = renderer.render_groups(
+        renderable,
+        parallel=parallel,
+        executor=current_app.config['RENDER_EXECUTOR'],
+        workers=current_app.config['RENDER_WORKERS'],
+        timeout=current_app.config['RENDER_GROUP_TIMEOUT'],
+        incremental=use_cache
+    )
+
+    # Process each template group
+    for template_name, rows in grouped_data.items():
+        template_obj = templates_by_name[template_name]
+
+        if not template_obj:
+            # No template found - mark all rows in this group as errors
+            current_app.logger.warning(f"Template not found: {template_name} (affected {len(rows)} rows)")
+            yield [{
+                'row': row,
+                'success': False,
+                'error': f'No template found with name: {template_name}'
+            } for row in rows], 0, len(rows)
+            continue
+
+        cached = template_name in cached_outputs
+        if cached:
+            current_app.logger.info(f"Reusing cached config for template '{template_name}' ({len(rows)} rows)")
+            output, error = cached_outputs[template_name], None
+        else:
+            current_app.logger.info(f"Rendering template '{template_name}' for {len(rows)} rows")
+            with profiling.group(template_name, len(rows)):
+                output, error = next(results)
+
+        if error is not None:
+            # Template rendering failed - mark all rows in this group as errors
+            current_app.logger.error(f"Template rendering error for '{template_name}': {error}")
+            yield [{
+                'row': row,
+                'success': False,
+                'error': f'Template rendering error: {error}'
+            } for row in rows], 0, len(rows)
+            continue
+
+        if not cached:
+            renderer.record_output('generate', output, len(rows))
+            if use_cache:
+                renderer.output_cache.put(cache_keys[template_name], output)
+            current_app.logger.info(f"Successfully rendered config for template '{template_name}' ({len(rows)} rows)")
+
+        # Return one config for the entire group
+        yield [{
+            'row': {'template': template_name, 'row_count': len(rows)},
+            'success': True,
+            'config': output,
+            'template_name': template_obj['name'],
+            'row_count': len(rows),
+            'cached': cached
+        }], len(rows), 0
+
+
+def use_output_cache(params):
+    """Request option 'cache' (default OUTPUT_CACHE); false forces every group and row to re-render"""
+    value = params.get('cache', current_app.config['OUTPUT_CACHE'])
+    return str(value).lower() not in ('0', 'false', 'no')
+
+
+def sheet_rows(data):
+    """Rows to generate from: excel_data, or the stored sheet named by token (None once it has expired)"""
+    if data.get('token'):
+        sheet = get_cached_sheet(data['token'])
+        return sheet['rows'] if sheet else None
+    return data.get('excel_data', [])
+
+
+@bp.route('/api/generate-configs', methods=['POST'])
 def generate_configs():
     try:
         data = request.get_json()
-        excel_data = data.get('excel_data', [])
+        excel_data = sheet_rows(data)
 
+        if excel_data is None:
+            current_app.logger.warning("Config generation with unknown or expired sheet token")
+            return jsonify({'success': False, 'error': 'Sheet not found or expired. Please upload the file again.'}), 404
         if not excel_data:
-            app.logger.warning("Config generation attempt with no data")
+            current_app.logger.warning("Config generation attempt with no data")
             return jsonify({'success': False, 'error': 'No data provided'}), 400
 
-        app.logger.info(f"User generating configs from {len(excel_data)} rows")
-
-        # Group rows by template name
-        from collections import defaultdict
-        grouped_data = defaultdict(list)
-        skipped_count = 0
-
-        for row in excel_data:
-            template_name = row.get('template')
-            switch_name = row.get('switch_name')
-            switch_port = row.get('switch_port')
-
-            # Skip rows missing required fields
-            if not template_name or not switch_name or switch_port is None or str(switch_port).strip() == '':
-                app.logger.debug(f"Skipping row - template={template_name}, switch_name={switch_name}, switch_port={switch_port}")
-                skipped_count += 1
-                continue
+        current_app.logger.info(f"User generating configs from {len(excel_data)} rows")
 
-            # Normalize template name for grouping
-            key = str(template_name).strip()
-            grouped_data[key].append(row)
+        grouped_data, skipped_count = group_rows(excel_data)
+        current_app.logger.info(f"Grouped data: {len(grouped_data)} template(s), {skipped_count} rows skipped")
 
-        app.logger.info(f"Grouped data: {len(grouped_data)} template(s), {skipped_count} rows skipped")
+        parallel = bool(data.get('parallel', current_app.config['RENDER_PARALLEL']))
 
         configs = []
         success_row_count = 0
         error_row_count = 0
 
-        # Process each template group
-        for template_name, rows in grouped_data.items():
-            # Find template by name
-            template_obj = db.get_template_by_name(template_name)
-
-            if not template_obj:
-                # No template found - mark all rows in this group as errors
-                app.logger.warning(f"Template not found: {template_name} (affected {len(rows)} rows)")
-                error_row_count += len(rows)
-                for row in rows:
-                    configs.append({
-                        'row': row,
-                        'success': False,
-                        'error': f'No template found with name: {template_name}'
-                    })
-                continue
+        for entries, success_rows, error_rows in iter_group_configs(grouped_data, parallel, use_output_cache(data)):
+            configs.extend(entries)
+            success_row_count += success_rows
+            error_row_count += error_rows
 
-            app.logger.info(f"Rendering template '{template_name}' for {len(rows)} rows")
-            template_str = template_obj['template_content']
+        cached_group_count = sum(1 for entry in configs if entry.get('cached'))
+        current_app.logger.info(f"Config generation complete: {success_row_count} success, {error_row_count} errors, {skipped_count} skipped, {cached_group_count} group(s) from cache")
 
-            # Render template with grouped data
-            try:
-                template = Template(template_str)
-                # Pass all rows as 'ports' and 'switches' list + individual fields from first row
-                render_context = rows[0].copy() if rows else {}
-                render_context['ports'] = rows
-                render_context['switches'] = rows  # Keep for backward compatibility
-
-                output = template.render(**render_context)
-
-                # Return one config for the entire group
-                success_row_count += len(rows)
-                app.logger.info(f"Successfully rendered config for template '{template_name}' ({len(rows)} rows)")
-                configs.append({
-                    'row': {'template': template_name, 'row_count': len(rows)},
-                    'success': True,
-                    'config': output,
-                    'template_name': template_obj['name'],
-                    'row_count': len(rows)
-                })
-            except Exception as e:
-                # Template rendering failed - mark all rows in this group as errors
-                app.logger.error(f"Template rendering error for '{template_name}': {str(e)}")
-                error_row_count += len(rows)
-                for row in rows:
-                    configs.append({
-                        'row': row,
-                        'success': False,
-                        'error': f'Template rendering error: {str(e)}'
-                    })
-
-        app.logger.info(f"Config generation complete: {success_row_count} success, {error_row_count} errors, {skipped_count} skipped")
+        return jsonify({
+            'success': True,
+            'configs': configs,
+            'success_row_count': success_row_count,
+            'error_row_count': error_row_count,
+            'skipped_row_count': skipped_count,
+            'cached_group_count': cached_group_count
+        })
+
+    except Exception as e:
+        current_app.logger.error(f"Error in config generation: {str(e)}")
+        return jsonify({'success': False, 'error': str(e)}), 400
+
+@bp.route('/api/generate-configs/stream', methods=['POST'])
+def generate_configs_stream():
+    """Streaming variant of generate_configs: one NDJSON record per template group as soon as it is rendered.
+
+    Records: {"type": "start"}, one {"type": "group"} per template group, then a final
+    {"type": "summary"} with row counts (or {"type": "error"} if generation failed).
+    Rows come from excel_data, or from an uploaded sheet by its token (404 once expired).
+    """
+    data = request.get_json(silent=True) or {}
+    excel_data = sheet_rows(data)
+
+    if excel_data is None:
+        current_app.logger.warning("Config generation with unknown or expired sheet token")
+        return jsonify({'success': False, 'error': 'Sheet not found or expired. Please upload the file again.'}), 404
+    if not excel_data:
+        current_app.logger.warning("Config generation attempt with no data")
+        return jsonify({'success': False, 'error': 'No data provided'}), 400
+
+    current_app.logger.info(f"User generating configs (streaming) from {len(excel_data)} rows")
+
+    grouped_data, skipped_count = group_rows(excel_data)
+    current_app.logger.info(f"Grouped data: {len(grouped_data)} template(s), {skipped_count} rows skipped")
+
+    parallel = bool(data.get('parallel', current_app.config['RENDER_PARALLEL']))
+    use_cache = use_output_cache(data)
+
+    def generate():
+        success_row_count = 0
+        error_row_count = 0
+        cached_group_count = 0
+        yield json.dumps({'type': 'start', 'group_count': len(grouped_data), 'skipped_row_count': skipped_count}) + '\n'
+
+        try:
+            for entries, success_rows, error_rows in iter_group_configs(grouped_data, parallel, use_cache):
+                success_row_count += success_rows
+                error_row_count += error_rows
+                cached_group_count += sum(1 for entry in entries if entry.get('cached'))
+                yield json.dumps({'type': 'group', 'configs': entries}) + '\n'
+        except Exception as e:
+            current_app.logger.error(f"Error in config generation: {str(e)}")
+            yield json.dumps({'type': 'error', 'error': str(e)}) + '\n'
+            return
+
+        current_app.logger.info(f"Config generation complete: {success_row_count} success, {error_row_count} errors, {skipped_count} skipped")
+        yield json.dumps({
+            'type': 'summary',
+            'success': True,
+            'success_row_count': success_row_count,
+            'error_row_count': error_row_count,
+            'skipped_row_count': skipped_count,
+            'cached_group_count': cached_group_count
+        }) + '\n'
+
+    # Disable proxy buffering so each record reaches the browser immediately
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson',
+                    headers={'X-Accel-Buffering': 'no', 'Cache-Control': 'no-cache'})
+
+def _port_number(value):
+    """Sort key for port strings like "Ethernet1/12", "1/12" or "12" (slot * 1000 + port)"""
+    match = re.search(r'(\d+)/(\d+)|(\d+)', str(value)) if value else None
+    if not match:
+        return 0
+    if match.group(1) and match.group(2):
+        return int(match.group(1)) * 1000 + int(match.group(2))
+    return int(match.group(3))
+
+
+def _js_number(text):
+    """JSON float as the browser posts it back: JavaScript writes integral numbers without '.0'"""
+    value = float(text)
+    return int(value) if value.is_integer() and abs(value) < 1e21 else value
+
+
+def as_posted_rows(rows):
+    """rows as the Config Generator page would post them back after receiving them as JSON"""
+    return json.loads(current_app.json.dumps(rows), parse_float=_js_number)
+
+
+def prepare_sheet_rows(rows):
+    """Apply the Config Generator tab's preprocessing server-side.
+
+    Cleans switch_port values ("Port-07" -> "7") and sorts rows by switch name,
+    then port, exactly as static/app.js does before posting rows for generation.
+    """
+    for row in rows:
+        port = row.get('switch_port')
+        if port:
+            if isinstance(port, float) and port.is_integer():
+                port = int(port)
+            port = re.sub(r'^Port-', '', str(port), flags=re.IGNORECASE)
+            row['switch_port'] = re.sub(r'^0+(\d)', r'\1', port)
+
+    return sorted(rows, key=lambda row: (
+        str(row.get('switch_name') or row.get('hostname') or '').lower(),
+        _port_number(row.get('eth_port') or row.get('port') or row.get('interface'))
+    ))
+
+
+def _safe_filename(name):
+    return re.sub(r'[^\w.-]+', '_', str(name)).strip('_') or 'config'
+
+
+def build_configs_zip(grouped_data, results):
+    """Zip one config file per rendered group (named after its switch when the group has one) plus errors.txt"""
+    buffer = BytesIO()
+    used_names = set()
+    errors = []
+
+    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as archive:
+        for (template_name, rows), entries in zip(grouped_data.items(), results):
+            for entry in entries:
+                if not entry['success']:
+                    row = entry['row']
+                    errors.append(f"{template_name} / {row.get('switch_name', '')} / {row.get('switch_port', '')}: {entry['error']}")
+                    continue
+
+                switch_names = {str(row.get('switch_name')) for row in rows}
+                base_name = _safe_filename(switch_names.pop() if len(switch_names) == 1 else template_name)
+                file_name = f'{base_name}.cfg'
+                suffix = 2
+                while file_name in used_names:
+                    file_name = f'{base_name}_{suffix}.cfg'
+                    suffix += 1
+                used_names.add(file_name)
+                archive.writestr(file_name, entry['config'])
+
+        if errors:
+            archive.writestr('errors.txt', '\n'.join(errors) + '\n')
+
+    buffer.seek(0)
+    return buffer
+
+
+# Parsed spreadsheets kept server-side so configs can be regenerated without re-uploading:
+# sheet_store is shared by all workers, sheet_cache keeps recently used rows in this one
+sheet_cache = renderer.LRUCache(
+    max_entries=int(os.environ.get('SHEET_CACHE_SIZE', 20)),
+    max_bytes=int(os.environ.get('SHEET_CACHE_MAX_BYTES', 256 * 1024 * 1024))
+)
+
+
+def save_sheet(rows, columns, filename):
+    """Store a parsed sheet for reuse by token; returns (token, sheet).
+
+    Rows go through JSON once here, so this worker renders exactly the rows another
+    worker later reads back from sheet_store. Entries are charged their JSON size,
+    not the (compressed) upload's.
+    """
+    rows_json = json.dumps(rows, default=str)
+    token = uuid.uuid4().hex
+    sheet = {
+        'rows': json.loads(rows_json),
+        'columns': columns,
+        'filename': filename,
+        'expires_at': time.time() + current_app.config['SHEET_CACHE_TTL']
+    }
+    sheet_store.put(token, sheet, rows_json)
+    sheet_cache.put(token, sheet, size=len(rows_json))
+    return token, sheet
+
+
+def get_cached_sheet(token):
+    if not token:
+        return None
+    sheet = sheet_cache.get(token)
+    if sheet is None:
+        # Uploaded through another worker (or evicted here)
+        sheet = sheet_store.get(token)
+        if sheet is not None:
+            sheet_cache.put(token, sheet, size=sheet['size'])
+    if sheet and sheet['expires_at'] < time.time():
+        sheet_cache.invalidate(lambda key: key == token)
+        return None
+    return sheet
+
+
+@bp.route('/api/excel-configs', methods=['POST'])
+def excel_configs():
+    """Upload a workbook (or reference a previously uploaded one by token) and render configs server-side.
+
+    Parameters (form fields or JSON body): token - reuse a cached sheet instead of uploading,
+    format - 'json' (default) or 'zip' for one config file per switch.
+    """
+    try:
+        params = request.get_json(silent=True) or request.values
+
+        if 'file' in request.files:
+            file, error_response = validate_excel_upload()
+            if error_response:
+                return error_response
+
+            current_app.logger.info(f"User uploaded Excel file for server-side generation: {file.filename}")
+            rows, columns = read_excel_rows(file)
+            token, sheet = save_sheet(prepare_sheet_rows(rows), columns, file.filename)
+        else:
+            token = params.get('token')
+            sheet = get_cached_sheet(token)
+            if not sheet:
+                current_app.logger.warning("Server-side generation with unknown or expired sheet token")
+                return jsonify({'success': False, 'error': 'Sheet not found or expired. Please upload the file again.'}), 404
+            current_app.logger.info(f"User regenerating configs from cached sheet: {sheet['filename']}")
+
+        grouped_data, skipped_count = group_rows(sheet['rows'])
+        current_app.logger.info(f"Grouped data: {len(grouped_data)} template(s), {skipped_count} rows skipped")
+
+        parallel = str(params.get('parallel', current_app.config['RENDER_PARALLEL'])).lower() in ('1', 'true')
+        results = [entries for entries, _, _ in iter_group_configs(grouped_data, parallel, use_output_cache(params))]
+        configs = [entry for entries in results for entry in entries]
+        success_row_count = sum(entry['row_count'] for entry in configs if entry['success'])
+        error_row_count = sum(1 for entry in configs if not entry['success'])
+
+        current_app.logger.info(f"Config generation complete: {success_row_count} success, {error_row_count} errors, {skipped_count} skipped")
+
+        if params.get('format') == 'zip':
+            response = send_file(
+                build_configs_zip(grouped_data, results),
+                mimetype='application/zip',
+                as_attachment=True,
+                download_name=f'configs_{datetime.now().strftime("%Y-%m-%d")}.zip'
+            )
+            response.headers['X-Sheet-Token'] = token
+            return response
 
         return jsonify({
             'success': True,
+            'token': token,
+            'columns': sheet['columns'],
+            'row_count': len(sheet['rows']),
             'configs': configs,
             'success_row_count': success_row_count,
             'error_row_count': error_row_count,
-            'skipped_row_count': skipped_count
+            'skipped_row_count': skipped_count,
+            'cached_group_count': sum(1 for entry in configs if entry.get('cached'))
         })
 
     except Exception as e:
-        app.logger.error(f"Error in config generation: {str(e)}")
+        current_app.logger.error(f"Error in server-side config generation: {str(e)}")
         return jsonify({'success': False, 'error': str(e)}), 400
 
+# ========== Background Generation Jobs ==========
+
+def run_generation_job(job_id, params):
+    """JobRunner handler: render a job group by group, storing each group's configs as it finishes"""
+    grouped_data, skipped_count = group_rows(params['excel_data'])
+    job_store.set_totals(job_id, len(grouped_data), sum(len(rows) for rows in grouped_data.values()), skipped_count)
+    current_app.logger.info(f"Job {job_id}: rendering {len(grouped_data)} template group(s), {skipped_count} rows skipped")
+
+    for entries, success_rows, error_rows in iter_group_configs(grouped_data, params.get('parallel', False),
+                                                                params.get('cache', True)):
+        if not job_store.add_result(job_id, entries, success_rows, error_rows):
+            current_app.logger.info(f"Job {job_id} cancelled")
+            raise jobs.JobCancelled()
+
+    current_app.logger.info(f"Job {job_id} complete")
+
+@bp.before_app_request
+def ensure_job_runner():
+    # Start this process's runner threads (once per process; after a gunicorn fork too)
+    job_runner.ensure_started()
+
+@bp.route('/api/jobs', methods=['POST'])
+def submit_job():
+    """Queue a generation run and return its id at once (202).
+
+    Body: excel_data (rows, as for /api/generate-configs) or token (a sheet uploaded
+    to /api/excel-configs), plus optional parallel and cache.
+    """
+    try:
+        data = request.get_json(silent=True) or {}
+        excel_data = data.get('excel_data')
+        if not excel_data and data.get('token'):
+            sheet = get_cached_sheet(data['token'])
+            if not sheet:
+                return jsonify({'success': False, 'error': 'Sheet not found or expired. Please upload the file again.'}), 404
+            excel_data = sheet['rows']
+
+        if not excel_data:
+            current_app.logger.warning("Job submitted with no data")
+            return jsonify({'success': False, 'error': 'No data provided'}), 400
+
+        parallel = bool(data.get('parallel', current_app.config['RENDER_PARALLEL']))
+        job_id = job_store.submit('generate', {'excel_data': excel_data, 'parallel': parallel,
+                                               'cache': use_output_cache(data)})
+        job_runner.notify()
+        current_app.logger.info(f"User queued generation job {job_id} for {len(excel_data)} rows")
+        return jsonify({'success': True, 'job_id': job_id, 'status': 'queued'}), 202
+
+    except Exception as e:
+        current_app.logger.error(f"Error submitting job: {str(e)}")
+        return jsonify({'success': False, 'error': str(e)}), 400
+
+@bp.route('/api/jobs', methods=['GET'])
+def list_jobs():
+    limit = min(request.args.get('limit', 50, type=int), 500)
+    return jsonify({'success': True, 'jobs': job_store.list(limit)})
+
+@bp.route('/api/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    """Status and progress: groups_done/group_count and rows_rendered/row_count"""
+    job = job_store.get(job_id)
+    if not job:
+        return jsonify({'success': False, 'error': 'Job not found'}), 404
+    return jsonify({'success': True, 'job': job})
+
+@bp.route('/api/jobs/<job_id>/results', methods=['GET'])
+def get_job_results(job_id):
+    """Configs of the groups finished so far; pass the returned cursor as ?since= to get only newer ones"""
+    job = job_store.get(job_id)
+    if not job:
+        return jsonify({'success': False, 'error': 'Job not found'}), 404
+    since = request.args.get('since', 0, type=int)
+    configs, cursor = job_store.results(job_id, since)
+    return jsonify({
+        'success': True,
+        'job': job,
+        'finished': job['status'] in jobs.FINISHED,
+        'configs': configs,
+        'cursor': cursor
+    })
+
+@bp.route('/api/jobs/<job_id>/cancel', methods=['POST'])
+def cancel_job(job_id):
+    """Queued jobs are cancelled at once; running ones stop after the group in progress"""
+    status = job_store.cancel(job_id)
+    if status is None:
+        return jsonify({'success': False, 'error': 'Job not found'}), 404
+    current_app.logger.info(f"User cancelled job {job_id} ({status})")
+    return jsonify({'success': True, 'status': status})
+
+@bp.route('/api/jobs/<job_id>', methods=['DELETE'])
+def delete_job(job_id):
+    """Drop a job and its stored results (a running job also stops after its current group)"""
+    if not job_store.delete(job_id):
+        return jsonify({'success': False, 'error': 'Job not found'}), 404
+    current_app.logger.info(f"User deleted job {job_id}")
+    return jsonify({'success': True})
+
+@bp.route('/api/health', methods=['GET'])
+def health():
+    status = db.health_check()
+    return jsonify(status), (200 if status['ok'] else 503)
+
+@bp.route('/api/cache/stats', methods=['GET'])
+def get_cache_stats():
+    return jsonify({
+        'compiled_templates': renderer.compiled_templates.stats(),
+        'source_templates': renderer.source_templates.stats(),
+        'rendered_outputs': renderer.output_cache.stats(),
+        'sheet_store': sheet_store.stats(),
+        'row_fragments': renderer.row_fragments.stats(),
+        'compiled_code_store': renderer.template_code_store.stats()
+    })
+
+def _metrics_snapshot():
+    """Point-in-time stats gathered on each /metrics scrape"""
+    cache_stats = {
+        'compiled': renderer.compiled_templates.stats(),
+        'source': renderer.source_templates.stats(),
+        'output': renderer.output_cache.stats(),
+        'fragment': renderer.row_fragments.stats(),
+        'sheet': sheet_cache.stats()
+    }
+    for counter in ('hits', 'misses', 'evictions'):
+        yield (f'template_cache_{counter}_total', 'counter', f'Cache {counter} per cache',
+               [({'cache': name}, stats[counter]) for name, stats in cache_stats.items()])
+    yield ('template_cache_entries', 'gauge', 'Entries currently held per cache',
+           [({'cache': name}, stats['size']) for name, stats in cache_stats.items()])
+    yield ('template_cache_bytes', 'gauge', 'Bytes held per cache',
+           [({'cache': name}, stats['total_bytes']) for name, stats in cache_stats.items()])
+
+    pool_stats = db.pool.stats()
+    yield ('db_pool_idle_connections', 'gauge', 'Idle pooled SQLite connections', [({}, pool_stats['idle'])])
+    yield ('db_pool_connections_created_total', 'counter', 'SQLite connections opened by the pool',
+           [({}, pool_stats['created'])])
+
+    handler_stats = log_listener.stats()
+    yield ('log_handler_records_total', 'counter', 'Records handled per log handler',
+           [({'handler': name}, s['count']) for name, s in handler_stats.items()])
+    yield ('log_handler_seconds_total', 'counter', 'Time spent per log handler',
+           [({'handler': name}, s['total_ms'] / 1000) for name, s in handler_stats.items()])
+    yield ('log_queue_depth', 'gauge', 'Records waiting for the log listener', [({}, log_queue.qsize())])
+    yield ('log_rate_limited_total', 'counter', 'Debug records dropped by the rate limit',
+           [({}, log_rate_limit.suppressed_total)])
+    yield ('log_stream_clients', 'gauge', 'Connected live log tail clients',
+           [({}, log_broadcaster.subscriber_count())])
+
+    yield ('jobs', 'gauge', 'Background generation jobs per status',
+           [({'status': status}, count) for status, count in job_store.counts().items()])
+
+metrics.REGISTRY.register_collector(_metrics_snapshot)
+
+@bp.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    """Latency/size histograms plus cache, pool and logging stats in Prometheus text format"""
+    return Response(metrics.REGISTRY.exposition(), mimetype='text/plain; version=0.0.4')
+
 # ========== Metadata Management API Endpoints ==========
 
-@app.route('/api/host-types', methods=['POST'])
+@bp.route('/api/host-types', methods=['POST'])
 def add_host_type():
     try:
         data = request.get_json()
@@ -436,7 +1153,7 @@ def add_host_type():
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 400
 
-@app.route('/api/host-types/delete', methods=['POST'])
+@bp.route('/api/host-types/delete', methods=['POST'])
 def remove_host_type():
     try:
         data = request.get_json()
@@ -445,7 +1162,7 @@ def remove_host_type():
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 400
 
-@app.route('/api/port-types', methods=['POST'])
+@bp.route('/api/port-types', methods=['POST'])
 def add_port_type():
     try:
         data = request.get_json()
@@ -454,7 +1171,7 @@ def add_port_type():
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 400
 
-@app.route('/api/port-types/delete', methods=['POST'])
+@bp.route('/api/port-types/delete', methods=['POST'])
 def remove_port_type():
     try:
         data = request.get_json()
@@ -463,7 +1180,7 @@ def remove_port_type():
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 400
 
-@app.route('/api/switch-os-types', methods=['POST'])
+@bp.route('/api/switch-os-types', methods=['POST'])
 def add_switch_os_type():
     try:
         data = request.get_json()
@@ -472,7 +1189,7 @@ def add_switch_os_type():
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 400
 
-@app.route('/api/switch-os-types/delete', methods=['POST'])
+@bp.route('/api/switch-os-types/delete', methods=['POST'])
 def remove_switch_os_type():
     try:
         data = request.get_json()
@@ -481,12 +1198,14 @@ def remove_switch_os_type():
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 400
 
-@app.route('/api/export-database', methods=['GET'])
+@bp.route('/api/export-database', methods=['GET'])
 def export_database():
     try:
-        app.logger.info("User exporting database")
+        current_app.logger.info("User exporting database")
         db_path = 'data/templates.db'
-        app.logger.info(f"Database exported successfully: {db_path}")
+        # Make sure committed pages still sitting in the WAL are part of the exported file
+        db.checkpoint()
+        current_app.logger.info(f"Database exported successfully: {db_path}")
         return send_file(
             db_path,
             mimetype='application/x-sqlite3',
@@ -494,126 +1213,300 @@ def export_database():
             download_name=f'templates_backup_{datetime.now().strftime("%Y-%m-%d")}.db'
         )
     except Exception as e:
-        app.logger.error(f"Error exporting database: {str(e)}")
+        current_app.logger.error(f"Error exporting database: {str(e)}")
         return jsonify({'error': str(e)}), 400
 
-@app.route('/api/import-database', methods=['POST'])
+@bp.route('/api/import-database', methods=['POST'])
 def import_database():
     try:
         if 'file' not in request.files:
-            app.logger.warning("Database import attempt with no file")
+            current_app.logger.warning("Database import attempt with no file")
             return jsonify({'success': False, 'error': 'No file uploaded'}), 400
 
         file = request.files['file']
         if file.filename == '':
-            app.logger.warning("Database import attempt with empty filename")
+            current_app.logger.warning("Database import attempt with empty filename")
             return jsonify({'success': False, 'error': 'No file selected'}), 400
 
         if not file.filename.endswith('.db'):
-            app.logger.warning(f"Invalid database file uploaded: {file.filename}")
+            current_app.logger.warning(f"Invalid database file uploaded: {file.filename}")
             return jsonify({'success': False, 'error': 'Invalid file type. Please upload .db file.'}), 400
 
-        app.logger.warning(f"User restoring database from file: {file.filename}")
-
-        # Save the uploaded file to replace the current database
-        db_path = 'data/templates.db'
+        current_app.logger.warning(f"User restoring database from file: {file.filename}")
 
         # Create backup of current database before replacing
         backup_path = f'data/templates_backup_{datetime.now().strftime("%Y%m%d_%H%M%S")}.db'
-        if os.path.exists(db_path):
-            import shutil
-            shutil.copy2(db_path, backup_path)
-            app.logger.info(f"Current database backed up to: {backup_path}")
+        db.copy_to(backup_path)
+        current_app.logger.info(f"Current database backed up to: {backup_path}")
 
-        # Save the new database file
-        file.save(db_path)
-
-        # Reinitialize the database connection
-        global db
-        db = Database()
-
-        app.logger.info("Database restored successfully")
+        # Restore in place: the file and every worker's pooled connections stay valid,
+        # and they read the imported contents on their next query
+        fd, upload_path = tempfile.mkstemp(dir='data', suffix='.db')
+        os.close(fd)
+        try:
+            file.save(upload_path)
+            db.restore(upload_path)
+        finally:
+            os.remove(upload_path)
+
+        # Caches elsewhere are keyed by template content, so other workers cannot serve stale
+        # configs; this worker simply starts afresh
+        renderer.compiled_templates.clear()
+        renderer.output_cache.clear()
+        renderer.row_fragments.clear()
+
+        current_app.logger.info("Database restored successfully")
         return jsonify({'success': True})
 
     except Exception as e:
-        app.logger.error(f"Error restoring database: {str(e)}")
+        current_app.logger.error(f"Error restoring database: {str(e)}")
         return jsonify({'success': False, 'error': str(e)}), 400
 
 # ========== Logging API Endpoints ==========
 
-@app.route('/api/logs', methods=['GET'])
+@bp.route('/api/logs', methods=['GET'])
 def get_logs():
+    """Most recent log entries, read backwards from logs/app.log and its rotated backups.
+
+    Query args: level (default 'all'), limit (default 1000), since/until
+    ('YYYY-MM-DD HH:MM[:SS]' or ISO), source=buffer to serve the in-memory buffer instead.
+    """
     try:
         level_filter = request.args.get('level', 'all')
         limit = int(request.args.get('limit', 1000))  # Default to last 1000 logs
+        since = request.args.get('since')
+        until = request.args.get('until')
 
-        # Read logs from file
-        logs = []
-        log_file = 'logs/app.log'
-
-        if os.path.exists(log_file):
-            import re
-            with open(log_file, 'r', encoding='utf-8', errors='ignore') as f:
-                lines = f.readlines()
-
-            # Parse log lines
-            # Format: 2026-01-01 20:51:09,668 INFO: User uploaded Excel file: template_JINJA-XC-DATA.xlsx [in /app/app.py:295]
-            log_pattern = re.compile(r'(\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}),\d+ (\w+): (.+) \[in (.+?):(\d+)\]')
-
-            for line in lines:
-                match = log_pattern.match(line)
-                if match:
-                    timestamp, level, message, filepath, line_no = match.groups()
-                    module = os.path.basename(filepath).replace('.py', '')
-
-                    # Filter by level if specified
-                    if level_filter == 'all' or level == level_filter:
-                        logs.append({
-                            'timestamp': timestamp.replace(',', '.'),
-                            'level': level,
-                            'message': message,
-                            'module': module,
-                            'line': int(line_no)
-                        })
-
-        # Return the most recent logs (up to limit)
-        logs = logs[-limit:] if len(logs) > limit else logs
+        if request.args.get('source') == 'buffer':
+            logs = log_reader.filter_entries(list(log_buffer), limit, level_filter, since, until)
+        else:
+            logs = log_reader.tail_logs('logs/app.log', limit, level_filter, since, until)
 
         return jsonify({'success': True, 'logs': logs})
     except Exception as e:
-        app.logger.error(f'Error retrieving logs: {str(e)}')
+        current_app.logger.error(f'Error retrieving logs: {str(e)}')
+        return jsonify({'success': False, 'error': str(e)}), 400
+
+@bp.route('/api/logs/query', methods=['GET'])
+def query_logs():
+    """Structured log query with cursor pagination.
+
+    Query args: level, module, limit (default 200), since_id (poll for entries newer
+    than a cursor) or before_id (page back through older entries).
+    """
+    try:
+        since_id = request.args.get('since_id', type=int)
+        before_id = request.args.get('before_id', type=int)
+        limit = min(request.args.get('limit', 200, type=int), 5000)
+
+        logs, has_more = log_store.query(
+            level=request.args.get('level'),
+            module=request.args.get('module'),
+            since_id=since_id,
+            before_id=before_id,
+            limit=limit
+        )
+
+        # Cursor for the next poll: the newest id seen so far
+        next_since_id = logs[-1]['id'] if logs else (since_id or 0)
+        return jsonify({
+            'success': True,
+            'logs': logs,
+            'has_more': has_more,
+            'next_since_id': next_since_id,
+            'next_before_id': logs[0]['id'] if logs else None
+        })
+    except Exception as e:
+        current_app.logger.error(f'Error querying logs: {str(e)}')
         return jsonify({'success': False, 'error': str(e)}), 400
 
-@app.route('/api/logs/clear', methods=['POST'])
+@bp.route('/api/logs/stream', methods=['GET'])
+def stream_logs():
+    """Server-Sent Events tail of new log records.
+
+    Each client has a bounded queue; if it falls behind, the oldest entries are dropped
+    and a 'dropped' event reports how many were lost. With LOG_STREAM_SOURCE=store
+    (multi-worker deployments, see gunicorn.conf.py) records are read from the shared
+    SQLite log store instead, so every worker's INFO+ records reach every client.
+    """
+    level_filter = request.args.get('level', 'all')
+    # Set by EventSource when it reconnects: the id of the last entry it received
+    last_event_id = request.headers.get('Last-Event-ID', type=int)
+    subscriber = log_broadcaster.subscribe(max_queue=int(os.environ.get('LOG_STREAM_QUEUE_SIZE', 200)))
+    if subscriber is None:
+        return jsonify({'success': False, 'error': 'Too many live log clients'}), 503
+
+    # Each stream occupies a server thread: end it after LOG_STREAM_MAX_SECONDS and let the
+    # browser reconnect, so an idle Logs tab does not hold the thread for good
+    until = time.monotonic() + current_app.config['LOG_STREAM_MAX_SECONDS']
+    if current_app.config['LOG_STREAM_SOURCE'] == 'store':
+        events = stream_from_store(subscriber, level_filter, until, last_event_id)
+    else:
+        events = stream_from_buffer(subscriber, level_filter, until)
+
+    def generate():
+        try:
+            yield 'retry: 3000\n\n'
+            yield from events
+        finally:
+            log_broadcaster.unsubscribe(subscriber)
+
+    return Response(generate(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+def sse_entry(entry):
+    """One SSE message; the id lets a reconnecting EventSource resume after it (Last-Event-ID)"""
+    event_id = f"id: {entry['id']}\n" if entry.get('id') is not None else ''
+    return f'{event_id}data: {json.dumps(entry)}\n\n'
+
+def stream_from_buffer(subscriber, level_filter, until):
+    """SSE events for records handled by this process, until the monotonic time `until`"""
+    while time.monotonic() < until:
+        entries, dropped = subscriber.drain(timeout=min(15, max(until - time.monotonic(), 0)))
+        if dropped:
+            yield f"event: dropped\ndata: {json.dumps({'dropped': dropped})}\n\n"
+        for entry in entries:
+            if level_filter == 'all' or entry['level'] == level_filter:
+                yield sse_entry(entry)
+        if not entries and not dropped:
+            # Keeps proxies from closing the connection and detects gone clients
+            yield ': keepalive\n\n'
+
+def stream_from_store(subscriber, level_filter, until, since_id=None):
+    """SSE events polled from the shared log store; local records only wake the poll early.
+
+    Starts after since_id (a reconnect's Last-Event-ID), otherwise at the newest entry.
+    """
+    if since_id is None:
+        newest, _ = log_store.query(limit=1)
+        since_id = newest[-1]['id'] if newest else 0
+    cursor = since_id
+    idle_seconds = 0
+    while time.monotonic() < until:
+        subscriber.drain(timeout=1)
+        entries, _ = log_store.query(level=level_filter, since_id=cursor, limit=500)
+        for entry in entries:
+            yield sse_entry(entry)
+        if entries:
+            cursor = entries[-1]['id']
+            idle_seconds = 0
+        else:
+            idle_seconds += 1
+            if idle_seconds >= 15:
+                yield ': keepalive\n\n'
+                idle_seconds = 0
+
+@bp.route('/api/logs/metrics', methods=['GET'])
+def get_logging_metrics():
+    """Per-handler latency measured on the logging listener thread, queue depth and rate-limit drops"""
+    return jsonify({
+        'handlers': log_listener.stats(),
+        'queue_depth': log_queue.qsize(),
+        'rate_limited': log_rate_limit.suppressed_total,
+        'stream_clients': log_broadcaster.subscriber_count()
+    })
+
+@bp.route('/api/logs/clear', methods=['POST'])
 def clear_logs():
     try:
-        # Clear the log file
+        # Clear the log file and drop rotated backups (they are read by /api/logs too)
         log_file = 'logs/app.log'
         if os.path.exists(log_file):
             with open(log_file, 'w') as f:
                 f.write('')
+        for backup in log_reader.log_files(log_file)[1:]:
+            os.remove(backup)
 
         log_buffer.clear()
-        app.logger.info('Logs cleared by user')
+        log_store.clear()
+        current_app.logger.info('Logs cleared by user')
         return jsonify({'success': True})
     except Exception as e:
-        app.logger.error(f'Error clearing logs: {str(e)}')
+        current_app.logger.error(f'Error clearing logs: {str(e)}')
         return jsonify({'success': False, 'error': str(e)}), 400
 
+# ========== Profiling ==========
+
+def profile_token_valid():
+    token = current_app.config['PROFILE_TOKEN']
+    return bool(token) and hmac.compare_digest(request.headers.get('X-Profile-Token', ''), token)
+
+@bp.route('/api/profiles', methods=['GET'])
+def list_profiles():
+    if not profile_token_valid():
+        return jsonify({'success': False, 'error': 'Profiling is not enabled or the token is invalid'}), 403
+    return jsonify({'success': True, 'profiles': profile_store.list()})
+
+@bp.route('/api/profiles/<profile_id>', methods=['GET'])
+def get_profile(profile_id):
+    """One stored profile: JSON breakdown (default), format=text for the pstats listing, format=pstats to download"""
+    if not profile_token_valid():
+        return jsonify({'success': False, 'error': 'Profiling is not enabled or the token is invalid'}), 403
+
+    profile = profile_store.get(profile_id)
+    if profile is None:
+        return jsonify({'success': False, 'error': 'Profile not found'}), 404
+
+    output_format = request.args.get('format', 'json')
+    limit = request.args.get('limit', profiling.TOP_FUNCTIONS, type=int)
+    sort = request.args.get('sort', 'cumulative')
+    if sort not in ('cumulative', 'tottime', 'calls'):
+        return jsonify({'success': False, 'error': f'Invalid sort: {sort}'}), 400
+
+    if output_format == 'text':
+        return Response(profile.report(limit, sort), mimetype='text/plain')
+    if output_format == 'pstats':
+        return send_file(BytesIO(profile.dump()), mimetype='application/octet-stream',
+                         as_attachment=True, download_name=f'profile_{profile_id}.pstats')
+    return jsonify({'success': True, 'profile': profile.to_dict(limit, sort)})
+
+@bp.before_app_request
+def start_profile():
+    """Profile the view of an opted-in request; the body of a streamed response is not covered"""
+    if request.args.get('profile') != '1' and request.headers.get('X-Profile') != '1':
+        return None
+    if not profile_token_valid():
+        current_app.logger.warning(f'Rejected profiling request for {request.path}')
+        return jsonify({'success': False, 'error': 'Profiling is not enabled or the token is invalid'}), 403
+    g.profile = profiling.RequestProfile(request.method, request.path)
+    g.profile.start()
+
+@bp.after_app_request
+def finish_profile(response):
+    profile = g.pop('profile', None)
+    if profile is not None:
+        profile.stop(response.status_code)
+        profile_store.add(profile)
+        response.headers['X-Profile-Id'] = profile.id
+        current_app.logger.info(f'Profiled {profile.method} {profile.path}: {profile.total_seconds:.3f}s (profile {profile.id})')
+    return response
+
+@bp.teardown_app_request
+def discard_profile(exc):
+    # The view raised before after_request ran; stop the profiler so the thread is not left traced
+    profile = g.pop('profile', None)
+    if profile is not None:
+        profile.stop(500)
+        profile_store.add(profile)
+
 # Add logging to important operations (reduced verbosity)
-@app.before_request
+@bp.before_app_request
 def log_request():
     # Skip logging for static files and log endpoint itself to avoid clutter
     if request.endpoint and not request.endpoint.startswith('static') and not request.path.startswith('/api/logs'):
-        app.logger.debug(f'{request.method} {request.path}')
+        current_app.logger.debug(f'{request.method} {request.path}')
 
-@app.after_request
+@bp.after_app_request
 def log_response(response):
     # Only log errors or skip log endpoint
     if request.endpoint and not request.endpoint.startswith('static') and not request.path.startswith('/api/logs'):
         if response.status_code >= 400:
-            app.logger.error(f'{request.method} {request.path} - {response.status_code}')
+            current_app.logger.error(f'{request.method} {request.path} - {response.status_code}')
     return response
 
+# The application is built by wsgi.py or below, never on import: render processes started
+# from `python app.py` re-import this file as __mp_main__ and must not build a second app
 if __name__ == '__main__':
+    # Development server; production uses gunicorn (gunicorn -c gunicorn.conf.py wsgi:app)
+    app = create_app()
     app.run(host='0.0.0.0', port=80, debug=False)
@@ -0,0 +1,26 @@
+"""
+Whole-file writes that readers in other processes never see half done.
+
+The compiled template store, the rendered output cache and saved profiles are
+shared by every gunicorn worker through plain files, so each one is written to
+a temporary file in the same directory and renamed over the target.
+"""
+import os
+import tempfile
+
+
+def atomic_write(path, data):
+    """Write bytes to path, creating its directory; raises OSError on failure"""
+    directory = os.path.dirname(path) or '.'
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        raise
@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""
+Compare the pandas ingestion path (read_excel + fillna + to_dict) against the
+streaming openpyxl/CSV reader in excel_reader.py on generated cabling sheets.
+
+Usage: python benchmarks/bench_excel_ingest.py [row counts...]   (default: 10000 100000)
+"""
+import csv
+import io
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import excel_reader
+
+COLUMNS = ['template', 'switch_name', 'switch_port', 'eth_port', 'host_name', 'host_port', 'vlan', 'description']
+
+
+def generate_rows(count):
+    for i in range(count):
+        yield [
+            f'LEAF-{i % 40:02d}',
+            f'LEAF{i // 48:04d}',
+            f'Port-{i % 48 + 1:02d}',
+            f'Ethernet1/{i % 48 + 1}',
+            f'host{i:06d}',
+            f'eth{i % 4}',
+            1000 + i % 200,
+            '' if i % 7 == 0 else f'cable run {i}'   # blank cells to exercise fillna/normalization
+        ]
+
+
+def build_xlsx(count):
+    from openpyxl import Workbook
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet()
+    sheet.append(COLUMNS)
+    for row in generate_rows(count):
+        sheet.append([value if value != '' else None for value in row])
+    buffer = io.BytesIO()
+    workbook.save(buffer)
+    return buffer.getvalue()
+
+
+def build_csv(count):
+    text = io.StringIO()
+    writer = csv.writer(text)
+    writer.writerow(COLUMNS)
+    writer.writerows(generate_rows(count))
+    return text.getvalue().encode('utf-8')
+
+
+def pandas_xlsx(data):
+    import pandas as pd
+    df = pd.read_excel(io.BytesIO(data), engine='openpyxl').fillna('')
+    return df.to_dict('records')
+
+
+def streaming_xlsx(data):
+    return list(excel_reader.open_sheet(io.BytesIO(data), 'sheet.xlsx')[1])
+
+
+def streaming_xlsx_lazy(data):
+    # Consume rows one at a time without keeping them, as a grouping pass would
+    return range(sum(1 for _ in excel_reader.open_sheet(io.BytesIO(data), 'sheet.xlsx')[1]))
+
+
+def streaming_csv(data):
+    return list(excel_reader.open_sheet(io.BytesIO(data), 'sheet.csv')[1])
+
+
+def measure(func, data):
+    start = time.perf_counter()
+    rows = func(data)
+    seconds = time.perf_counter() - start
+
+    tracemalloc.start()
+    func(data)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return {'rows': len(rows), 'seconds': round(seconds, 3), 'peak_mb': round(peak / 1024 / 1024, 1)}
+
+
+def main():
+    counts = [int(arg) for arg in sys.argv[1:]] or [10000, 100000]
+    results = []
+    for count in counts:
+        xlsx = build_xlsx(count)
+        csv_data = build_csv(count)
+        for name, func, data in (('pandas_xlsx', pandas_xlsx, xlsx),
+                                 ('streaming_xlsx', streaming_xlsx, xlsx),
+                                 ('streaming_xlsx_lazy', streaming_xlsx_lazy, xlsx),
+                                 ('streaming_csv', streaming_csv, csv_data)):
+            result = {'path': name, 'row_count': count, **measure(func, data)}
+            results.append(result)
+            print(f"{name:<20} {count:>8} rows  {result['seconds']:>8.3f}s  peak {result['peak_mb']:>7.1f} MB")
+    print(json.dumps(results))
+
+
+if __name__ == '__main__':
+    main()
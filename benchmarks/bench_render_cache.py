@@ -0,0 +1,48 @@
+#!/usr/bin/env python3
+"""
+Compare compile-every-time rendering against the source-hash compile cache
+used by the /render endpoint, using the test_template.j2 fixture. Both sides
+compile with the shared render environment and render through render_limited,
+as /render does, so only the compile step differs.
+
+Usage: python benchmarks/bench_render_cache.py [iterations]
+"""
+import json
+import os
+import sys
+import timeit
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+
+import renderer
+
+with open(os.path.join(ROOT, 'test_template.j2')) as f:
+    template_str = f.read()
+with open(os.path.join(ROOT, 'test_vars.json')) as f:
+    variables = json.load(f)
+
+iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+
+
+def uncached():
+    renderer.render_limited(renderer.render_env.from_string(template_str), variables)
+
+
+def cached():
+    renderer.render_limited(renderer.compile_source(template_str), variables)
+
+
+# Warm the cache so the cached path measures the steady state of repeated previews
+cached()
+
+results = {}
+for name, func in (('compile_and_render', uncached), ('cached_render', cached)):
+    seconds = min(timeit.repeat(func, number=iterations, repeat=3))
+    results[name] = seconds / iterations * 1000
+
+print(f"{'mode':<20} {'ms/render':>10}")
+for name, ms in results.items():
+    print(f"{name:<20} {ms:>10.3f}")
+print(f"speedup: {results['compile_and_render'] / results['cached_render']:.1f}x")
+print(json.dumps({'cache': renderer.source_templates.stats()}))
@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+"""
+Measure how long `import app` takes using `python -X importtime`, i.e. the imports a
+container restart or `python app.py` does before create_app() builds the application.
+
+Usage: python benchmarks/bench_startup.py [runs] [--json]
+Prints the median total import time and the slowest modules imported by app.
+"""
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+LINE_RE = re.compile(r'import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)')
+
+
+def run_once():
+    # Run from a scratch directory in case importing app ever writes to the cwd
+    with tempfile.TemporaryDirectory() as work:
+        result = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', f'import sys; sys.path.insert(0, {ROOT!r}); import app'],
+            cwd=work, capture_output=True, text=True, check=True
+        )
+    # importtime lists children before their parent, so collect depth-1 imports
+    # until the top-level 'app' line closes them off
+    children = {}
+    for line in result.stderr.splitlines():
+        match = LINE_RE.match(line)
+        if not match:
+            continue
+        cumulative_us, depth, name = int(match.group(2)), len(match.group(3)), match.group(4)
+        if depth == 3:
+            children[name] = cumulative_us
+        elif depth == 1:
+            if name == 'app':
+                return {'app': cumulative_us, **children}
+            children = {}
+    raise RuntimeError('app import not found in -X importtime output')
+
+
+def main():
+    args = [arg for arg in sys.argv[1:] if arg != '--json']
+    runs = int(args[0]) if args else 5
+    samples = [run_once() for _ in range(runs)]
+
+    total_ms = statistics.median(sample['app'] for sample in samples) / 1000
+    modules = {name: statistics.median(sample.get(name, 0) for sample in samples) / 1000 for name in samples[0]}
+    slowest = sorted(((ms, name) for name, ms in modules.items() if name != 'app'), reverse=True)[:10]
+
+    if '--json' in sys.argv:
+        print(json.dumps({'runs': runs, 'import_app_ms': round(total_ms, 1),
+                          'slowest_imports_ms': {name: round(ms, 1) for ms, name in slowest}}))
+        return
+
+    print(f'import app: {total_ms:.1f} ms (median of {runs} runs)')
+    for ms, name in slowest:
+        print(f'  {name:<30} {ms:>8.1f} ms')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,334 @@
+#!/usr/bin/env python3
+"""
+Multi-user load generator for the Config Generator.
+
+Simulated users (threads) replay a weighted mix of what the network team does
+all day — open the template editor, preview in the Jinja Tester, upload a
+sheet, generate configs, save and activate template versions — against a real
+HTTP server, then report per-action p50/p95/p99 latency, throughput, and every
+"database is locked" error seen in responses or in the server's output.
+
+By default the app is started locally (Flask's threaded dev server, the same as
+`python app.py`) in a scratch directory; use --url to target a running server
+instead (e.g. the Docker container).
+
+Usage: python benchmarks/load_test.py [--users 20] [--duration 60] [--think 0.2]
+                                      [--url http://host:port] [--seed-templates 20] [--output results.json]
+"""
+import argparse
+import csv
+import io
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+import uuid
+from collections import defaultdict
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+LOCKED = 'database is locked'
+
+TEMPLATE = '''hostname {{ switch_name }}
+{% for port in ports %}
+interface {{ port.eth_port }}
+  description {{ port.host_name }}-{{ port.host_port }}
+  switchport access vlan {{ port.vlan }}
+!
+{% endfor %}
+'''
+
+# action -> weight; roughly what a team of engineers does during a cabling project
+WORKLOAD = {
+    'editor_load': 30,
+    'preview': 25,
+    'metadata': 10,
+    'upload_excel': 10,
+    'generate': 15,
+    'version_edit': 10,
+}
+
+
+class Results:
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.locked = defaultdict(int)
+        self.error_samples = []
+        self.lock = threading.Lock()
+
+    def record(self, action, seconds, ok, body=''):
+        with self.lock:
+            self.latencies[action].append(seconds)
+            if not ok:
+                self.errors[action] += 1
+                if len(self.error_samples) < 20:
+                    self.error_samples.append(f'{action}: {body[:200]}')
+            if LOCKED in body:
+                self.locked[action] += 1
+
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, int(round(fraction * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[index]
+
+
+class Client:
+    def __init__(self, base_url, timeout=120):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+
+    def request(self, method, path, payload=None, body=None, content_type=None):
+        """Returns (status, response text); HTTP errors are returned, not raised"""
+        headers = {}
+        if payload is not None:
+            body = json.dumps(payload).encode('utf-8')
+            content_type = 'application/json'
+        if content_type:
+            headers['Content-Type'] = content_type
+        req = urllib.request.Request(self.base_url + path, data=body, method=method, headers=headers)
+        try:
+            with urllib.request.urlopen(req, timeout=self.timeout) as response:
+                return response.status, response.read().decode('utf-8', errors='replace')
+        except urllib.error.HTTPError as e:
+            return e.code, e.read().decode('utf-8', errors='replace')
+        except (urllib.error.URLError, socket.timeout, ConnectionError) as e:
+            return 0, f'{type(e).__name__}: {e}'
+
+    def upload(self, path, filename, data):
+        boundary = uuid.uuid4().hex
+        body = (f'--{boundary}\r\nContent-Disposition: form-data; name="file"; filename="{filename}"\r\n'
+                f'Content-Type: application/octet-stream\r\n\r\n').encode('utf-8') + data + f'\r\n--{boundary}--\r\n'.encode('utf-8')
+        return self.request('POST', path, body=body, content_type=f'multipart/form-data; boundary={boundary}')
+
+
+def sheet_rows(count, template_names, rng):
+    rows = []
+    for i in range(count):
+        rows.append({
+            'template': rng.choice(template_names),
+            'switch_name': f'LEAF{i // 48:04d}',
+            'switch_port': f'Port-{i % 48 + 1:02d}',
+            'eth_port': f'Ethernet1/{i % 48 + 1}',
+            'host_name': f'host{i:06d}',
+            'host_port': f'eth{i % 4}',
+            'vlan': 1000 + i % 200
+        })
+    return rows
+
+
+def rows_to_csv(rows):
+    text = io.StringIO()
+    writer = csv.DictWriter(text, fieldnames=list(rows[0]))
+    writer.writeheader()
+    writer.writerows(rows)
+    return text.getvalue().encode('utf-8')
+
+
+class Workload:
+    def __init__(self, client, results, template_ids, template_names, rows_per_sheet):
+        self.client = client
+        self.results = results
+        self.template_ids = template_ids
+        self.template_names = template_names
+        self.rows_per_sheet = rows_per_sheet
+        self.preview_template = open(os.path.join(ROOT, 'test_template.j2')).read()
+        self.preview_vars = open(os.path.join(ROOT, 'test_vars.json')).read()
+
+    def timed(self, action, call, expect_success=True):
+        start = time.perf_counter()
+        status, body = call()
+        elapsed = time.perf_counter() - start
+        ok = status == 200
+        if ok and expect_success and body.startswith('{'):
+            try:
+                ok = json.loads(body).get('success', True) is not False
+            except ValueError:
+                ok = False
+        self.results.record(action, elapsed, ok, body if not ok or LOCKED in body else '')
+
+    def editor_load(self, rng):
+        template_id = rng.choice(self.template_ids)
+        self.timed('editor_load', lambda: self.client.request('GET', '/api/templates'))
+        self.timed('editor_load', lambda: self.client.request('GET', f'/api/templates/{template_id}'))
+        self.timed('editor_load', lambda: self.client.request('GET', f'/api/templates/{template_id}/versions'))
+
+    def preview(self, rng):
+        payload = {'template': self.preview_template, 'variables': self.preview_vars}
+        self.timed('preview', lambda: self.client.request('POST', '/render', payload))
+
+    def metadata(self, rng):
+        path = rng.choice(('/api/host-types', '/api/port-types', '/api/switch-os-types'))
+        self.timed('metadata', lambda: self.client.request('GET', path))
+
+    def upload_excel(self, rng):
+        data = rows_to_csv(sheet_rows(self.rows_per_sheet, self.template_names, rng))
+        self.timed('upload_excel', lambda: self.client.upload('/api/upload-excel', 'load.csv', data))
+
+    def generate(self, rng):
+        payload = {'excel_data': sheet_rows(self.rows_per_sheet, self.template_names, rng)}
+        self.timed('generate', lambda: self.client.request('POST', '/api/generate-configs', payload))
+
+    def version_edit(self, rng):
+        template_id = rng.choice(self.template_ids)
+        payload = {'template_content': TEMPLATE + f'! edited {uuid.uuid4().hex[:8]}\n',
+                   'version_name': f'load-{uuid.uuid4().hex[:6]}', 'version_description': 'load test'}
+        start = time.perf_counter()
+        status, body = self.client.request('POST', f'/api/templates/{template_id}/versions', payload)
+        ok = status == 200
+        if ok:
+            version = json.loads(body)['version']
+            status, body = self.client.request('POST', f'/api/templates/{template_id}/active-version/{version}')
+            ok = status == 200
+        self.results.record('version_edit', time.perf_counter() - start, ok, body if not ok or LOCKED in body else '')
+
+
+def user_loop(workload, deadline, think, seed):
+    rng = random.Random(seed)
+    actions = list(WORKLOAD)
+    weights = [WORKLOAD[a] for a in actions]
+    while time.monotonic() < deadline:
+        action = rng.choices(actions, weights)[0]
+        getattr(workload, action)(rng)
+        if think:
+            time.sleep(rng.expovariate(1 / think))
+
+
+def seed_templates(client, count):
+    suffix = uuid.uuid4().hex[:6]
+    for path, name in (('/api/port-types', f'load-port-{suffix}'), ('/api/switch-os-types', f'load-os-{suffix}')):
+        client.request('POST', path, {'name': name})
+    template_ids, template_names = [], []
+    for i in range(count):
+        host_type = f'load-host-{suffix}-{i}'
+        client.request('POST', '/api/host-types', {'name': host_type})
+        name = f'LOAD-{suffix}-{i:03d}'
+        status, body = client.request('POST', '/api/templates', {
+            'name': name, 'host_type': host_type, 'port_type': f'load-port-{suffix}',
+            'switch_os': f'load-os-{suffix}', 'template_content': TEMPLATE})
+        if status != 200:
+            raise RuntimeError(f'Could not create seed template: {body}')
+        template_ids.append(json.loads(body)['template_id'])
+        template_names.append(name)
+    return template_ids, template_names
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def start_local_server(work):
+    port = free_port()
+    script = (f'import sys; sys.path.insert(0, {ROOT!r}); import app; '
+              f'app.create_app().run(host="127.0.0.1", port={port}, debug=False, threaded=True)')
+    log = open(os.path.join(work, 'server.out'), 'w+')
+    process = subprocess.Popen([sys.executable, '-c', script], cwd=work, stdout=log, stderr=subprocess.STDOUT)
+    client = Client(f'http://127.0.0.1:{port}', timeout=2)
+    for _ in range(100):
+        if process.poll() is not None:
+            log.seek(0)
+            raise RuntimeError(f'Server exited during startup:\n{log.read()}')
+        if client.request('GET', '/api/health')[0] == 200:
+            return process, f'http://127.0.0.1:{port}', log
+        time.sleep(0.1)
+    process.terminate()
+    raise RuntimeError('Server did not become healthy within 10 seconds')
+
+
+def report(results, elapsed, users, server_locked):
+    summary = {'users': users, 'duration_seconds': round(elapsed, 2), 'actions': {}}
+    total = 0
+    print(f"\n{'action':<14} {'count':>7} {'errors':>7} {'locked':>7} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'max ms':>9}")
+    for action in WORKLOAD:
+        latencies = sorted(results.latencies.get(action, []))
+        if not latencies:
+            continue
+        total += len(latencies)
+        stats = {
+            'count': len(latencies),
+            'errors': results.errors[action],
+            'locked': results.locked[action],
+            'p50_ms': round(percentile(latencies, 0.50) * 1000, 2),
+            'p95_ms': round(percentile(latencies, 0.95) * 1000, 2),
+            'p99_ms': round(percentile(latencies, 0.99) * 1000, 2),
+            'max_ms': round(latencies[-1] * 1000, 2)
+        }
+        summary['actions'][action] = stats
+        print(f"{action:<14} {stats['count']:>7} {stats['errors']:>7} {stats['locked']:>7} {stats['p50_ms']:>9.1f} "
+              f"{stats['p95_ms']:>9.1f} {stats['p99_ms']:>9.1f} {stats['max_ms']:>9.1f}")
+
+    # version_edit samples cover two requests (create + activate), so this counts operations
+    summary['operations'] = total
+    summary['throughput_ops'] = round(total / elapsed, 2) if elapsed else 0.0
+    summary['locked_responses'] = sum(results.locked.values())
+    summary['locked_in_server_log'] = server_locked
+    summary['error_samples'] = results.error_samples
+    print(f'\nthroughput: {summary["throughput_ops"]} ops/s over {elapsed:.1f}s with {users} users')
+    print(f'"{LOCKED}": {summary["locked_responses"]} responses'
+          + (f', {server_locked} server log lines' if server_locked is not None else ''))
+    for sample in results.error_samples[:5]:
+        print(f'  error: {sample}')
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Multi-user load test for the Config Generator')
+    parser.add_argument('--url', help='target a running server instead of starting one locally')
+    parser.add_argument('--users', type=int, default=20, help='concurrent simulated users (default 20)')
+    parser.add_argument('--duration', type=float, default=60, help='seconds to run (default 60)')
+    parser.add_argument('--think', type=float, default=0.2, help='mean think time between actions in seconds')
+    parser.add_argument('--seed-templates', type=int, default=20, help='templates to create before the run')
+    parser.add_argument('--rows', type=int, default=500, help='rows per uploaded/generated sheet (default 500)')
+    parser.add_argument('--output', help='write the summary as JSON to this file')
+    args = parser.parse_args()
+
+    server = log = None
+    base_url = args.url
+    if not base_url:
+        work = tempfile.mkdtemp(prefix='loadtest-')
+        server, base_url, log = start_local_server(work)
+        print(f'Started local server at {base_url} (cwd {work})')
+
+    try:
+        client = Client(base_url)
+        template_ids, template_names = seed_templates(client, args.seed_templates)
+        results = Results()
+        workload = Workload(client, results, template_ids, template_names, args.rows)
+
+        deadline = time.monotonic() + args.duration
+        start = time.perf_counter()
+        threads = [threading.Thread(target=user_loop, args=(workload, deadline, args.think, seed), daemon=True)
+                   for seed in range(args.users)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start
+    finally:
+        server_locked = None
+        if server is not None:
+            server.terminate()
+            server.wait(timeout=10)
+            log.seek(0)
+            server_locked = sum(1 for line in log if LOCKED in line)
+
+    summary = report(results, elapsed, args.users, server_locked)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(summary, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,335 @@
+#!/usr/bin/env python3
+"""
+Migration harness: build synthetic databases in every layout older releases wrote,
+migrate them with migrations.py and check the result.
+
+Layouts:
+  named_unique    oldest: vendor/os columns, UNIQUE(host_type, vendor, os, name), duplicates
+  vendor_os       vendor/os columns with per-template version, vendors/os_types tables
+  pre_versioning  port_type/switch_os with content on templates, stale template_versions
+  current         already migrated (checks the no-op fast path)
+
+After migrating, each file must have the templates expected from the source rows and one
+active version per template, matching its content and version number. Its column sets
+must match a freshly created file, and integrity_check and foreign_key_check must be clean.
+The set-based content split (migration 4) is timed against the row-by-row loop the old
+init_db() used.
+
+Usage:
+  python benchmarks/migration_harness.py [--templates 100000] [--layout NAME] [--keep DIR]
+"""
+import argparse
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+sys.path.insert(0, ROOT)
+
+import migrations  # noqa: E402
+
+BODY = '''hostname {{ switch_name }}
+{% for port in ports %}
+interface {{ port.eth_port }}
+  description {{ port.host_name }}
+!
+{% endfor %}
+'''
+
+TYPE_TABLES = '''
+    CREATE TABLE host_types (id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT UNIQUE NOT NULL, description TEXT);
+    CREATE TABLE template_fields (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        template_id INTEGER NOT NULL,
+        field_name TEXT NOT NULL,
+        field_type TEXT NOT NULL,
+        required BOOLEAN DEFAULT 1,
+        default_value TEXT,
+        FOREIGN KEY (template_id) REFERENCES templates(id) ON DELETE CASCADE
+    );
+'''
+
+LAYOUTS = {
+    'named_unique': '''
+        CREATE TABLE templates (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL,
+            host_type TEXT NOT NULL,
+            vendor TEXT NOT NULL,
+            os TEXT NOT NULL,
+            template_content TEXT NOT NULL,
+            description TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            UNIQUE(host_type, vendor, os, name)
+        );
+        CREATE TABLE vendors (id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT UNIQUE NOT NULL);
+        CREATE TABLE os_types (id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT NOT NULL UNIQUE);
+    ''' + TYPE_TABLES,
+    'vendor_os': '''
+        CREATE TABLE templates (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL,
+            host_type TEXT NOT NULL,
+            vendor TEXT NOT NULL,
+            os TEXT NOT NULL,
+            template_content TEXT NOT NULL,
+            description TEXT,
+            version INTEGER,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            UNIQUE(host_type, vendor, os)
+        );
+        CREATE TABLE vendors (id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT UNIQUE NOT NULL);
+        CREATE TABLE os_types (id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT NOT NULL UNIQUE);
+        -- a release that had both: the os_types rows must be merged, not lost
+        CREATE TABLE switch_os_types (id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT NOT NULL UNIQUE);
+    ''' + TYPE_TABLES,
+    'pre_versioning': '''
+        CREATE TABLE templates (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL,
+            host_type TEXT NOT NULL,
+            port_type TEXT NOT NULL,
+            switch_os TEXT NOT NULL,
+            template_content TEXT NOT NULL,
+            description TEXT,
+            version INTEGER,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            UNIQUE(host_type, port_type, switch_os)
+        );
+        CREATE TABLE template_versions (id INTEGER PRIMARY KEY, template_id INTEGER, content TEXT);
+        CREATE TABLE port_types (id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT UNIQUE NOT NULL);
+        CREATE TABLE switch_os_types (id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT NOT NULL UNIQUE);
+    ''' + TYPE_TABLES,
+}
+
+
+def content(template_id):
+    return f'! template {template_id}\n{BODY}'
+
+
+def source_version(i):
+    """Stored version of template i: mostly 1-3, sometimes NULL (rows from before versions)"""
+    return None if i % 10 == 0 else i % 3 + 1
+
+
+def build(path, layout, count):
+    """Create a database in `layout` with `count` templates; returns the expected template count"""
+    for suffix in ('', '-wal', '-shm'):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+    if layout == 'current':
+        migrations.migrate(path, log=lambda message: None)
+    conn = sqlite3.connect(path, isolation_level=None)
+    conn.execute('PRAGMA journal_mode = WAL')
+
+    if layout == 'current':
+        conn.execute('BEGIN')
+        conn.executemany(
+            'INSERT INTO templates (id, name, name_folded, host_type, port_type, switch_os, active_version) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?)',
+            ((i, f'T{i}', f't{i}', f'host{i}', 'port', 'os', source_version(i) or 1) for i in range(1, count + 1)))
+        conn.executemany(
+            'INSERT INTO template_versions (template_id, version, version_name, template_content, is_active) '
+            'VALUES (?, ?, ?, ?, 1)',
+            ((i, source_version(i) or 1, f'v{source_version(i) or 1}', content(i)) for i in range(1, count + 1)))
+        conn.executemany('INSERT INTO port_types (name) VALUES (?)', [('port',), ('lacp',)])
+        expected = count
+    else:
+        conn.executescript(LAYOUTS[layout])
+        conn.execute('BEGIN')
+        type_columns = ('vendor', 'os') if layout != 'pre_versioning' else ('port_type', 'switch_os')
+        columns = ['id', 'name', 'host_type', *type_columns, 'template_content', 'description']
+        if layout == 'named_unique':
+            # Every tenth combination has a second, later template under another name
+            rows, expected, i = [], 0, 0
+            for n in range(count):
+                i += 1
+                rows.append((i, f'T{i}', f'host{n}', 'port', 'os', content(i), f'template {i}'))
+                expected += 1
+                if n % 10 == 0:
+                    i += 1
+                    rows.append((i, f'T{i}-copy', f'host{n}', 'port', 'os', content(i), 'duplicate'))
+        else:
+            columns.append('version')
+            rows = [(i, f'T{i}', f'host{i}', 'port', 'os', content(i), f'template {i}', source_version(i))
+                    for i in range(1, count + 1)]
+            expected = count
+        placeholders = ', '.join('?' for _ in columns)
+        conn.executemany(f'INSERT INTO templates ({", ".join(columns)}) VALUES ({placeholders})', rows)
+
+        old_port_table, old_os_table = ('port_types', 'switch_os_types') if layout == 'pre_versioning' \
+            else ('vendors', 'os_types')
+        conn.executemany(f'INSERT INTO {old_port_table} (name) VALUES (?)', [('port',), ('lacp',)])
+        conn.executemany(f'INSERT INTO {old_os_table} (name) VALUES (?)', [('os',), ('nxos',)])
+        if layout == 'vendor_os':
+            conn.executemany('INSERT INTO switch_os_types (name) VALUES (?)', [('os',), ('eos',)])
+        if layout == 'pre_versioning':
+            conn.execute("INSERT INTO template_versions (template_id, content) VALUES (1, 'stale')")
+
+    conn.executemany('INSERT INTO host_types (name) VALUES (?)', ((f'host{i}',) for i in range(min(count, 1000))))
+    conn.executemany(
+        "INSERT INTO template_fields (template_id, field_name, field_type) VALUES (?, 'vlan', 'number')",
+        ((i,) for i in range(1, min(count, 1000) + 1)))
+    conn.execute('COMMIT')
+    conn.close()
+    return expected
+
+
+def schema_columns(path):
+    conn = sqlite3.connect(path)
+    tables = [row[0] for row in conn.execute(
+        "SELECT name FROM sqlite_master WHERE type='table' AND name NOT LIKE 'sqlite_%' ORDER BY name")]
+    columns = {table: [row[1] for row in conn.execute(f'PRAGMA table_info({table})')] for table in tables}
+    conn.close()
+    return columns
+
+
+def verify(path, layout, expected, reference_columns):
+    """Return a list of problems with a migrated file (empty when it is correct)"""
+    conn = sqlite3.connect(path)
+    problems = []
+
+    def check(condition, message):
+        if not condition:
+            problems.append(message)
+
+    scalar = lambda sql, *params: conn.execute(sql, params).fetchone()[0]  # noqa: E731
+
+    check(scalar('PRAGMA user_version') == migrations.LATEST_VERSION, 'user_version not at latest')
+    check(scalar('PRAGMA journal_mode') == 'wal', 'journal_mode is not WAL')
+    check(scalar('PRAGMA integrity_check') == 'ok', 'integrity_check failed')
+    check(not conn.execute('PRAGMA foreign_key_check').fetchall(), 'foreign_key_check found orphans')
+    check(schema_columns(path) == reference_columns, 'column sets differ from a fresh database')
+
+    templates = scalar('SELECT COUNT(*) FROM templates')
+    check(templates == expected, f'{templates} templates, expected {expected}')
+    check(scalar('SELECT COUNT(*) FROM template_versions') == expected, 'not one version per template')
+    check(scalar('SELECT COUNT(*) FROM template_versions WHERE is_active = 1') == expected,
+          'not one active version per template')
+    check(scalar('''SELECT COUNT(*) FROM templates t JOIN template_versions v
+                    ON v.template_id = t.id AND v.version = t.active_version AND v.is_active = 1''') == expected,
+          'active_version does not point at the active version row')
+    check(scalar("SELECT COUNT(*) FROM template_versions WHERE template_content != "
+                 "'! template ' || template_id || char(10) || ?", BODY) == 0,
+          'template content does not match its source row')
+    check(scalar("SELECT COUNT(*) FROM template_versions WHERE version_name != 'v' || version") == 0,
+          'version names do not match version numbers')
+    if layout != 'named_unique':
+        # Stored versions survive (NULL -> 1); the oldest layout had no version column
+        mismatched = sum(1 for template_id, active in conn.execute('SELECT id, active_version FROM templates')
+                         if active != (source_version(template_id) or 1))
+        check(mismatched == 0, f'{mismatched} templates lost their stored version')
+    check(scalar("SELECT COUNT(*) FROM sqlite_master WHERE name = 'idx_templates_name_folded'") == 1,
+          'name index missing')
+    check(scalar("SELECT COUNT(*) FROM templates WHERE name_folded IS NOT lower(name)") == 0,
+          'folded names missing or wrong')
+    if layout == 'vendor_os':
+        names = {row[0] for row in conn.execute('SELECT name FROM switch_os_types')}
+        check(names == {'os', 'nxos', 'eos'}, f'os_types not merged into switch_os_types: {sorted(names)}')
+    check(scalar('SELECT COUNT(*) FROM port_types') == 2, 'port types lost')
+    conn.close()
+    return problems
+
+
+def row_loop_split(path):
+    """The content split as init_db() did it: fetch every template, then one INSERT per row"""
+    conn = sqlite3.connect(path)
+    cursor = conn.cursor()
+    start = time.perf_counter()
+    cursor.execute('DROP TABLE IF EXISTS template_versions')
+    cursor.execute(migrations.TEMPLATES_TABLE.format(name='templates_new'))
+    cursor.execute('''
+        INSERT INTO templates_new (id, name, host_type, port_type, switch_os, active_version, created_at, updated_at)
+        SELECT id, name, host_type, port_type, switch_os, COALESCE(version, 1), created_at, updated_at
+        FROM templates
+    ''')
+    cursor.execute('SELECT id, template_content, description, COALESCE(version, 1) as version FROM templates')
+    old_templates = cursor.fetchall()
+    cursor.execute('DROP TABLE templates')
+    cursor.execute('ALTER TABLE templates_new RENAME TO templates')
+    cursor.execute(migrations.TEMPLATE_VERSIONS_TABLE)
+    for tmpl in old_templates:
+        cursor.execute('''
+            INSERT INTO template_versions
+            (template_id, version, version_name, version_description, template_content, is_active)
+            VALUES (?, ?, ?, ?, ?, 1)
+        ''', (tmpl[0], tmpl[3], f'v{tmpl[3]}', tmpl[2], tmpl[1]))
+    conn.commit()
+    seconds = time.perf_counter() - start
+    conn.close()
+    return seconds
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--templates', type=int, default=100000, help='templates per database (default 100000)')
+    parser.add_argument('--layout', choices=[*LAYOUTS, 'current'], action='append',
+                        help='only this layout (repeatable)')
+    parser.add_argument('--keep', help='build the databases in this directory and keep them')
+    args = parser.parse_args()
+
+    work = os.path.abspath(args.keep) if args.keep else tempfile.mkdtemp(prefix='migrate-')
+    os.makedirs(work, exist_ok=True)
+    try:
+        reference = os.path.join(work, 'fresh.db')
+        migrations.migrate(reference, log=lambda message: None)
+        reference_columns = schema_columns(reference)
+
+        failed = False
+        for layout in args.layout or [*LAYOUTS, 'current']:
+            path = os.path.join(work, f'{layout}.db')
+            expected = build(path, layout, args.templates)
+
+            dry_run = migrations.migrate(path, dry_run=True, log=lambda message: None)
+            before = sqlite3.connect(path)
+            untouched = before.execute('PRAGMA user_version').fetchone()[0] == (
+                migrations.LATEST_VERSION if layout == 'current' else 0)
+            before.close()
+
+            start = time.perf_counter()
+            steps = migrations.migrate(path, log=lambda message: None)
+            total = time.perf_counter() - start
+            problems = verify(path, layout, expected, reference_columns)
+            if not untouched:
+                problems.append('dry run changed the file')
+            again = migrations.migrate(path, log=lambda message: None)
+            if again:
+                problems.append('second run applied migrations again')
+
+            timings = ', '.join(f"{step['version']}: {step['seconds']:.3f}s" for step in steps) or 'none pending'
+            print(f'{layout:<15} {expected:>8} templates  {total:7.3f}s  [{timings}]  '
+                  f'dry run {sum(step["seconds"] for step in dry_run):.3f}s  '
+                  f'{"OK" if not problems else "FAILED"}')
+            for problem in problems:
+                print(f'    {problem}')
+            failed = failed or bool(problems)
+
+            if layout == 'pre_versioning':
+                # Same starting file for both approaches to the content split
+                build(path, layout, args.templates)
+                conn = sqlite3.connect(path, isolation_level=None)
+                conn.execute('BEGIN IMMEDIATE')
+                start = time.perf_counter()
+                migrations.split_template_versions(conn)
+                set_based = time.perf_counter() - start
+                conn.execute('COMMIT')
+                conn.close()
+                build(path, layout, args.templates)
+                row_loop = row_loop_split(path)
+                print(f'{"":<15} content split: INSERT...SELECT {set_based:.3f}s, '
+                      f'row loop {row_loop:.3f}s ({row_loop / set_based:.1f}x)')
+    finally:
+        if not args.keep:
+            shutil.rmtree(work, ignore_errors=True)
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
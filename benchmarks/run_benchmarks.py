@@ -0,0 +1,358 @@
+#!/usr/bin/env python3
+"""
+In-process benchmark suite for the render and generation hot paths.
+
+Drives the app through Flask's test client (no server, no network) from a scratch
+working directory, so results are reproducible and comparable between commits:
+
+  /render                 test_template.j2 + test_vars.json
+  /api/generate-configs   100 / 1k / 10k rows x 1 / 10 / 100 templates, rendered and from the output cache;
+                          a 2,000-port group with one row changed per run, re-rendered in full and incrementally
+  renderer.render_group   the same 2,000-port group without the request around it
+  /api/upload-excel       generated .xlsx and .csv sheets of 100 / 1k / 10k rows
+  Database                template CRUD and lookup methods
+
+Usage:
+  python benchmarks/run_benchmarks.py [--quick] [--repeat N] [--filter TEXT] [--output results.json]
+  python benchmarks/run_benchmarks.py --compare baseline.json [--threshold 0.2]
+
+--compare exits with status 1 when any benchmark's median is slower than the
+baseline by more than --threshold (a fraction, default 0.2 = 20%).
+"""
+import argparse
+import csv
+import io
+import itertools
+import json
+import logging
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+sys.path.insert(0, ROOT)
+
+ROW_COUNTS = (100, 1000, 10000)
+TEMPLATE_COUNTS = (1, 10, 100)
+QUICK_ROW_COUNTS = (100, 1000)
+QUICK_TEMPLATE_COUNTS = (1, 10)
+SHEET_COLUMNS = ['template', 'switch_name', 'switch_port', 'eth_port', 'host_name', 'host_port', 'vlan', 'description']
+
+# A typical leaf template: one interface stanza per port plus a few group-level fields
+GROUP_TEMPLATE = '''hostname {{ switch_name }}
+{% for port in ports %}
+interface {{ port.eth_port }}
+  description {{ port.host_name }}-{{ port.host_port }}{% if port.description %} {{ port.description }}{% endif %}
+  switchport access vlan {{ port.vlan }}
+  no shutdown
+!
+{% endfor %}
+'''
+
+# The same stanza as a port_row macro, so unchanged rows are reused from the fragment cache
+PORT_ROW_TEMPLATE = '''{% macro port_row(port) %}
+interface {{ port.eth_port }}
+  description {{ port.host_name }}-{{ port.host_port }}{% if port.description %} {{ port.description }}{% endif %}
+  switchport access vlan {{ port.vlan }}
+  no shutdown
+!
+{% endmacro %}hostname {{ switch_name }}
+{% for port in ports %}{{ port_row(port) }}{% endfor %}
+'''
+# Identical output and per-row macro call, but not named port_row: never served from fragments
+PORT_STANZA_TEMPLATE = PORT_ROW_TEMPLATE.replace('port_row', 'port_stanza')
+PORT_ROW_GROUP_SIZE = 2000
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT,
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def sheet_rows(row_count, template_count):
+    for i in range(row_count):
+        yield [
+            f'BENCH-{i % template_count:03d}',
+            f'LEAF{i // 48:04d}',
+            f'Port-{i % 48 + 1:02d}',
+            f'Ethernet1/{i % 48 + 1}',
+            f'host{i:06d}',
+            f'eth{i % 4}',
+            1000 + i % 200,
+            '' if i % 7 == 0 else f'cable run {i}'
+        ]
+
+
+def build_xlsx(row_count):
+    from openpyxl import Workbook
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet()
+    sheet.append(SHEET_COLUMNS)
+    for row in sheet_rows(row_count, 10):
+        sheet.append([value if value != '' else None for value in row])
+    buffer = io.BytesIO()
+    workbook.save(buffer)
+    return buffer.getvalue()
+
+
+def build_csv(row_count):
+    text = io.StringIO()
+    writer = csv.writer(text)
+    writer.writerow(SHEET_COLUMNS)
+    writer.writerows(sheet_rows(row_count, 10))
+    return text.getvalue().encode('utf-8')
+
+
+def measure(func, repeat, target_seconds=0.2):
+    """Time func like timeit: calibrate calls per run to ~target_seconds, then take `repeat` runs"""
+    func()  # warm-up (template compile, connection pool, imports)
+    number = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        elapsed = time.perf_counter() - start
+        if elapsed >= target_seconds or number >= 1000:
+            break
+        number = min(1000, max(number * 2, int(number * target_seconds / max(elapsed, 1e-6))))
+
+    runs = [elapsed / number]
+    for _ in range(repeat - 1):
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        runs.append((time.perf_counter() - start) / number)
+
+    return {
+        'median_ms': round(statistics.median(runs) * 1000, 4),
+        'min_ms': round(min(runs) * 1000, 4),
+        'mean_ms': round(statistics.mean(runs) * 1000, 4),
+        'stdev_ms': round(statistics.stdev(runs) * 1000, 4) if len(runs) > 1 else 0.0,
+        'runs': len(runs),
+        'number': number
+    }
+
+
+def expect_success(response):
+    payload = response.get_json()
+    if response.status_code != 200 or not payload.get('success'):
+        raise RuntimeError(f'Benchmark request failed ({response.status_code}): {payload}')
+    return payload
+
+
+class Suite:
+    def __init__(self, app_module, flask_app, quick=False):
+        self.app_module = app_module
+        self.client = flask_app.test_client()
+        self.db = app_module.db
+        self.row_counts = QUICK_ROW_COUNTS if quick else ROW_COUNTS
+        self.template_counts = QUICK_TEMPLATE_COUNTS if quick else TEMPLATE_COUNTS
+        self.combo_ids = itertools.count()
+        self.setup_templates(max(self.template_counts))
+
+    def new_combo(self):
+        """A fresh (host_type, port_type, switch_os); templates are unique per combination"""
+        n = next(self.combo_ids)
+        return f'bench-host-{n}', 'bench-port', 'bench-os'
+
+    def setup_templates(self, count):
+        self.db.add_port_type('bench-port')
+        self.db.add_switch_os_type('bench-os')
+        for i in range(count):
+            host_type, port_type, switch_os = self.new_combo()
+            self.db.add_host_type(host_type)
+            self.db.create_template(f'BENCH-{i:03d}', host_type, port_type, switch_os, GROUP_TEMPLATE)
+        host_type, port_type, switch_os = self.new_combo()
+        self.db.add_host_type(host_type)
+        self.db.create_template('BENCH-ROWS', host_type, port_type, switch_os, PORT_ROW_TEMPLATE)
+        host_type, port_type, switch_os = self.new_combo()
+        self.db.add_host_type(host_type)
+        self.db.create_template('BENCH-STANZA', host_type, port_type, switch_os, PORT_STANZA_TEMPLATE)
+
+    def cases(self):
+        yield 'render/test_template', self.render_case()
+        for rows, templates in itertools.product(self.row_counts, self.template_counts):
+            yield f'generate_configs/{rows}_rows/{templates}_templates', self.generate_case(rows, templates)
+        for rows in self.row_counts:
+            templates = max(self.template_counts)
+            yield f'generate_configs/cached/{rows}_rows/{templates}_templates', \
+                self.generate_case(rows, templates, cache=True)
+        # Both sides edit one row per run and differ only in whether unchanged rows are reused
+        name = f'port_row/{PORT_ROW_GROUP_SIZE}_ports/one_row_changed'
+        yield f'generate_configs/{name}/full_render', self.port_row_case('BENCH-STANZA')
+        yield f'generate_configs/{name}/incremental', self.port_row_case('BENCH-ROWS')
+        yield f'render_group/{name}/full_render', self.render_group_case(incremental=False)
+        yield f'render_group/{name}/incremental', self.render_group_case(incremental=True)
+        for rows in self.row_counts:
+            yield f'upload_excel/xlsx/{rows}_rows', self.upload_case(build_xlsx(rows), 'bench.xlsx')
+            yield f'upload_excel/csv/{rows}_rows', self.upload_case(build_csv(rows), 'bench.csv')
+        yield from self.db_cases()
+
+    def render_case(self):
+        with open(os.path.join(ROOT, 'test_template.j2')) as f:
+            template = f.read()
+        with open(os.path.join(ROOT, 'test_vars.json')) as f:
+            variables = f.read()
+        payload = {'template': template, 'variables': variables}
+        return lambda: expect_success(self.client.post('/render', json=payload))
+
+    def generate_case(self, row_count, template_count, cache=False):
+        """Repeated identical runs: with cache every group after the warm-up comes from the output cache"""
+        excel_data = [dict(zip(SHEET_COLUMNS, row)) for row in sheet_rows(row_count, template_count)]
+        payload = {'excel_data': excel_data, 'parallel': False, 'cache': cache}
+        return lambda: expect_success(self.client.post('/api/generate-configs', json=payload))
+
+    def port_row_case(self, template_name):
+        """One 2,000-port group with the output cache on and a different row edited per run"""
+        excel_data = [dict(zip(SHEET_COLUMNS, row), template=template_name)
+                      for row in sheet_rows(PORT_ROW_GROUP_SIZE, 1)]
+        edits = itertools.count()
+
+        def run():
+            n = next(edits)
+            rows = list(excel_data)
+            index = n % len(rows)
+            rows[index] = dict(rows[index], description=f'edit {n}')
+            expect_success(self.client.post('/api/generate-configs',
+                                            json={'excel_data': rows, 'parallel': False, 'cache': True}))
+        return run
+
+    def render_group_case(self, incremental):
+        renderer = self.app_module.renderer
+        template = renderer.compile_source(PORT_ROW_TEMPLATE)
+        rows = [dict(zip(SHEET_COLUMNS, row)) for row in sheet_rows(PORT_ROW_GROUP_SIZE, 1)]
+        edits = itertools.count()
+
+        def run():
+            n = next(edits)
+            edited = list(rows)
+            edited[n % len(rows)] = dict(rows[n % len(rows)], description=f'edit {n}')
+            renderer.render_group(template, edited, incremental=incremental)
+        return run
+
+    def upload_case(self, data, filename):
+        def run():
+            response = self.client.post('/api/upload-excel', data={'file': (io.BytesIO(data), filename)},
+                                        content_type='multipart/form-data')
+            expect_success(response)
+        return run
+
+    def db_cases(self):
+        db = self.db
+        template_id = db.get_template_by_name('BENCH-000')['id']
+        names = [f'BENCH-{i:03d}' for i in range(max(self.template_counts))]
+        versions = itertools.count(2)
+
+        def create_and_delete():
+            host_type, port_type, switch_os = self.new_combo()
+            new_id = db.create_template(f'BENCH-TMP-{host_type}', host_type, port_type, switch_os, GROUP_TEMPLATE)
+            db.delete_template(new_id)
+
+        def create_version():
+            version = next(versions)
+            db.create_template_version(template_id, GROUP_TEMPLATE, f'v{version}')
+
+        yield 'db/get_template', lambda: db.get_template(template_id)
+        yield 'db/get_template_by_name', lambda: db.get_template_by_name('bench-000')
+        yield f'db/get_templates_by_names/{len(names)}', lambda: db.get_templates_by_names(names)
+        yield 'db/get_all_templates', db.get_all_templates
+        yield 'db/get_template_versions', lambda: db.get_template_versions(template_id)
+        yield 'db/update_template', lambda: db.update_template(template_id, name='BENCH-000')
+        # Before create_template_version: it touches every version row of the template
+        yield 'db/set_active_version', lambda: db.set_active_version(template_id, 1)
+        yield 'db/create_template_version', create_version
+        yield 'db/create_and_delete_template', create_and_delete
+
+
+def run_suite(args):
+    work = tempfile.mkdtemp(prefix='bench-')
+    # create_app() creates logs/, data/ and uploads/ in the current directory
+    os.chdir(work)
+    import app as app_module
+    flask_app = app_module.create_app()
+
+    # Keep per-request INFO logging (it is part of the hot path) but off the terminal
+    for handler in app_module.log_handlers:
+        if handler.get_name() == 'console':
+            handler.setLevel(logging.CRITICAL)
+
+    suite = Suite(app_module, flask_app, quick=args.quick)
+    results = {}
+    for name, func in suite.cases():
+        if args.filter and args.filter not in name:
+            continue
+        results[name] = measure(func, args.repeat)
+        print(f"{name:<70} {results[name]['median_ms']:>12.3f} ms  (±{results[name]['stdev_ms']:.3f}, "
+              f"{results[name]['runs']}x{results[name]['number']})", flush=True)
+
+    return {
+        'meta': {
+            'commit': git_commit(),
+            'timestamp': datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'repeat': args.repeat,
+            'quick': args.quick,
+            'work_dir': work
+        },
+        'results': results
+    }
+
+
+def compare(baseline, current, threshold):
+    """Print median changes against a baseline; returns the names that regressed"""
+    regressions = []
+    print(f"\n{'benchmark':<70} {'baseline':>12} {'current':>12} {'change':>9}")
+    for name, result in current['results'].items():
+        base = baseline['results'].get(name)
+        if base is None:
+            print(f"{name:<70} {'-':>12} {result['median_ms']:>12.3f} {'new':>9}")
+            continue
+        change = result['median_ms'] / base['median_ms'] - 1 if base['median_ms'] else 0.0
+        flag = ''
+        if change > threshold:
+            regressions.append(name)
+            flag = '  REGRESSION'
+        print(f"{name:<70} {base['median_ms']:>12.3f} {result['median_ms']:>12.3f} {change:>+8.1%}{flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--quick', action='store_true', help='smaller matrix (100/1k rows, 1/10 templates)')
+    parser.add_argument('--repeat', type=int, default=5, help='timed runs per benchmark (default 5)')
+    parser.add_argument('--filter', help='only run benchmarks whose name contains this text')
+    parser.add_argument('--output', help='write results as JSON to this file')
+    parser.add_argument('--compare', help='baseline JSON from a previous --output run')
+    parser.add_argument('--threshold', type=float, default=0.2, help='regression threshold (default 0.2)')
+    args = parser.parse_args()
+
+    output = os.path.abspath(args.output) if args.output else None
+    baseline_path = os.path.abspath(args.compare) if args.compare else None
+
+    current = run_suite(args)
+
+    if output:
+        with open(output, 'w') as f:
+            json.dump(current, f, indent=2)
+        print(f'\nResults written to {output}')
+
+    if baseline_path:
+        with open(baseline_path) as f:
+            baseline = json.load(f)
+        regressions = compare(baseline, current, args.threshold)
+        if regressions:
+            print(f'\n{len(regressions)} benchmark(s) slower than baseline by more than {args.threshold:.0%}')
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
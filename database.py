@@ -1,266 +1,223 @@
 import sqlite3
 import json
+import os
+import threading
+from contextlib import contextmanager
 from datetime import datetime
+import metrics
+import migrations
 
+try:
+    import fcntl
+except ImportError:  # Windows: no cross-process migration lock
+    fcntl = None
+
+# PRAGMA user_version of a fully migrated file; add a migration in migrations.py to bump it
+SCHEMA_VERSION = migrations.LATEST_VERSION
+
+# Per-connection tuning applied whenever the pool opens a new connection
+CONNECTION_PRAGMAS = (
+    'PRAGMA synchronous = NORMAL',
+    'PRAGMA cache_size = -8000',        # 8 MB page cache
+    'PRAGMA mmap_size = 67108864',      # 64 MB memory-mapped reads
+    'PRAGMA temp_store = MEMORY',
+)
+
+
+class PooledConnection(sqlite3.Connection):
+    """sqlite3 connection whose close() hands it back to its pool instead of closing it"""
+    pool = None
+
+    def close(self):
+        if self.pool is None or not self.pool.release(self):
+            super().close()
+
+
+class ConnectionPool:
+    """Bounded pool of reusable SQLite connections shared by all request threads.
+
+    Connections are created on demand; at most pool_size idle connections are
+    kept open, extra ones are really closed when released.
+    """
+
+    def __init__(self, db_path, pool_size=5, timeout=10):
+        self.db_path = db_path
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self._idle = []
+        self._lock = threading.Lock()
+        self._closed = False
+        self.created = 0
+
+    def acquire(self):
+        with self._lock:
+            if self._idle:
+                return self._idle.pop()
+            self.created += 1
+        conn = sqlite3.connect(self.db_path, timeout=self.timeout,
+                               factory=PooledConnection, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        for pragma in CONNECTION_PRAGMAS:
+            conn.execute(pragma)
+        conn.pool = self
+        return conn
+
+    def release(self, conn):
+        """Return conn to the pool; False means the caller should really close it"""
+        if conn.in_transaction:
+            conn.rollback()
+        with self._lock:
+            if self._closed or len(self._idle) >= self.pool_size:
+                return False
+            self._idle.append(conn)
+            return True
+
+    def close(self):
+        with self._lock:
+            self._closed = True
+            idle, self._idle = self._idle, []
+        for conn in idle:
+            sqlite3.Connection.close(conn)
+
+    def stats(self):
+        with self._lock:
+            return {'pool_size': self.pool_size, 'idle': len(self._idle), 'created': self.created}
+
+    def reset_after_fork(self):
+        """In a forked child: drop the parent's connections (SQLite connections must not
+        cross a fork) without closing them, and replace a lock the parent may have held"""
+        self._lock = threading.Lock()
+        self._idle = []
+        self._closed = False
+        self.created = 0
+
+
+@contextmanager
+def migration_lock(db_path):
+    """Exclusive lock on '<db>.migrate.lock' held while one process migrates the schema"""
+    if fcntl is None:
+        yield
+        return
+    with open(f'{db_path}.migrate.lock', 'a') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+DB_CALL_SECONDS = metrics.Histogram(
+    'db_call_duration_seconds', 'Time spent in Database methods, including waiting for a connection', ['method'])
+
+
+@metrics.instrument_methods(DB_CALL_SECONDS, exclude=('get_connection', 'add_change_listener'))
 class Database:
-    def __init__(self, db_path='data/templates.db'):
-        import os
+    def __init__(self, db_path='data/templates.db', pool_size=None, migrate=True):
         os.makedirs(os.path.dirname(db_path), exist_ok=True)
         self.db_path = db_path
-        self.init_db()
+        if pool_size is None:
+            pool_size = int(os.environ.get('DB_POOL_SIZE', 5))
+        self.pool = ConnectionPool(db_path, pool_size)
+        # Callbacks invoked with a template_id whenever its rendered content may change
+        self.change_listeners = []
+        if migrate:
+            self.migrate()
+
+    def add_change_listener(self, callback):
+        self.change_listeners.append(callback)
+
+    def _notify_template_changed(self, template_id):
+        for callback in self.change_listeners:
+            callback(template_id)
 
     def get_connection(self):
-        conn = sqlite3.connect(self.db_path)
-        conn.row_factory = sqlite3.Row
-        return conn
+        """Borrow a pooled connection; conn.close() returns it to the pool"""
+        return self.pool.acquire()
 
-    def init_db(self):
+    def health_check(self):
+        """Run a trivial query and report pool state"""
         conn = self.get_connection()
-        cursor = conn.cursor()
+        try:
+            conn.execute('SELECT 1').fetchone()
+            journal_mode = conn.execute('PRAGMA journal_mode').fetchone()[0]
+            return {'ok': True, 'journal_mode': journal_mode, **self.pool.stats()}
+        except sqlite3.Error as e:
+            return {'ok': False, 'error': str(e), **self.pool.stats()}
+        finally:
+            conn.close()
 
-        # Check if templates table exists and needs migration
-        cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='templates'")
-        table_exists = cursor.fetchone()
-
-        if table_exists:
-            # Check if we need to migrate from old schema
-            cursor.execute("PRAGMA table_info(templates)")
-            columns = cursor.fetchall()
-
-            # Check constraints - if old schema, migrate
-            cursor.execute("SELECT sql FROM sqlite_master WHERE type='table' AND name='templates'")
-            table_sql = cursor.fetchone()
-            if table_sql and 'UNIQUE(host_type, vendor, os, name)' in table_sql[0]:
-                # Migrate from old schema
-                print("Migrating templates table to new schema...")
-                cursor.execute('''
-                    CREATE TABLE templates_new (
-                        id INTEGER PRIMARY KEY AUTOINCREMENT,
-                        name TEXT NOT NULL,
-                        host_type TEXT NOT NULL,
-                        vendor TEXT NOT NULL,
-                        os TEXT NOT NULL,
-                        template_content TEXT NOT NULL,
-                        description TEXT,
-                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                        UNIQUE(host_type, vendor, os)
-                    )
-                ''')
-
-                # Copy data - keep only the first template for each combination
-                cursor.execute('''
-                    INSERT INTO templates_new (id, name, host_type, vendor, os, template_content, description, created_at, updated_at)
-                    SELECT MIN(id), name, host_type, vendor, os, template_content, description, created_at, updated_at
-                    FROM templates
-                    GROUP BY host_type, vendor, os
-                ''')
-
-                cursor.execute('DROP TABLE templates')
-                cursor.execute('ALTER TABLE templates_new RENAME TO templates')
-                print("Migration complete!")
-
-        # Check if we need to migrate from vendor/os to port_type/switch_os
-        cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='templates'")
-        table_exists = cursor.fetchone()
-
-        if table_exists:
-            cursor.execute("PRAGMA table_info(templates)")
-            columns = {col[1]: col for col in cursor.fetchall()}
-
-            if 'vendor' in columns or 'os' in columns:
-                print("Migrating templates table from vendor/os to port_type/switch_os...")
-                cursor.execute('''
-                    CREATE TABLE templates_migrated (
-                        id INTEGER PRIMARY KEY AUTOINCREMENT,
-                        name TEXT NOT NULL,
-                        host_type TEXT NOT NULL,
-                        port_type TEXT NOT NULL,
-                        switch_os TEXT NOT NULL,
-                        template_content TEXT NOT NULL,
-                        description TEXT,
-                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                        UNIQUE(host_type, port_type, switch_os)
-                    )
-                ''')
-
-                cursor.execute('''
-                    INSERT INTO templates_migrated (id, name, host_type, port_type, switch_os, template_content, description, created_at, updated_at)
-                    SELECT id, name, host_type, vendor, os, template_content, description, created_at, updated_at
-                    FROM templates
-                ''')
-
-                cursor.execute('DROP TABLE templates')
-                cursor.execute('ALTER TABLE templates_migrated RENAME TO templates')
-                print("Templates table migration complete!")
-
-        # Templates table - ONE template per host_type/port_type/switch_os combination
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS templates (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                name TEXT NOT NULL,
-                host_type TEXT NOT NULL,
-                port_type TEXT NOT NULL,
-                switch_os TEXT NOT NULL,
-                active_version INTEGER DEFAULT 1,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                UNIQUE(host_type, port_type, switch_os)
-            )
-        ''')
-
-        # Check if old template_versions table exists with wrong schema and drop it first
-        cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='template_versions'")
-        if cursor.fetchone():
-            cursor.execute("PRAGMA table_info(template_versions)")
-            version_columns = {col[1]: col for col in cursor.fetchall()}
-
-            # If old schema (missing version_name), drop it
-            if 'version_name' not in version_columns:
-                print("Dropping old template_versions table with incompatible schema...")
-                cursor.execute('DROP TABLE template_versions')
-
-        # Migration: Rename version column to active_version and move content to versions table
-        cursor.execute("PRAGMA table_info(templates)")
-        columns = {col[1]: col for col in cursor.fetchall()}
-
-        if 'template_content' in columns:
-            print("Migrating templates to new version system...")
-
-            # Create new templates table
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS templates_new (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    name TEXT NOT NULL,
-                    host_type TEXT NOT NULL,
-                    port_type TEXT NOT NULL,
-                    switch_os TEXT NOT NULL,
-                    active_version INTEGER DEFAULT 1,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    UNIQUE(host_type, port_type, switch_os)
-                )
-            ''')
-
-            # Copy template metadata
-            cursor.execute('''
-                INSERT INTO templates_new (id, name, host_type, port_type, switch_os, active_version, created_at, updated_at)
-                SELECT id, name, host_type, port_type, switch_os,
-                       COALESCE(version, 1) as active_version,
-                       created_at, updated_at
-                FROM templates
-            ''')
-
-            # Get template content to migrate
-            cursor.execute('SELECT id, template_content, description, COALESCE(version, 1) as version FROM templates')
-            old_templates = cursor.fetchall()
-
-            # Drop old templates table and rename new one
-            cursor.execute('DROP TABLE templates')
-            cursor.execute('ALTER TABLE templates_new RENAME TO templates')
-            print("Templates table migration complete!")
-
-            # Now create template_versions table
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS template_versions (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    template_id INTEGER NOT NULL,
-                    version INTEGER NOT NULL,
-                    version_name TEXT NOT NULL,
-                    version_description TEXT,
-                    template_content TEXT NOT NULL,
-                    is_active INTEGER DEFAULT 0,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    UNIQUE(template_id, version),
-                    FOREIGN KEY (template_id) REFERENCES templates(id) ON DELETE CASCADE
-                )
-            ''')
-
-            # Migrate content to template_versions
-            for tmpl in old_templates:
-                cursor.execute('''
-                    INSERT INTO template_versions
-                    (template_id, version, version_name, version_description, template_content, is_active)
-                    VALUES (?, ?, ?, ?, ?, 1)
-                ''', (tmpl[0], tmpl[3], f'v{tmpl[3]}', tmpl[2], tmpl[1]))
-
-            print("Template versions migration complete!")
-        else:
-            # Create template_versions table if not migrating
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS template_versions (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    template_id INTEGER NOT NULL,
-                    version INTEGER NOT NULL,
-                    version_name TEXT NOT NULL,
-                    version_description TEXT,
-                    template_content TEXT NOT NULL,
-                    is_active INTEGER DEFAULT 0,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    UNIQUE(template_id, version),
-                    FOREIGN KEY (template_id) REFERENCES templates(id) ON DELETE CASCADE
-                )
-            ''')
-
-        # Host types table
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS host_types (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                name TEXT UNIQUE NOT NULL,
-                description TEXT
-            )
-        ''')
-
-        # Migrate vendors table to port_types
-        cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='vendors'")
-        if cursor.fetchone():
-            print("Migrating vendors table to port_types...")
-            cursor.execute('ALTER TABLE vendors RENAME TO port_types')
-            print("Vendors table renamed to port_types!")
-
-        # Port types table (formerly vendors)
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS port_types (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                name TEXT UNIQUE NOT NULL
-            )
-        ''')
-
-        # Migrate os_types to switch_os_types
-        cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='os_types'")
-        if cursor.fetchone():
-            print("Migrating os_types table to switch_os_types...")
-            cursor.execute('ALTER TABLE os_types RENAME TO switch_os_types')
-            print("OS types table renamed to switch_os_types!")
-
-        # Switch OS types table (formerly os_types)
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS switch_os_types (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                name TEXT NOT NULL UNIQUE
-            )
-        ''')
-
-        # Template fields table (for dynamic Excel column generation)
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS template_fields (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                template_id INTEGER NOT NULL,
-                field_name TEXT NOT NULL,
-                field_type TEXT NOT NULL,
-                required BOOLEAN DEFAULT 1,
-                default_value TEXT,
-                FOREIGN KEY (template_id) REFERENCES templates(id) ON DELETE CASCADE
-            )
-        ''')
-
-        # No default values - user will create their own host types, vendors (port types), and OS types
-
-        conn.commit()
-        conn.close()
+    def checkpoint(self):
+        """Fold the WAL back into the main database file (before copying it)"""
+        conn = self.get_connection()
+        try:
+            conn.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+        finally:
+            conn.close()
+
+    def close(self):
+        """Close every pooled connection; called on shutdown"""
+        self.pool.close()
+
+    def copy_to(self, path):
+        """Write a consistent snapshot of the database to path, while other connections keep writing"""
+        conn = self.get_connection()
+        try:
+            target = sqlite3.connect(path)
+            try:
+                conn.backup(target)
+            finally:
+                target.close()
+        finally:
+            conn.close()
+
+    def restore(self, source_path):
+        """Replace the database's contents with those of the SQLite file at source_path, in place.
+
+        SQLite's backup API copies the pages under the database's write lock, so the
+        file is never swapped out from under connections held by other processes
+        (gunicorn workers): they stay valid and read the restored contents on their
+        next query. source_path may be modified. An older layout is migrated afterwards.
+        """
+        source = sqlite3.connect(source_path)
+        try:
+            if source.execute('PRAGMA quick_check').fetchone()[0] != 'ok':
+                raise ValueError('The uploaded file is not an intact SQLite database')
+            conn = self.get_connection()
+            try:
+                # A WAL database cannot take pages of another size: convert the source instead
+                page_size = conn.execute('PRAGMA page_size').fetchone()[0]
+                if source.execute('PRAGMA page_size').fetchone()[0] != page_size:
+                    source.execute('PRAGMA journal_mode = DELETE')
+                    source.execute(f'PRAGMA page_size = {page_size}')
+                    source.execute('VACUUM')
+                source.backup(conn)
+            finally:
+                conn.close()
+        finally:
+            source.close()
+        self.migrate()
+
+    def schema_version(self):
+        conn = self.get_connection()
+        try:
+            return conn.execute('PRAGMA user_version').fetchone()[0]
+        finally:
+            conn.close()
+
+    def migrate(self):
+        """Apply pending migrations from migrations.py; returns True if any ran.
+
+        An up-to-date file costs a single PRAGMA read. Otherwise one process at a time
+        (gunicorn workers, a restarted container) takes the migration lock, re-checks
+        and migrates; the others wait for it and then find the schema current.
+        """
+        if self.schema_version() >= SCHEMA_VERSION:
+            return False
+        with migration_lock(self.db_path):
+            if self.schema_version() >= SCHEMA_VERSION:
+                return False
+            migrations.migrate(self.db_path)
+        return True
 
     # Template CRUD operations
     def create_template(self, name, host_type, port_type, switch_os, template_content, version_description='', fields=None):
@@ -270,9 +227,9 @@ class Database:
         try:
             # Create template metadata
             cursor.execute('''
-                INSERT INTO templates (name, host_type, port_type, switch_os, active_version)
-                VALUES (?, ?, ?, ?, 1)
-            ''', (name, host_type, port_type, switch_os))
+                INSERT INTO templates (name, name_folded, host_type, port_type, switch_os, active_version)
+                VALUES (?, ?, ?, ?, ?, 1)
+            ''', (name, migrations.fold_name(name), host_type, port_type, switch_os))
 
             template_id = cursor.lastrowid
 
@@ -293,65 +250,120 @@ class Database:
     def get_template(self, template_id):
         """Get template with its active version content"""
         conn = self.get_connection()
-        cursor = conn.cursor()
+        try:
+            cursor = conn.cursor()
 
-        cursor.execute('''
-            SELECT t.*, tv.template_content, tv.version_description
-            FROM templates t
-            LEFT JOIN template_versions tv ON t.id = tv.template_id AND tv.version = t.active_version
-            WHERE t.id = ?
-        ''', (template_id,))
+            cursor.execute('''
+                SELECT t.*, tv.template_content, tv.version_description
+                FROM templates t
+                LEFT JOIN template_versions tv ON t.id = tv.template_id AND tv.version = t.active_version
+                WHERE t.id = ?
+            ''', (template_id,))
 
-        template = cursor.fetchone()
-        conn.close()
+            template = cursor.fetchone()
+        finally:
+            conn.close()
         return dict(template) if template else None
 
     def get_template_by_name(self, name):
         """Get template by name (case-insensitive) with active version content"""
         conn = self.get_connection()
-        cursor = conn.cursor()
+        try:
+            cursor = conn.cursor()
 
-        cursor.execute('''
-            SELECT t.*, tv.template_content, tv.version_description
-            FROM templates t
-            LEFT JOIN template_versions tv ON t.id = tv.template_id AND tv.version = t.active_version
-            WHERE LOWER(t.name) = LOWER(?)
-        ''', (name,))
+            cursor.execute('''
+                SELECT t.*, tv.template_content, tv.version_description
+                FROM templates t
+                LEFT JOIN template_versions tv ON t.id = tv.template_id AND tv.version = t.active_version
+                WHERE t.name_folded = ?
+                ORDER BY t.id
+            ''', (migrations.fold_name(name),))
 
-        template = cursor.fetchone()
-        conn.close()
+            template = cursor.fetchone()
+        finally:
+            conn.close()
         return dict(template) if template else None
 
-    def get_templates_by_criteria(self, host_type=None, port_type=None, switch_os=None):
+    def get_templates_by_names(self, names):
+        """Resolve many template names (case-insensitive) in one query.
+
+        Returns a dict mapping each requested name to its template (with active
+        version content) or None when no template has that name.
+        """
+        names = list(dict.fromkeys(names))
+        # Folded exactly as templates.name_folded was, so every match maps back to its name
+        folded = list(dict.fromkeys(migrations.fold_name(name) for name in names))
+        found = {}
         conn = self.get_connection()
         cursor = conn.cursor()
 
-        query = 'SELECT * FROM templates WHERE 1=1'
-        params = []
-
-        if host_type:
-            query += ' AND host_type = ?'
-            params.append(host_type)
-        if port_type:
-            query += ' AND port_type = ?'
-            params.append(port_type)
-        if switch_os:
-            query += ' AND switch_os = ?'
-            params.append(switch_os)
-
-        cursor.execute(query, params)
-        templates = cursor.fetchall()
-        conn.close()
+        try:
+            # Stay well below SQLite's bound-parameter limit
+            for start in range(0, len(folded), 500):
+                chunk = folded[start:start + 500]
+                placeholders = ', '.join('?' for _ in chunk)
+                cursor.execute(f'''
+                    SELECT t.*, tv.template_content, tv.version_description
+                    FROM templates t
+                    LEFT JOIN template_versions tv ON t.id = tv.template_id AND tv.version = t.active_version
+                    WHERE t.name_folded IN ({placeholders})
+                    ORDER BY t.id
+                ''', chunk)
+                for row in cursor.fetchall():
+                    found.setdefault(row['name_folded'], dict(row))
+        finally:
+            conn.close()
+
+        return {name: found.get(migrations.fold_name(name)) for name in names}
+
+    def get_templates_by_criteria(self, host_type=None, port_type=None, switch_os=None):
+        conn = self.get_connection()
+        try:
+            cursor = conn.cursor()
+
+            query = 'SELECT * FROM templates WHERE 1=1'
+            params = []
+
+            if host_type:
+                query += ' AND host_type = ?'
+                params.append(host_type)
+            if port_type:
+                query += ' AND port_type = ?'
+                params.append(port_type)
+            if switch_os:
+                query += ' AND switch_os = ?'
+                params.append(switch_os)
+
+            cursor.execute(query, params)
+            templates = cursor.fetchall()
+        finally:
+            conn.close()
         return [dict(t) for t in templates]
 
     def get_all_templates(self):
         conn = self.get_connection()
-        cursor = conn.cursor()
-        cursor.execute('SELECT * FROM templates ORDER BY host_type, port_type, switch_os, name')
-        templates = cursor.fetchall()
-        conn.close()
+        try:
+            cursor = conn.cursor()
+            cursor.execute('SELECT * FROM templates ORDER BY host_type, port_type, switch_os, name')
+            templates = cursor.fetchall()
+        finally:
+            conn.close()
         return [dict(t) for t in templates]
 
+    def get_active_versions(self):
+        """id, name, active_version and template_content of every template's active version"""
+        conn = self.get_connection()
+        try:
+            rows = conn.execute('''
+                SELECT t.id, t.name, t.active_version, tv.template_content
+                FROM templates t
+                JOIN template_versions tv ON t.id = tv.template_id AND tv.version = t.active_version
+                ORDER BY t.id
+            ''').fetchall()
+        finally:
+            conn.close()
+        return [dict(row) for row in rows]
+
     def update_template(self, template_id, **kwargs):
         """Update template metadata only (name, host_type, port_type, switch_os)"""
         conn = self.get_connection()
@@ -366,6 +378,9 @@ class Database:
                 if key in allowed_fields:
                     updates.append(f'{key} = ?')
                     values.append(value)
+                    if key == 'name':
+                        updates.append('name_folded = ?')
+                        values.append(migrations.fold_name(value))
 
             if updates:
                 values.append(datetime.now())
@@ -386,112 +401,140 @@ class Database:
     def delete_template(self, template_id):
         conn = self.get_connection()
         cursor = conn.cursor()
-        cursor.execute('DELETE FROM templates WHERE id = ?', (template_id,))
-        conn.commit()
-        conn.close()
+        try:
+            cursor.execute('DELETE FROM templates WHERE id = ?', (template_id,))
+            conn.commit()
+        finally:
+            conn.close()
+        self._notify_template_changed(template_id)
 
     # Get metadata
     def get_host_types(self):
         conn = self.get_connection()
-        cursor = conn.cursor()
-        cursor.execute('SELECT name FROM host_types ORDER BY name')
-        results = cursor.fetchall()
-        conn.close()
+        try:
+            cursor = conn.cursor()
+            cursor.execute('SELECT name FROM host_types ORDER BY name')
+            results = cursor.fetchall()
+        finally:
+            conn.close()
         return [r['name'] for r in results]
 
     def get_port_types(self):
         conn = self.get_connection()
-        cursor = conn.cursor()
-        cursor.execute('SELECT name FROM port_types ORDER BY name')
-        results = cursor.fetchall()
-        conn.close()
+        try:
+            cursor = conn.cursor()
+            cursor.execute('SELECT name FROM port_types ORDER BY name')
+            results = cursor.fetchall()
+        finally:
+            conn.close()
         return [r['name'] for r in results]
 
     def get_switch_os_types(self):
         conn = self.get_connection()
-        cursor = conn.cursor()
-        cursor.execute('SELECT name FROM switch_os_types ORDER BY name')
-        results = cursor.fetchall()
-        conn.close()
+        try:
+            cursor = conn.cursor()
+            cursor.execute('SELECT name FROM switch_os_types ORDER BY name')
+            results = cursor.fetchall()
+        finally:
+            conn.close()
         return [r['name'] for r in results]
 
     def get_template_fields(self, template_id):
         conn = self.get_connection()
-        cursor = conn.cursor()
-        cursor.execute('SELECT * FROM template_fields WHERE template_id = ?', (template_id,))
-        fields = cursor.fetchall()
-        conn.close()
+        try:
+            cursor = conn.cursor()
+            cursor.execute('SELECT * FROM template_fields WHERE template_id = ?', (template_id,))
+            fields = cursor.fetchall()
+        finally:
+            conn.close()
         return [dict(f) for f in fields]
 
     # Metadata management
     def add_host_type(self, name, description=''):
         conn = self.get_connection()
         cursor = conn.cursor()
-        cursor.execute('INSERT INTO host_types (name, description) VALUES (?, ?)', (name, description))
-        conn.commit()
-        conn.close()
+        try:
+            cursor.execute('INSERT INTO host_types (name, description) VALUES (?, ?)', (name, description))
+            conn.commit()
+        finally:
+            # Always hand the connection back so a failed write cannot keep the database locked
+            conn.close()
 
     def remove_host_type(self, name):
         conn = self.get_connection()
         cursor = conn.cursor()
-        cursor.execute('DELETE FROM host_types WHERE name = ?', (name,))
-        conn.commit()
-        conn.close()
+        try:
+            cursor.execute('DELETE FROM host_types WHERE name = ?', (name,))
+            conn.commit()
+        finally:
+            conn.close()
 
     def add_port_type(self, name):
         conn = self.get_connection()
         cursor = conn.cursor()
-        cursor.execute('INSERT INTO port_types (name) VALUES (?)', (name,))
-        conn.commit()
-        conn.close()
+        try:
+            cursor.execute('INSERT INTO port_types (name) VALUES (?)', (name,))
+            conn.commit()
+        finally:
+            conn.close()
 
     def remove_port_type(self, name):
         conn = self.get_connection()
         cursor = conn.cursor()
-        cursor.execute('DELETE FROM port_types WHERE name = ?', (name,))
-        conn.commit()
-        conn.close()
+        try:
+            cursor.execute('DELETE FROM port_types WHERE name = ?', (name,))
+            conn.commit()
+        finally:
+            conn.close()
 
     def add_switch_os_type(self, name):
         conn = self.get_connection()
         cursor = conn.cursor()
-        cursor.execute('INSERT INTO switch_os_types (name) VALUES (?)', (name,))
-        conn.commit()
-        conn.close()
+        try:
+            cursor.execute('INSERT INTO switch_os_types (name) VALUES (?)', (name,))
+            conn.commit()
+        finally:
+            conn.close()
 
     def remove_switch_os_type(self, name):
         conn = self.get_connection()
         cursor = conn.cursor()
-        cursor.execute('DELETE FROM switch_os_types WHERE name = ?', (name,))
-        conn.commit()
-        conn.close()
+        try:
+            cursor.execute('DELETE FROM switch_os_types WHERE name = ?', (name,))
+            conn.commit()
+        finally:
+            conn.close()
 
     # Template versioning methods
     def get_template_versions(self, template_id):
         """Get all versions for a template"""
         conn = self.get_connection()
-        cursor = conn.cursor()
-        cursor.execute('''
-            SELECT * FROM template_versions
-            WHERE template_id = ?
-            ORDER BY version ASC
-        ''', (template_id,))
-        versions = cursor.fetchall()
-        conn.close()
+        try:
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT * FROM template_versions
+                WHERE template_id = ?
+                ORDER BY version ASC
+            ''', (template_id,))
+            versions = cursor.fetchall()
+        finally:
+            conn.close()
         return [dict(v) for v in versions]
 
     def get_template_version(self, template_id, version):
         """Get a specific version of a template with template metadata"""
         conn = self.get_connection()
-        cursor = conn.cursor()
-        cursor.execute('''
-            SELECT t.*, tv.version, tv.version_name, tv.version_description, tv.template_content, tv.is_active, tv.updated_at as version_updated_at
-            FROM templates t
-            JOIN template_versions tv ON t.id = tv.template_id
-            WHERE tv.template_id = ? AND tv.version = ?
-        ''', (template_id, version))
-        version_data = cursor.fetchone()
-        conn.close()
+        try:
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT t.*, tv.version, tv.version_name, tv.version_description, tv.template_content, tv.is_active, tv.updated_at as version_updated_at
+                FROM templates t
+                JOIN template_versions tv ON t.id = tv.template_id
+                WHERE tv.template_id = ? AND tv.version = ?
+            ''', (template_id, version))
+            version_data = cursor.fetchone()
+        finally:
+            conn.close()
         return dict(version_data) if version_data else None
 
     def create_template_version(self, template_id, template_content, version_name, version_description=''):
@@ -548,6 +591,7 @@ class Database:
             raise e
         finally:
             conn.close()
+        self._notify_template_changed(template_id)
 
     def delete_template_version(self, template_id, version):
         """Delete a specific version (cannot delete active version)"""
@@ -576,6 +620,7 @@ class Database:
             raise e
         finally:
             conn.close()
+        self._notify_template_changed(template_id)
 
     def set_active_version(self, template_id, version):
         """Set a version as the active/primary version"""
@@ -603,3 +648,4 @@ class Database:
             raise e
         finally:
             conn.close()
+        self._notify_template_changed(template_id)
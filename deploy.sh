@@ -50,7 +50,7 @@ git push origin main --tags -f
 # Step 3: Build Docker image with version tag
 echo ""
 echo "[3/7] Building Docker image: $IMAGE_NAME:$VERSION..."
-ssh $REMOTE_HOST "cd /root/jinja && docker build -t $IMAGE_NAME:$VERSION -t $IMAGE_NAME:latest ."
+ssh $REMOTE_HOST "cd /root/jinja && docker build --build-arg APP_VERSION=$VERSION -t $IMAGE_NAME:$VERSION -t $IMAGE_NAME:latest ."
 
 # Step 4: Stop current container
 echo ""
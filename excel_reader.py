@@ -0,0 +1,78 @@
+"""
+Streaming spreadsheet ingestion for the Config Generator.
+
+Rows are read one at a time (openpyxl read-only mode for .xlsx, the csv module
+for .csv) and yielded as dicts with blank cells already normalized to '', so a
+large sheet is never held as a DataFrame plus its filled and dict copies.
+"""
+import csv
+import io
+import re
+
+_INT_RE = re.compile(r'^-?\d+$')
+_FLOAT_RE = re.compile(r'^-?(\d+\.\d*|\.\d+)([eE][-+]?\d+)?$')
+
+
+def _column_names(header):
+    """Name columns like pandas: blank headers become 'Unnamed: N', duplicates get '.1', '.2' suffixes"""
+    columns = []
+    seen = {}
+    for index, name in enumerate(header):
+        name = f'Unnamed: {index}' if name is None or str(name).strip() == '' else str(name)
+        if name in seen:
+            seen[name] += 1
+            name = f'{name}.{seen[name]}'
+        else:
+            seen[name] = 0
+        columns.append(name)
+    return columns
+
+
+def _iter_records(columns, rows):
+    width = len(columns)
+    for values in rows:
+        if values is None or all(value is None or value == '' for value in values):
+            continue  # blank line
+        values = list(values[:width]) + [None] * (width - len(values))
+        yield {column: ('' if value is None else value) for column, value in zip(columns, values)}
+
+
+def _coerce(value):
+    """Turn numeric CSV text into numbers, as a spreadsheet would store them"""
+    if _INT_RE.match(value):
+        return int(value)
+    if _FLOAT_RE.match(value):
+        return float(value)
+    return value
+
+
+def _xlsx_rows(file):
+    from openpyxl import load_workbook
+
+    workbook = load_workbook(file, read_only=True, data_only=True)
+    try:
+        yield from workbook.worksheets[0].iter_rows(values_only=True)
+    finally:
+        workbook.close()
+
+
+def _csv_rows(file):
+    text = io.TextIOWrapper(file, encoding='utf-8-sig', newline='')
+    try:
+        for values in csv.reader(text):
+            yield [_coerce(value) for value in values]
+    finally:
+        text.detach()
+
+
+def open_sheet(file, filename):
+    """Open the first sheet of an .xlsx or .csv file object.
+
+    Returns (columns, rows) where rows is a lazy iterator of dicts keyed by column.
+    """
+    rows = _csv_rows(file) if filename.lower().endswith('.csv') else _xlsx_rows(file)
+    header = next(rows, None)
+    if header is None:
+        return [], iter(())
+    columns = _column_names(header)
+    return columns, _iter_records(columns, rows)
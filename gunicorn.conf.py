@@ -0,0 +1,59 @@
+"""
+Production server configuration: gunicorn -c gunicorn.conf.py wsgi:app
+
+Settings come from the environment so the same image can be sized per host:
+  GUNICORN_BIND        address to listen on (default 0.0.0.0:80)
+  GUNICORN_WORKERS     worker processes (default: min(2 * CPUs + 1, 8))
+  GUNICORN_THREADS     threads per worker (default 4)
+  GUNICORN_TIMEOUT     seconds before a silent worker is restarted (default 120; large generations)
+  GUNICORN_PRELOAD     import the app once in the master before forking (default 1)
+  GUNICORN_MAX_REQUESTS  recycle a worker after this many requests (default 0 = never)
+  PRECOMPILE_TEMPLATES   compile every active template version before forking workers (default 1)
+
+Graceful reload: `kill -HUP <master pid>` (or `docker kill -s HUP <container>`) starts
+fresh workers and lets the old ones finish their in-flight requests. With preload the
+master keeps the code it loaded, so a code upgrade needs a container restart (as
+local-update.sh does) or GUNICORN_PRELOAD=0.
+"""
+import os
+
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:80')
+workers = int(os.environ.get('GUNICORN_WORKERS', min(2 * (os.cpu_count() or 1) + 1, 8)))
+threads = int(os.environ.get('GUNICORN_THREADS', 4))
+worker_class = 'gthread'
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 120))
+graceful_timeout = int(os.environ.get('GUNICORN_GRACEFUL_TIMEOUT', 30))
+keepalive = 5
+preload_app = os.environ.get('GUNICORN_PRELOAD', '1') == '1'
+max_requests = int(os.environ.get('GUNICORN_MAX_REQUESTS', 0))
+max_requests_jitter = max_requests // 10
+
+# The app writes its own request/error log (logs/app.log); gunicorn's goes to stderr
+errorlog = '-'
+loglevel = os.environ.get('GUNICORN_LOG_LEVEL', 'info')
+
+# With several workers each process only sees its own in-memory log records, so the
+# live log tail reads the shared SQLite log store instead
+if workers > 1:
+    os.environ.setdefault('LOG_STREAM_SOURCE', 'store')
+
+# Each live log stream holds one of a worker's threads while it is open: keep at least
+# half of them free for ordinary requests
+os.environ.setdefault('LOG_STREAM_MAX_CLIENTS', str(max(1, threads // 2)))
+
+
+def on_starting(server):
+    # Deploy-time warm-up: load every active version from the compiled template store (compiling
+    # and storing any that are missing) so preloaded workers inherit them and never compile
+    if preload_app and os.environ.get('PRECOMPILE_TEMPLATES', '1') == '1':
+        import app
+        import warm_templates
+        warm_templates.warm(app.db, log=server.log.info)
+
+
+def post_fork(server, worker):
+    # Preloaded app state was created in the master: give this worker its own
+    # SQLite connections, logging thread and render pools
+    if preload_app:
+        import app
+        app.reset_after_fork()
@@ -0,0 +1,351 @@
+"""
+Background jobs for large config generation runs.
+
+Jobs are rows in a small SQLite database (data/jobs.db), so every gunicorn worker
+can submit, claim and report on them without a separate broker. Submitting only
+inserts a row; a few runner threads per process claim queued jobs, render them
+group by group and store each group's configs as it completes, so clients can
+poll progress and partial results or cancel. Finished jobs (and their results)
+are deleted once their TTL has passed.
+"""
+import json
+import os
+import threading
+import time
+import uuid
+from datetime import datetime
+
+from database import ConnectionPool
+
+# queued -> running -> done | failed | cancelled
+FINISHED = ('done', 'failed', 'cancelled')
+
+SUMMARY_COLUMNS = ('id, kind, status, created, started, finished, expires, group_count, groups_done, '
+                   'row_count, rows_rendered, success_row_count, error_row_count, skipped_row_count, '
+                   'cancel_requested, error')
+
+
+def _timestamp(value):
+    return datetime.fromtimestamp(value).strftime('%Y-%m-%d %H:%M:%S') if value else None
+
+
+class JobStore:
+    def __init__(self, db_path='data/jobs.db', pool_size=2, ttl=3600):
+        os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        self.db_path = db_path
+        self.ttl = ttl
+        self.pool = ConnectionPool(db_path, pool_size)
+        self.init_db()
+
+    def init_db(self):
+        conn = self.pool.acquire()
+        try:
+            conn.execute('PRAGMA journal_mode = WAL')
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id TEXT PRIMARY KEY,
+                    kind TEXT NOT NULL,
+                    status TEXT NOT NULL DEFAULT 'queued',
+                    params TEXT,
+                    created REAL NOT NULL,
+                    started REAL,
+                    finished REAL,
+                    heartbeat REAL,
+                    expires REAL,
+                    worker TEXT,
+                    group_count INTEGER DEFAULT 0,
+                    groups_done INTEGER DEFAULT 0,
+                    row_count INTEGER DEFAULT 0,
+                    rows_rendered INTEGER DEFAULT 0,
+                    success_row_count INTEGER DEFAULT 0,
+                    error_row_count INTEGER DEFAULT 0,
+                    skipped_row_count INTEGER DEFAULT 0,
+                    cancel_requested INTEGER DEFAULT 0,
+                    error TEXT
+                )
+            ''')
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS job_results (
+                    job_id TEXT NOT NULL,
+                    seq INTEGER NOT NULL,
+                    entries TEXT NOT NULL,
+                    PRIMARY KEY (job_id, seq)
+                )
+            ''')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs(status, created)')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_jobs_expires ON jobs(expires)')
+            conn.commit()
+        finally:
+            conn.close()
+
+    def submit(self, kind, params):
+        job_id = uuid.uuid4().hex
+        conn = self.pool.acquire()
+        try:
+            conn.execute('INSERT INTO jobs (id, kind, params, created) VALUES (?, ?, ?, ?)',
+                         (job_id, kind, json.dumps(params), time.time()))
+            conn.commit()
+        finally:
+            conn.close()
+        return job_id
+
+    def claim(self, worker):
+        """Mark the oldest queued job running for `worker`; returns (id, kind, params) or None"""
+        conn = self.pool.acquire()
+        try:
+            # BEGIN IMMEDIATE takes the write lock up front, so two processes never claim the same row
+            conn.execute('BEGIN IMMEDIATE')
+            row = conn.execute(
+                "SELECT id, kind, params FROM jobs WHERE status = 'queued' ORDER BY created LIMIT 1").fetchone()
+            if row is None:
+                conn.rollback()
+                return None
+            now = time.time()
+            conn.execute("UPDATE jobs SET status = 'running', worker = ?, started = ?, heartbeat = ? WHERE id = ?",
+                         (worker, now, now, row['id']))
+            conn.commit()
+            return row['id'], row['kind'], json.loads(row['params'])
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+
+    def set_totals(self, job_id, group_count, row_count, skipped_row_count):
+        conn = self.pool.acquire()
+        try:
+            conn.execute('UPDATE jobs SET group_count = ?, row_count = ?, skipped_row_count = ?, heartbeat = ? '
+                         'WHERE id = ?', (group_count, row_count, skipped_row_count, time.time(), job_id))
+            conn.commit()
+        finally:
+            conn.close()
+
+    def add_result(self, job_id, entries, success_rows, error_rows):
+        """Store one finished group and advance progress; returns False once cancellation was requested"""
+        conn = self.pool.acquire()
+        try:
+            seq = conn.execute('SELECT groups_done FROM jobs WHERE id = ?', (job_id,)).fetchone()
+            if seq is None:  # deleted while running
+                return False
+            conn.execute('INSERT INTO job_results (job_id, seq, entries) VALUES (?, ?, ?)',
+                         (job_id, seq[0] + 1, json.dumps(entries)))
+            conn.execute('''
+                UPDATE jobs SET groups_done = groups_done + 1,
+                                rows_rendered = rows_rendered + ?,
+                                success_row_count = success_row_count + ?,
+                                error_row_count = error_row_count + ?,
+                                heartbeat = ?
+                WHERE id = ?
+            ''', (success_rows + error_rows, success_rows, error_rows, time.time(), job_id))
+            cancelled = conn.execute('SELECT cancel_requested FROM jobs WHERE id = ?', (job_id,)).fetchone()[0]
+            conn.commit()
+            return not cancelled
+        finally:
+            conn.close()
+
+    def finish(self, job_id, status, error=None):
+        now = time.time()
+        conn = self.pool.acquire()
+        try:
+            # Inputs are no longer needed once the job has run; results stay until the TTL
+            conn.execute('UPDATE jobs SET status = ?, error = ?, finished = ?, expires = ?, params = NULL '
+                         'WHERE id = ?', (status, error, now, now + self.ttl, job_id))
+            conn.commit()
+        finally:
+            conn.close()
+
+    def cancel(self, job_id):
+        """Cancel a queued job now or ask a running one to stop after its current group.
+
+        Returns the job's status afterwards, or None if there is no such job.
+        """
+        now = time.time()
+        conn = self.pool.acquire()
+        try:
+            conn.execute("UPDATE jobs SET status = 'cancelled', cancel_requested = 1, finished = ?, expires = ?, "
+                         "params = NULL WHERE id = ? AND status = 'queued'", (now, now + self.ttl, job_id))
+            conn.execute("UPDATE jobs SET cancel_requested = 1 WHERE id = ? AND status = 'running'", (job_id,))
+            row = conn.execute('SELECT status FROM jobs WHERE id = ?', (job_id,)).fetchone()
+            conn.commit()
+            return row['status'] if row else None
+        finally:
+            conn.close()
+
+    def get(self, job_id):
+        conn = self.pool.acquire()
+        try:
+            row = conn.execute(f'SELECT {SUMMARY_COLUMNS} FROM jobs WHERE id = ?', (job_id,)).fetchone()
+        finally:
+            conn.close()
+        return self._summary(row) if row else None
+
+    def list(self, limit=50):
+        conn = self.pool.acquire()
+        try:
+            rows = conn.execute(f'SELECT {SUMMARY_COLUMNS} FROM jobs ORDER BY created DESC LIMIT ?',
+                                (limit,)).fetchall()
+        finally:
+            conn.close()
+        return [self._summary(row) for row in rows]
+
+    def results(self, job_id, since=0, limit=None):
+        """Stored groups after sequence number `since`; returns (entries, last seq)"""
+        conn = self.pool.acquire()
+        try:
+            rows = conn.execute('SELECT seq, entries FROM job_results WHERE job_id = ? AND seq > ? ORDER BY seq '
+                                'LIMIT ?', (job_id, since, -1 if limit is None else limit)).fetchall()
+        finally:
+            conn.close()
+        entries = [entry for row in rows for entry in json.loads(row['entries'])]
+        return entries, rows[-1]['seq'] if rows else since
+
+    def delete(self, job_id):
+        conn = self.pool.acquire()
+        try:
+            conn.execute('DELETE FROM job_results WHERE job_id = ?', (job_id,))
+            deleted = conn.execute('DELETE FROM jobs WHERE id = ?', (job_id,)).rowcount
+            conn.commit()
+            return deleted > 0
+        finally:
+            conn.close()
+
+    def cleanup(self, stale_after=None):
+        """Delete expired jobs; with stale_after, fail running jobs whose worker stopped reporting.
+
+        Returns (expired count, interrupted count).
+        """
+        now = time.time()
+        conn = self.pool.acquire()
+        try:
+            interrupted = 0
+            if stale_after:
+                interrupted = conn.execute(
+                    "UPDATE jobs SET status = 'failed', error = 'Interrupted: worker stopped', finished = ?, "
+                    "expires = ?, params = NULL WHERE status = 'running' AND heartbeat < ?",
+                    (now, now + self.ttl, now - stale_after)).rowcount
+            conn.execute('DELETE FROM job_results WHERE job_id IN (SELECT id FROM jobs WHERE expires < ?)', (now,))
+            expired = conn.execute('DELETE FROM jobs WHERE expires < ?', (now,)).rowcount
+            conn.commit()
+            return expired, interrupted
+        finally:
+            conn.close()
+
+    def counts(self):
+        """Number of jobs per status"""
+        conn = self.pool.acquire()
+        try:
+            return {row['status']: row['n'] for row in
+                    conn.execute('SELECT status, COUNT(*) AS n FROM jobs GROUP BY status')}
+        finally:
+            conn.close()
+
+    def close(self):
+        self.pool.close()
+
+    @staticmethod
+    def _summary(row):
+        job = dict(row)
+        job['cancel_requested'] = bool(job['cancel_requested'])
+        for key in ('created', 'started', 'finished', 'expires'):
+            job[key] = _timestamp(job[key])
+        return job
+
+
+class JobCancelled(Exception):
+    """Raised by a job handler to stop early; the job ends as 'cancelled'"""
+
+
+class JobRunner:
+    """Worker threads that claim queued jobs and pass them to handlers[kind](job_id, params).
+
+    Threads start on the first ensure_started() call in each process, never in a
+    gunicorn master that preloads the app and then forks. New jobs submitted in
+    this process wake a worker immediately; jobs from other processes are picked
+    up on the next poll.
+    """
+
+    def __init__(self, store, handlers, workers=2, poll_interval=1.0, stale_after=600, wrap=None, logger=None):
+        self.store = store
+        self.handlers = handlers
+        self.workers = workers
+        self.poll_interval = poll_interval
+        self.stale_after = stale_after
+        # Context manager factory entered around each job (e.g. app.app_context)
+        self.wrap = wrap
+        self._pid = None
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._threads = []
+        self._last_cleanup = 0.0
+        self.logger = logger
+
+    def ensure_started(self):
+        if self._pid == os.getpid() or self.workers <= 0:
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._stop.clear()
+            self._threads = [threading.Thread(target=self._run, name=f'job-worker-{i}', daemon=True)
+                             for i in range(self.workers)]
+            for thread in self._threads:
+                thread.start()
+
+    def notify(self):
+        self._wakeup.set()
+
+    def stop(self, timeout=5):
+        self._stop.set()
+        self._wakeup.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+        self._pid = None
+
+    def _run(self):
+        worker = f'{os.getpid()}:{threading.current_thread().name}'
+        while not self._stop.is_set():
+            try:
+                self._maybe_cleanup()
+                job = self.store.claim(worker)
+            except Exception as e:
+                self._log('error', f'Job queue unavailable: {e}')
+                job = None
+            if job is None:
+                self._wakeup.wait(self.poll_interval)
+                self._wakeup.clear()
+                continue
+            self._execute(*job)
+
+    def _execute(self, job_id, kind, params):
+        handler = self.handlers.get(kind)
+        try:
+            if handler is None:
+                raise ValueError(f'Unknown job kind: {kind}')
+            if self.wrap:
+                with self.wrap():
+                    handler(job_id, params)
+            else:
+                handler(job_id, params)
+            status, error = 'done', None
+        except JobCancelled:
+            status, error = 'cancelled', None
+        except Exception as e:
+            self._log('error', f'Job {job_id} failed: {e}')
+            status, error = 'failed', str(e)
+        self.store.finish(job_id, status, error)
+
+    def _maybe_cleanup(self):
+        now = time.monotonic()
+        if now - self._last_cleanup < 60:
+            return
+        self._last_cleanup = now
+        expired, interrupted = self.store.cleanup(self.stale_after)
+        if expired or interrupted:
+            self._log('info', f'Job cleanup: {expired} expired, {interrupted} interrupted')
+
+    def _log(self, level, message):
+        if self.logger:
+            getattr(self.logger, level)(message)
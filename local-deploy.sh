@@ -36,7 +36,7 @@ fi
 
 # Build Docker image
 echo "🔨 Building Docker image..."
-docker build -t jinja-app . || {
+docker build --build-arg APP_VERSION="$(git describe --tags --always 2>/dev/null)" -t jinja-app . || {
     echo "❌ Failed to build Docker image"
     exit 1
 }
@@ -27,7 +27,7 @@ git pull || {
 
 echo ""
 echo "🔨 Rebuilding Docker image..."
-docker build -t jinja-app . || {
+docker build --build-arg APP_VERSION="$(git describe --tags --always 2>/dev/null)" -t jinja-app . || {
     echo "❌ Failed to build Docker image"
     exit 1
 }
@@ -56,10 +56,8 @@ echo "📱 Application is running at: http://localhost"
 echo ""
 
 # Show current version
-if docker exec jinja-template-app test -d .git 2>/dev/null; then
-    VERSION=$(docker exec jinja-template-app git describe --tags --always 2>/dev/null || echo "unknown")
-    echo "Current version: $VERSION"
-fi
+VERSION=$(docker exec jinja-template-app cat VERSION 2>/dev/null || echo "unknown")
+echo "Current version: $VERSION"
 
 echo ""
 echo "Opening browser..."
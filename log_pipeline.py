@@ -0,0 +1,214 @@
+"""
+Asynchronous logging pipeline pieces.
+
+Request threads only put records on a queue (QueueHandler); a background
+QueueListener thread runs the real handlers (file, console, buffer, SQLite) and
+times each of them. A rate-limit filter keeps high-volume debug call sites from
+flooding the queue, and a broadcaster fans new entries out to live-tail clients.
+"""
+import copy
+import logging
+import os
+import threading
+import time
+from collections import deque
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+
+try:
+    import fcntl
+except ImportError:  # Windows: single-process only
+    fcntl = None
+
+
+class RateLimitFilter(logging.Filter):
+    """Let through at most `burst` records per call site every `interval` seconds.
+
+    Only records at or below max_level are limited. When a window ends with
+    suppressed records, the next record that gets through says how many were dropped.
+    """
+
+    def __init__(self, burst=20, interval=10.0, max_level=logging.DEBUG):
+        super().__init__()
+        self.burst = burst
+        self.interval = interval
+        self.max_level = max_level
+        self.suppressed_total = 0
+        self._windows = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        if record.levelno > self.max_level:
+            return True
+
+        key = (record.name, record.pathname, record.lineno)
+        now = time.monotonic()
+        with self._lock:
+            window = self._windows.get(key)
+            if window is None or now - window[0] >= self.interval:
+                suppressed = window[2] if window else 0
+                self._windows[key] = [now, 1, 0]
+                if suppressed:
+                    record.msg = f'{record.msg} ({suppressed} similar messages suppressed)'
+                return True
+            if window[1] < self.burst:
+                window[1] += 1
+                return True
+            window[2] += 1
+            self.suppressed_total += 1
+            return False
+
+
+class DeferredQueueHandler(QueueHandler):
+    """QueueHandler that leaves formatting to the handlers behind the listener.
+
+    The stock prepare() folds the traceback into the message, which would move it
+    in front of the file format's "[in path:line]" suffix; here the message is only
+    merged with its args and the traceback is kept in exc_text.
+    """
+
+    def prepare(self, record):
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+class TimedQueueListener(QueueListener):
+    """QueueListener that records how long each handler spends per record"""
+
+    def __init__(self, queue, *handlers, respect_handler_level=True):
+        super().__init__(queue, *handlers, respect_handler_level=respect_handler_level)
+        self._stats = {self._handler_name(h): {'count': 0, 'total_seconds': 0.0, 'max_seconds': 0.0}
+                       for h in handlers}
+        self._stats_lock = threading.Lock()
+
+    @staticmethod
+    def _handler_name(handler):
+        return handler.get_name() or type(handler).__name__
+
+    def handle(self, record):
+        record = self.prepare(record)
+        for handler in self.handlers:
+            if self.respect_handler_level and record.levelno < handler.level:
+                continue
+            start = time.perf_counter()
+            handler.handle(record)
+            elapsed = time.perf_counter() - start
+            with self._stats_lock:
+                stats = self._stats[self._handler_name(handler)]
+                stats['count'] += 1
+                stats['total_seconds'] += elapsed
+                stats['max_seconds'] = max(stats['max_seconds'], elapsed)
+
+    def stats(self):
+        with self._stats_lock:
+            return {
+                name: {
+                    'count': s['count'],
+                    'avg_ms': round(s['total_seconds'] / s['count'] * 1000, 3) if s['count'] else 0.0,
+                    'max_ms': round(s['max_seconds'] * 1000, 3),
+                    'total_ms': round(s['total_seconds'] * 1000, 3)
+                }
+                for name, s in self._stats.items()
+            }
+
+
+class SharedRotatingFileHandler(RotatingFileHandler):
+    """RotatingFileHandler for a log file written by several processes (gunicorn workers).
+
+    Rollover runs under an exclusive lock on '<file>.lock' and is skipped if another
+    process already rotated; a process whose open file was rotated away reopens the
+    new one before writing instead of appending to a backup.
+    """
+
+    def _reopen_if_rotated(self):
+        if self.stream is None:
+            return
+        try:
+            current = os.stat(self.baseFilename).st_ino
+        except FileNotFoundError:
+            current = None
+        if current != os.fstat(self.stream.fileno()).st_ino:
+            self.stream.close()
+            self.stream = self._open()
+
+    def shouldRollover(self, record):
+        self._reopen_if_rotated()
+        return super().shouldRollover(record)
+
+    def doRollover(self):
+        if fcntl is None:
+            return super().doRollover()
+        with open(f'{self.baseFilename}.lock', 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                self._reopen_if_rotated()
+                # Another process may have rotated while we waited for the lock
+                if os.path.exists(self.baseFilename) and os.path.getsize(self.baseFilename) < self.maxBytes:
+                    return
+                super().doRollover()
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+class LogSubscriber:
+    """Bounded per-client queue; when full the oldest entry is dropped and counted"""
+
+    def __init__(self, max_queue=200):
+        self.max_queue = max_queue
+        self.entries = deque()
+        self.dropped = 0
+        self._condition = threading.Condition()
+
+    def push(self, entry):
+        with self._condition:
+            if len(self.entries) >= self.max_queue:
+                self.entries.popleft()
+                self.dropped += 1
+            self.entries.append(entry)
+            self._condition.notify()
+
+    def drain(self, timeout):
+        """Wait up to timeout for entries; returns (entries, dropped since last drain)"""
+        with self._condition:
+            if not self.entries:
+                self._condition.wait(timeout)
+            entries = list(self.entries)
+            self.entries.clear()
+            dropped, self.dropped = self.dropped, 0
+        return entries, dropped
+
+
+class LogBroadcaster:
+    """Fans log entries out to live subscribers (e.g. SSE clients) without ever blocking the publisher"""
+
+    def __init__(self, max_subscribers=20):
+        self.max_subscribers = max_subscribers
+        self._subscribers = set()
+        self._lock = threading.Lock()
+
+    def subscribe(self, max_queue=200):
+        """Return a new subscriber, or None when the subscriber limit is reached"""
+        with self._lock:
+            if len(self._subscribers) >= self.max_subscribers:
+                return None
+            subscriber = LogSubscriber(max_queue)
+            self._subscribers.add(subscriber)
+            return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self._lock:
+            self._subscribers.discard(subscriber)
+
+    def publish(self, entry):
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for subscriber in subscribers:
+            subscriber.push(entry)
+
+    def subscriber_count(self):
+        with self._lock:
+            return len(self._subscribers)
@@ -0,0 +1,98 @@
+"""
+Tail-oriented reader for logs/app.log and its RotatingFileHandler backups.
+
+Files are read backwards in fixed-size blocks, newest file first, and parsing
+stops as soon as enough matching entries are found (or the requested time range
+has been passed), so the cost depends on the number of entries requested rather
+than on the size of the log.
+"""
+import os
+import re
+
+# Format: 2026-01-01 20:51:09,668 INFO: User uploaded Excel file: template_JINJA-XC-DATA.xlsx [in /app/app.py:295]
+LOG_PATTERN = re.compile(r'(\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}),\d+ (\w+): (.+) \[in (.+?):(\d+)\]')
+
+BLOCK_SIZE = 64 * 1024
+
+
+def reverse_lines(path, block_size=BLOCK_SIZE):
+    """Yield the lines of a file from last to first without reading the whole file"""
+    with open(path, 'rb') as f:
+        f.seek(0, os.SEEK_END)
+        position = f.tell()
+        remainder = b''
+        while position > 0:
+            read_size = min(block_size, position)
+            position -= read_size
+            f.seek(position)
+            lines = (f.read(read_size) + remainder).split(b'\n')
+            # The first piece may be the tail of a line that starts in the previous block
+            remainder = lines.pop(0)
+            for line in reversed(lines):
+                if line:
+                    yield line.decode('utf-8', errors='ignore')
+        if remainder:
+            yield remainder.decode('utf-8', errors='ignore')
+
+
+def parse_line(line):
+    match = LOG_PATTERN.match(line)
+    if not match:
+        return None
+    timestamp, level, message, filepath, line_no = match.groups()
+    return {
+        'timestamp': timestamp,
+        'level': level,
+        'message': message,
+        'module': os.path.basename(filepath).replace('.py', ''),
+        'line': int(line_no)
+    }
+
+
+def normalize_time(value):
+    """Accept 'YYYY-MM-DD HH:MM[:SS]' or ISO 'YYYY-MM-DDTHH:MM[:SS]' for comparison with log timestamps"""
+    return value.replace('T', ' ') if value else None
+
+
+def log_files(log_file):
+    """The active log file followed by its rotated backups (app.log.1, app.log.2, ...), newest first"""
+    files = [log_file] if os.path.exists(log_file) else []
+    index = 1
+    while os.path.exists(f'{log_file}.{index}'):
+        files.append(f'{log_file}.{index}')
+        index += 1
+    return files
+
+
+def matches(entry, level='all', until=None):
+    if level != 'all' and entry['level'] != level:
+        return False
+    # Timestamps are fixed-width, so string comparison orders them correctly
+    return not until or entry['timestamp'][:len(until)] <= until
+
+
+def tail_logs(log_file, limit, level='all', since=None, until=None):
+    """Return up to `limit` most recent entries (oldest first) across the log and its backups"""
+    since, until = normalize_time(since), normalize_time(until)
+    entries = []
+    for path in log_files(log_file):
+        for line in reverse_lines(path):
+            entry = parse_line(line)
+            if entry is None:
+                continue
+            if since and entry['timestamp'][:len(since)] < since:
+                # Everything further back is older still
+                return entries[::-1]
+            if matches(entry, level, until):
+                entries.append(entry)
+                if len(entries) >= limit:
+                    return entries[::-1]
+    return entries[::-1]
+
+
+def filter_entries(entries, limit, level='all', since=None, until=None):
+    """Apply the same filters to already-parsed entries (e.g. the in-memory log buffer)"""
+    since, until = normalize_time(since), normalize_time(until)
+    selected = [e for e in entries
+                if matches(e, level, until) and not (since and e['timestamp'][:len(since)] < since)]
+    return selected[-limit:] if limit else selected
@@ -0,0 +1,148 @@
+"""
+Structured log sink: every app log record is stored as a row in a small SQLite
+database (logs/app_logs.db) with indexes on time, level and module, so the Logs
+tab can page through and poll for new entries without re-parsing log text.
+
+Retention is bounded like the rotating text logs: rows older than max_age seconds
+and all but the newest max_rows are pruned, at most every prune_interval seconds
+from write() (i.e. on the log listener thread).
+"""
+import logging
+import os
+import time
+from datetime import datetime
+from database import ConnectionPool
+
+
+class LogStore:
+    def __init__(self, db_path='logs/app_logs.db', pool_size=2, max_rows=None, max_age=None, prune_interval=60):
+        os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        self.db_path = db_path
+        self.pool = ConnectionPool(db_path, pool_size)
+        self.max_rows = max_rows
+        self.max_age = max_age
+        self.prune_interval = prune_interval
+        self._next_prune = 0
+        self.init_db()
+
+    def init_db(self):
+        conn = self.pool.acquire()
+        try:
+            conn.execute('PRAGMA journal_mode = WAL')
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS logs (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    created REAL NOT NULL,
+                    timestamp TEXT NOT NULL,
+                    level TEXT NOT NULL,
+                    module TEXT,
+                    line INTEGER,
+                    message TEXT
+                )
+            ''')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_logs_created ON logs(created)')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_logs_level ON logs(level, id)')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_logs_module ON logs(module, id)')
+            conn.commit()
+        finally:
+            conn.close()
+
+    def write(self, records):
+        """Insert records; each gets its row id as record.log_id (handlers after this one can use it)"""
+        conn = self.pool.acquire()
+        try:
+            for r in records:
+                r.log_id = conn.execute(
+                    'INSERT INTO logs (created, timestamp, level, module, line, message) VALUES (?, ?, ?, ?, ?, ?)',
+                    (r.created, datetime.fromtimestamp(r.created).strftime('%Y-%m-%d %H:%M:%S'),
+                     r.levelname, r.module, r.lineno, r.getMessage())
+                ).lastrowid
+            conn.commit()
+        finally:
+            conn.close()
+        if (self.max_rows or self.max_age) and time.time() >= self._next_prune:
+            self._next_prune = time.time() + self.prune_interval
+            self.prune()
+
+    def prune(self):
+        """Delete rows beyond max_rows / older than max_age; returns the number deleted"""
+        conn = self.pool.acquire()
+        try:
+            deleted = 0
+            if self.max_age:
+                deleted += conn.execute('DELETE FROM logs WHERE created < ?', (time.time() - self.max_age,)).rowcount
+            if self.max_rows:
+                deleted += conn.execute(
+                    'DELETE FROM logs WHERE id <= (SELECT id FROM logs ORDER BY id DESC LIMIT 1 OFFSET ?)',
+                    (self.max_rows,)
+                ).rowcount
+            conn.commit()
+        finally:
+            conn.close()
+        return deleted
+
+    def query(self, level=None, module=None, since_id=None, before_id=None, limit=100):
+        """Return (entries oldest first, has_more).
+
+        since_id polls forward: entries newer than the cursor, oldest first.
+        Otherwise pages backward from before_id (or the newest entry).
+        """
+        conditions = []
+        params = []
+        if level and level != 'all':
+            conditions.append('level = ?')
+            params.append(level)
+        if module:
+            conditions.append('module = ?')
+            params.append(module)
+
+        if since_id is not None:
+            conditions.append('id > ?')
+            params.append(since_id)
+            order = 'ASC'
+        else:
+            if before_id is not None:
+                conditions.append('id < ?')
+                params.append(before_id)
+            order = 'DESC'
+
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ''
+        conn = self.pool.acquire()
+        try:
+            rows = conn.execute(
+                f'SELECT id, timestamp, level, message, module, line FROM logs {where} ORDER BY id {order} LIMIT ?',
+                params + [limit + 1]
+            ).fetchall()
+        finally:
+            conn.close()
+
+        has_more = len(rows) > limit
+        entries = [dict(row) for row in rows[:limit]]
+        if order == 'DESC':
+            entries.reverse()
+        return entries, has_more
+
+    def clear(self):
+        conn = self.pool.acquire()
+        try:
+            conn.execute('DELETE FROM logs')
+            conn.commit()
+        finally:
+            conn.close()
+
+    def close(self):
+        self.pool.close()
+
+
+class SQLiteLogHandler(logging.Handler):
+    """Writes records to a LogStore; meant to run behind a QueueListener, off the request thread"""
+
+    def __init__(self, store):
+        super().__init__()
+        self.store = store
+
+    def emit(self, record):
+        try:
+            self.store.write([record])
+        except Exception:
+            self.handleError(record)
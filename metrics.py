@@ -0,0 +1,222 @@
+"""
+In-process metrics exported at /metrics in the Prometheus text format.
+
+Histograms record latencies and sizes (DB calls, template compile/render, sheet
+reading); collectors report point-in-time stats such as cache and pool counters
+when the endpoint is scraped. Set METRICS_ENABLED=0 to turn recording into a
+single flag check per call.
+
+trace() additionally hands every timed observation in the current context to a
+callback (used by per-request profiling), whether or not recording is enabled.
+"""
+import contextlib
+import contextvars
+import functools
+import os
+import threading
+import time
+from bisect import bisect_left
+
+_enabled = os.environ.get('METRICS_ENABLED', '1') == '1'
+_trace_sink = contextvars.ContextVar('metrics_trace_sink', default=None)
+
+# Seconds, from sub-millisecond DB lookups up to slow renders
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# Bytes of rendered output
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+# Rows per sheet / per template group
+ROW_BUCKETS = (1, 10, 50, 100, 500, 1000, 5000, 10000, 50000, 100000)
+
+
+def is_enabled():
+    return _enabled
+
+
+def set_enabled(enabled):
+    global _enabled
+    _enabled = bool(enabled)
+
+
+@contextlib.contextmanager
+def trace(sink):
+    """Call sink(metric name, labels, seconds) for each timer that finishes inside this block"""
+    token = _trace_sink.set(sink)
+    try:
+        yield
+    finally:
+        _trace_sink.reset(token)
+
+
+def _timing_active():
+    return _enabled or _trace_sink.get() is not None
+
+
+def _finish_timing(histogram, labels, elapsed):
+    histogram.observe(elapsed, **labels)
+    sink = _trace_sink.get()
+    if sink is not None:
+        sink(histogram.name, labels, elapsed)
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    escaped = (str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for v in labels.values())
+    return '{' + ','.join(f'{k}="{v}"' for k, v in zip(labels, escaped)) + '}'
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+        self._collectors = []
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            self._metrics.append(metric)
+        return metric
+
+    def register_collector(self, collector):
+        """collector() returns an iterable of (name, type, help, [(labels dict, value), ...])"""
+        with self._lock:
+            self._collectors.append(collector)
+
+    def exposition(self):
+        """Render every metric in the Prometheus text exposition format"""
+        lines = []
+        with self._lock:
+            metrics = list(self._metrics)
+            collectors = list(self._collectors)
+        for metric in metrics:
+            lines.extend(metric.exposition())
+        for collector in collectors:
+            for name, metric_type, documentation, samples in collector():
+                lines.append(f'# HELP {name} {documentation}')
+                lines.append(f'# TYPE {name} {metric_type}')
+                for labels, value in samples:
+                    lines.append(f'{name}{_format_labels(labels)} {_format_value(value)}')
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+
+class _Timer:
+    """Context manager / decorator observing elapsed seconds into a histogram"""
+    __slots__ = ('histogram', 'labels', 'start')
+
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+        self.start = None
+
+    def __enter__(self):
+        self.start = time.perf_counter() if _timing_active() else None
+        return self
+
+    def __exit__(self, *exc_info):
+        if self.start is not None:
+            _finish_timing(self.histogram, self.labels, time.perf_counter() - self.start)
+        return False
+
+    def __call__(self, func):
+        histogram, labels = self.histogram, self.labels
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _timing_active():
+                return func(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                _finish_timing(histogram, labels, time.perf_counter() - start)
+        return wrapper
+
+
+class Counter:
+    def __init__(self, name, documentation, labelnames=(), registry=REGISTRY):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        registry.register(self)
+
+    def inc(self, amount=1, **labels):
+        if not _enabled:
+            return
+        key = tuple(labels[name] for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def exposition(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} counter']
+        with self._lock:
+            values = sorted(self._values.items())
+        for key, value in values:
+            lines.append(f'{self.name}{_format_labels(dict(zip(self.labelnames, key)))} {_format_value(value)}')
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS, registry=REGISTRY):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # label values -> [per-bucket counts (last one is +Inf), sum, count]
+        self._series = {}
+        self._lock = threading.Lock()
+        registry.register(self)
+
+    def observe(self, value, **labels):
+        if not _enabled:
+            return
+        key = tuple(labels[name] for name in self.labelnames)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def time(self, **labels):
+        """Time a block (`with h.time(...)`) or a function (`@h.time(...)`)"""
+        return _Timer(self, labels)
+
+    def exposition(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            series = sorted((key, (list(s[0]), s[1], s[2])) for key, s in self._series.items())
+        for key, (bucket_counts, total, count) in series:
+            labels = dict(zip(self.labelnames, key))
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), bucket_counts):
+                cumulative += bucket_count
+                bucket_labels = _format_labels({**labels, 'le': _format_value(float(bound))})
+                lines.append(f'{self.name}_bucket{bucket_labels} {cumulative}')
+            lines.append(f'{self.name}_sum{_format_labels(labels)} {_format_value(total)}')
+            lines.append(f'{self.name}_count{_format_labels(labels)} {count}')
+        return lines
+
+
+def instrument_methods(histogram, label='method', exclude=()):
+    """Class decorator timing every public method into histogram, labelled by method name"""
+    def decorate(cls):
+        for name, attr in list(vars(cls).items()):
+            if name.startswith('_') or name in exclude or not callable(attr):
+                continue
+            setattr(cls, name, histogram.time(**{label: name})(attr))
+        return cls
+    return decorate
@@ -0,0 +1,300 @@
+"""
+Numbered schema migrations for data/templates.db.
+
+Each migration runs as one transaction together with the PRAGMA user_version bump
+that records it, and moves data with set-based INSERT ... SELECT statements
+instead of Python row loops. A file at the latest version is never inspected.
+Migrations 1-4 upgrade layouts written by older releases and do nothing on other
+files; migration 5 creates whatever is still missing (everything, for a new file).
+
+Migration 6 stores each template name folded with Python's str.casefold(), which
+Database uses for case-insensitive name lookups (COLLATE NOCASE only folds ASCII).
+
+Files stamped user_version 1 by the previous init_db() already had the final
+layout, so the remaining migrations are no-ops for them.
+
+Usage: python migrations.py [db_path] [--dry-run] [--status]
+"""
+import argparse
+import os
+import re
+import sqlite3
+import time
+from pathlib import Path
+
+MIGRATIONS = []
+
+TEMPLATES_TABLE = '''
+    CREATE TABLE {name} (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        name TEXT NOT NULL,
+        host_type TEXT NOT NULL,
+        port_type TEXT NOT NULL,
+        switch_os TEXT NOT NULL,
+        active_version INTEGER DEFAULT 1,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        UNIQUE(host_type, port_type, switch_os)
+    )
+'''
+
+TEMPLATE_VERSIONS_TABLE = '''
+    CREATE TABLE IF NOT EXISTS template_versions (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        template_id INTEGER NOT NULL,
+        version INTEGER NOT NULL,
+        version_name TEXT NOT NULL,
+        version_description TEXT,
+        template_content TEXT NOT NULL,
+        is_active INTEGER DEFAULT 0,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        UNIQUE(template_id, version),
+        FOREIGN KEY (template_id) REFERENCES templates(id) ON DELETE CASCADE
+    )
+'''
+
+
+def fold_name(name):
+    """The case-insensitive form of a template name, as stored in templates.name_folded"""
+    return name.casefold() if name is not None else None
+
+
+def migration(version, description):
+    """Register fn(conn) as migration `version`; it runs inside an open transaction"""
+    def register(fn):
+        MIGRATIONS.append((version, description, fn))
+        MIGRATIONS.sort(key=lambda m: m[0])
+        return fn
+    return register
+
+
+def table_exists(conn, name):
+    return conn.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name=?", (name,)).fetchone() is not None
+
+
+def table_columns(conn, name):
+    return [row[1] for row in conn.execute(f'PRAGMA table_info({name})')]
+
+
+def table_sql(conn, name):
+    row = conn.execute("SELECT sql FROM sqlite_master WHERE type='table' AND name=?", (name,)).fetchone()
+    return row[0] if row else ''
+
+
+@migration(1, 'Keep one template per host_type/vendor/os (oldest name-unique layout)')
+def dedupe_templates(conn):
+    if 'UNIQUE(host_type, vendor, os, name)' not in table_sql(conn, 'templates'):
+        return
+    columns = table_columns(conn, 'templates')
+    # Same columns, per-combination constraint; the lowest id of each combination is kept.
+    # Build-drop-rename (not rename-build) so foreign keys naming templates stay valid.
+    definition = table_sql(conn, 'templates').replace('UNIQUE(host_type, vendor, os, name)',
+                                                      'UNIQUE(host_type, vendor, os)')
+    conn.execute(re.sub(r'^CREATE TABLE\s+"?templates"?', 'CREATE TABLE templates_deduped', definition))
+    column_list = ', '.join(columns)
+    conn.execute(f'''
+        INSERT INTO templates_deduped ({column_list})
+        SELECT {column_list} FROM templates
+        WHERE id IN (SELECT MIN(id) FROM templates GROUP BY host_type, vendor, os)
+    ''')
+    conn.execute('DROP TABLE templates')
+    conn.execute('ALTER TABLE templates_deduped RENAME TO templates')
+    # What ON DELETE CASCADE would have done for the dropped duplicates
+    if table_exists(conn, 'template_fields'):
+        conn.execute('DELETE FROM template_fields WHERE template_id NOT IN (SELECT id FROM templates)')
+
+
+@migration(2, 'Rename templates.vendor/os to port_type/switch_os')
+def rename_vendor_os_columns(conn):
+    if not table_exists(conn, 'templates'):
+        return
+    columns = table_columns(conn, 'templates')
+    if 'vendor' in columns:
+        conn.execute('ALTER TABLE templates RENAME COLUMN vendor TO port_type')
+    if 'os' in columns:
+        conn.execute('ALTER TABLE templates RENAME COLUMN os TO switch_os')
+
+
+@migration(3, 'Rename vendors/os_types tables to port_types/switch_os_types')
+def rename_type_tables(conn):
+    for old, new in (('vendors', 'port_types'), ('os_types', 'switch_os_types')):
+        if not table_exists(conn, old):
+            continue
+        if table_exists(conn, new):
+            conn.execute(f'INSERT OR IGNORE INTO {new} (name) SELECT name FROM {old}')
+            conn.execute(f'DROP TABLE {old}')
+        else:
+            conn.execute(f'ALTER TABLE {old} RENAME TO {new}')
+
+
+@migration(4, 'Move template content into template_versions')
+def split_template_versions(conn):
+    # A template_versions table from before version names existed cannot be kept
+    if table_exists(conn, 'template_versions') and 'version_name' not in table_columns(conn, 'template_versions'):
+        conn.execute('DROP TABLE template_versions')
+
+    if not table_exists(conn, 'templates'):
+        return
+    columns = table_columns(conn, 'templates')
+    if 'template_content' not in columns:
+        return
+
+    version = 'COALESCE(version, 1)' if 'version' in columns else '1'
+    description = 'description' if 'description' in columns else 'NULL'
+
+    conn.execute(TEMPLATES_TABLE.format(name='templates_new'))
+    conn.execute(f'''
+        INSERT INTO templates_new (id, name, host_type, port_type, switch_os, active_version, created_at, updated_at)
+        SELECT id, name, host_type, port_type, switch_os, {version}, created_at, updated_at
+        FROM templates
+    ''')
+    conn.execute(TEMPLATE_VERSIONS_TABLE)
+    conn.execute(f'''
+        INSERT INTO template_versions
+            (template_id, version, version_name, version_description, template_content, is_active)
+        SELECT id, {version}, 'v' || {version}, {description}, template_content, 1
+        FROM templates
+    ''')
+    conn.execute('DROP TABLE templates')
+    conn.execute('ALTER TABLE templates_new RENAME TO templates')
+
+
+@migration(5, 'Create missing tables and indexes')
+def create_tables(conn):
+    # Templates table - ONE template per host_type/port_type/switch_os combination
+    if not table_exists(conn, 'templates'):
+        conn.execute(TEMPLATES_TABLE.format(name='templates'))
+    conn.execute(TEMPLATE_VERSIONS_TABLE)
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS host_types (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT UNIQUE NOT NULL,
+            description TEXT
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS port_types (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT UNIQUE NOT NULL
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS switch_os_types (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL UNIQUE
+        )
+    ''')
+    # Template fields table (for dynamic Excel column generation)
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS template_fields (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            template_id INTEGER NOT NULL,
+            field_name TEXT NOT NULL,
+            field_type TEXT NOT NULL,
+            required BOOLEAN DEFAULT 1,
+            default_value TEXT,
+            FOREIGN KEY (template_id) REFERENCES templates(id) ON DELETE CASCADE
+        )
+    ''')
+    # Case-insensitive name lookups (config generation resolves templates by name)
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_templates_name_nocase ON templates(name COLLATE NOCASE)')
+    # No default values - user will create their own host types, port types, and OS types
+
+
+@migration(6, 'Add templates.name_folded for case-insensitive name lookups')
+def add_folded_names(conn):
+    # COLLATE NOCASE folds only ASCII letters, so lookups compare Python-folded names instead
+    if 'name_folded' not in table_columns(conn, 'templates'):
+        conn.execute('ALTER TABLE templates ADD COLUMN name_folded TEXT')
+    conn.create_function('fold_name', 1, fold_name, deterministic=True)
+    conn.execute('UPDATE templates SET name_folded = fold_name(name)')
+    conn.execute('DROP INDEX IF EXISTS idx_templates_name_nocase')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_templates_name_folded ON templates(name_folded)')
+
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+def current_version(conn):
+    return conn.execute('PRAGMA user_version').fetchone()[0]
+
+
+def _file_uri(db_path, mode):
+    """SQLite URI for db_path; mode 'ro' or 'rw' fails on a missing file instead of creating it"""
+    return f'{Path(db_path).resolve().as_uri()}?mode={mode}'
+
+
+def migrate(db_path, dry_run=False, log=print):
+    """Apply pending migrations to db_path, each in its own transaction.
+
+    With dry_run all pending migrations run (and are timed) in a single transaction
+    that is then rolled back. Returns a list of {version, description, seconds}.
+    A failing migration is rolled back and re-raised; the file stays at the last
+    version that committed. A dry run never creates db_path or changes its journal mode.
+    """
+    if dry_run:
+        conn = sqlite3.connect(_file_uri(db_path, 'rw'), uri=True, isolation_level=None, timeout=30)
+    else:
+        conn = sqlite3.connect(db_path, isolation_level=None, timeout=30)
+    results = []
+    try:
+        if not dry_run:
+            # WAL persists in the file and cannot be switched inside a transaction
+            conn.execute('PRAGMA journal_mode = WAL')
+        # Tables are rebuilt below; a no-op inside a transaction, so set it first
+        conn.execute('PRAGMA foreign_keys = OFF')
+        if dry_run:
+            conn.execute('BEGIN IMMEDIATE')
+        try:
+            start_version = current_version(conn)
+            for version, description, fn in MIGRATIONS:
+                if version <= start_version:
+                    continue
+                log(f"{'[dry run] ' if dry_run else ''}Migration {version}: {description}...")
+                start = time.perf_counter()
+                if not dry_run:
+                    conn.execute('BEGIN IMMEDIATE')
+                fn(conn)
+                # user_version lives in the file header, so it commits (or rolls back) with the data
+                conn.execute(f'PRAGMA user_version = {version}')
+                if not dry_run:
+                    conn.execute('COMMIT')
+                seconds = time.perf_counter() - start
+                log(f'Migration {version} complete in {seconds:.3f}s')
+                results.append({'version': version, 'description': description, 'seconds': round(seconds, 6)})
+        finally:
+            if conn.in_transaction:
+                conn.execute('ROLLBACK')
+    finally:
+        conn.close()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Apply numbered schema migrations')
+    parser.add_argument('db_path', nargs='?', default='data/templates.db')
+    parser.add_argument('--dry-run', action='store_true',
+                        help='run and time the pending migrations, then roll them back')
+    parser.add_argument('--status', action='store_true', help='show the current version and pending migrations')
+    args = parser.parse_args()
+
+    if (args.status or args.dry_run) and not os.path.exists(args.db_path):
+        parser.error(f'{args.db_path} does not exist')
+
+    if args.status:
+        conn = sqlite3.connect(_file_uri(args.db_path, 'ro'), uri=True)
+        version = current_version(conn)
+        conn.close()
+        print(f'{args.db_path}: version {version} (latest {LATEST_VERSION})')
+        for number, description, _ in MIGRATIONS:
+            print(f"  {'applied' if number <= version else 'pending'}  {number}: {description}")
+        return
+
+    results = migrate(args.db_path, dry_run=args.dry_run)
+    if not results:
+        print(f'{args.db_path} is up to date (version {LATEST_VERSION})')
+
+
+if __name__ == '__main__':
+    main()
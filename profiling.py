@@ -0,0 +1,291 @@
+"""
+Opt-in per-request profiling.
+
+A profiled request runs its view under cProfile, and every metrics timer that
+fires during it (DB calls, compile, render, sheet reading) is added to a
+breakdown: request-wide stage totals plus one entry per template group. The
+last few profiles are kept for /api/profiles, on disk when the store has a
+directory so that every worker process can serve them.
+"""
+import cProfile
+import contextlib
+import contextvars
+import io
+import marshal
+import os
+import pstats
+import re
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from datetime import datetime
+
+import metrics
+from atomic_file import atomic_write
+
+# Metric name -> breakdown stage
+STAGES = {
+    'db_call_duration_seconds': 'db',
+    'template_compile_duration_seconds': 'compile',
+    'template_render_duration_seconds': 'render',
+    'excel_read_duration_seconds': 'excel_read',
+}
+
+TOP_FUNCTIONS = 30
+
+_current = contextvars.ContextVar('request_profile', default=None)
+
+
+def _empty_stage():
+    return {'count': 0, 'seconds': 0.0}
+
+
+class RequestProfile:
+    # What ProfileStore saves of a finished profile
+    SAVED = ('id', 'method', 'path', 'created', 'stages', 'db_methods', 'groups',
+             'total_seconds', 'status', 'stats_data', 'note')
+
+    def __init__(self, method, path):
+        self.id = uuid.uuid4().hex[:12]
+        self.method = method
+        self.path = path
+        self.created = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        self.stages = {}
+        self.db_methods = {}
+        self.groups = []
+        self._group = None
+        self._profiler = cProfile.Profile()
+        self._profiling = False
+        self._start = None
+        self._trace = None
+        self._token = None
+        self.total_seconds = None
+        self.status = None
+        self.stats_data = None
+        self.note = None
+
+    def record(self, name, labels, seconds):
+        """metrics.trace() sink: add a timed observation to the stage totals and current group"""
+        stage = STAGES.get(name, name)
+        for stages in (self.stages, self._group['stages'] if self._group else None):
+            if stages is None:
+                continue
+            totals = stages.setdefault(stage, _empty_stage())
+            totals['count'] += 1
+            totals['seconds'] += seconds
+        if stage == 'db' and 'method' in labels:
+            totals = self.db_methods.setdefault(labels['method'], _empty_stage())
+            totals['count'] += 1
+            totals['seconds'] += seconds
+
+    def start(self):
+        self._token = _current.set(self)
+        self._trace = metrics.trace(self.record)
+        self._trace.__enter__()
+        try:
+            self._profiler.enable()
+            self._profiling = True
+        except ValueError:
+            # Another profiler is active in this interpreter; keep the timing breakdown only
+            self.note = 'cProfile unavailable (another profiler is active); timing breakdown only'
+        self._start = time.perf_counter()
+
+    def stop(self, status=None):
+        self.total_seconds = time.perf_counter() - self._start
+        if self._profiling:
+            self._profiler.disable()
+            self._profiling = False
+            self._profiler.create_stats()
+            self.stats_data = self._profiler.stats
+        self._profiler = None
+        self._trace.__exit__(None, None, None)
+        _current.reset(self._token)
+        self.status = status
+
+    @contextlib.contextmanager
+    def group(self, template_name, row_count):
+        group = {'template': template_name, 'rows': row_count, 'stages': {}}
+        self._group = group
+        start = time.perf_counter()
+        try:
+            yield group
+        finally:
+            group['seconds'] = time.perf_counter() - start
+            self._group = None
+            self.groups.append(group)
+
+    def top_functions(self, limit=TOP_FUNCTIONS, sort='cumulative'):
+        if not self.stats_data:
+            return []
+        stats = self._pstats()
+        stats.sort_stats(sort)
+        rows = []
+        for func in stats.fcn_list[:limit]:
+            primitive_calls, calls, total_time, cumulative_time, _ = stats.stats[func]
+            filename, line, name = func
+            rows.append({
+                'function': f'{filename}:{line}({name})' if line else name,
+                'calls': calls,
+                'primitive_calls': primitive_calls,
+                'total_seconds': round(total_time, 6),
+                'cumulative_seconds': round(cumulative_time, 6)
+            })
+        return rows
+
+    def report(self, limit=TOP_FUNCTIONS, sort='cumulative'):
+        """Plain-text pstats listing, as printed by `python -m cProfile`"""
+        if not self.stats_data:
+            return ''
+        stream = io.StringIO()
+        stats = self._pstats(stream)
+        stats.sort_stats(sort).print_stats(limit)
+        return stream.getvalue()
+
+    def dump(self):
+        """Profile in the .prof/.pstats format read by pstats, snakeviz etc."""
+        return marshal.dumps(self.stats_data or {})
+
+    def _pstats(self, stream=None):
+        stats = pstats.Stats(stream=stream) if stream else pstats.Stats()
+        stats.stats = self.stats_data
+        stats.get_top_level_stats()
+        return stats
+
+    def state(self):
+        """The finished profile as plain data (marshal-able)"""
+        return {name: getattr(self, name) for name in self.SAVED}
+
+    @classmethod
+    def from_state(cls, state):
+        profile = cls(state['method'], state['path'])
+        profile._profiler = None
+        for name in cls.SAVED:
+            setattr(profile, name, state.get(name))
+        return profile
+
+    def summary(self):
+        return {
+            'id': self.id,
+            'created': self.created,
+            'method': self.method,
+            'path': self.path,
+            'status': self.status,
+            'total_seconds': round(self.total_seconds or 0.0, 6),
+            'group_count': len(self.groups)
+        }
+
+    def to_dict(self, limit=TOP_FUNCTIONS, sort='cumulative'):
+        def rounded(stages):
+            return {name: {'count': s['count'], 'seconds': round(s['seconds'], 6)} for name, s in stages.items()}
+
+        return {
+            **self.summary(),
+            'note': self.note,
+            'stages': rounded(self.stages),
+            'db_methods': rounded(self.db_methods),
+            'groups': [{
+                'template': g['template'],
+                'rows': g['rows'],
+                'seconds': round(g['seconds'], 6),
+                'stages': rounded(g['stages'])
+            } for g in self.groups],
+            'top_functions': self.top_functions(limit, sort)
+        }
+
+
+def current():
+    """The profile of the request running in this context, or None"""
+    return _current.get()
+
+
+def group(template_name, row_count):
+    """Attribute the timings inside this block to one template group (no-op when not profiling)"""
+    profile = _current.get()
+    return profile.group(template_name, row_count) if profile else contextlib.nullcontext()
+
+
+class ProfileStore:
+    """The most recent profiles, oldest dropped first.
+
+    With a directory, profiles are written there (one marshal file each) instead of
+    held in memory, so a profile recorded by one worker process can be read through
+    any other.
+    """
+
+    def __init__(self, max_profiles=20, directory=None):
+        self.max_profiles = max_profiles
+        self.directory = directory
+        self._profiles = OrderedDict()
+        self._lock = threading.Lock()
+
+    def add(self, profile):
+        if self.directory:
+            self._write(profile)
+            return
+        with self._lock:
+            self._profiles[profile.id] = profile
+            while len(self._profiles) > self.max_profiles:
+                self._profiles.popitem(last=False)
+
+    def get(self, profile_id):
+        if self.directory:
+            # Ids are hex (RequestProfile); anything else cannot name a file here
+            if not re.fullmatch(r'[0-9a-f]+', profile_id or ''):
+                return None
+            return self._read(os.path.join(self.directory, f'{profile_id}.profile'))
+        with self._lock:
+            return self._profiles.get(profile_id)
+
+    def list(self):
+        if self.directory:
+            profiles = (self._read(path) for path in reversed(self._files()))
+            return [p.summary() for p in profiles if p is not None]
+        with self._lock:
+            return [p.summary() for p in reversed(self._profiles.values())]
+
+    def clear(self):
+        if self.directory:
+            for path in self._files():
+                self._remove(path)
+            return
+        with self._lock:
+            self._profiles.clear()
+
+    def _files(self):
+        """Stored profile paths, oldest first"""
+        if not os.path.isdir(self.directory):
+            return []
+        paths = [os.path.join(self.directory, name) for name in os.listdir(self.directory)
+                 if name.endswith('.profile')]
+        mtimes = {}
+        for path in paths:
+            try:
+                mtimes[path] = os.stat(path).st_mtime
+            except OSError:
+                pass
+        return sorted(mtimes, key=mtimes.get)
+
+    def _write(self, profile):
+        try:
+            atomic_write(os.path.join(self.directory, f'{profile.id}.profile'), marshal.dumps(profile.state()))
+        except OSError:
+            return
+        files = self._files()
+        for path in files[:max(len(files) - self.max_profiles, 0)]:
+            self._remove(path)
+
+    @staticmethod
+    def _read(path):
+        try:
+            with open(path, 'rb') as f:
+                return RequestProfile.from_state(marshal.loads(f.read()))
+        except (OSError, EOFError, ValueError, TypeError):
+            return None
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
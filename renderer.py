@@ -0,0 +1,935 @@
+import os
+import contextvars
+import functools
+import hashlib
+import json
+import marshal
+import multiprocessing
+import re
+import threading
+import time
+import types
+import weakref
+from collections import OrderedDict
+from itertools import islice
+from concurrent.futures import CancelledError, ProcessPoolExecutor, ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from jinja2 import nodes
+from jinja2.bccache import bc_magic
+from jinja2.exceptions import TemplateSyntaxError
+from jinja2.filters import do_center, do_format, do_indent
+from jinja2.runtime import LoopContext, Macro
+from jinja2.sandbox import SandboxedEnvironment, SandboxedEscapeFormatter, SandboxedFormatter
+from markupsafe import Markup
+import metrics
+from atomic_file import atomic_write
+
+
+class LRUCache:
+    """Thread-safe LRU cache with hit/miss/eviction counters.
+
+    Bounded by entry count and, when max_bytes is set, by the summed size
+    passed to put().
+    """
+
+    def __init__(self, max_entries=256, max_bytes=None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.total_bytes = 0
+        self._entries = OrderedDict()
+        self._sizes = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, key, value, size=0):
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = value
+            self._sizes[key] = size
+            self.total_bytes += size
+            while len(self._entries) > self.max_entries or (
+                    self.max_bytes is not None and self.total_bytes > self.max_bytes and len(self._entries) > 1):
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def _remove(self, key):
+        del self._entries[key]
+        self.total_bytes -= self._sizes.pop(key)
+
+    def invalidate(self, predicate):
+        """Drop every entry whose key matches predicate(key)"""
+        with self._lock:
+            for key in [k for k in self._entries if predicate(k)]:
+                self._remove(key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._sizes.clear()
+            self.total_bytes = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                'size': len(self._entries),
+                'max_entries': self.max_entries,
+                'total_bytes': self.total_bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions
+            }
+
+
+# Per-render limits for user-supplied templates (Jinja Tester and config generation)
+RENDER_CPU_SECONDS = float(os.environ.get('RENDER_CPU_SECONDS', 10))                # CPU time of the rendering thread
+RENDER_MAX_OUTPUT_CHARS = int(os.environ.get('RENDER_MAX_OUTPUT_CHARS', 50_000_000))
+RENDER_MAX_RANGE = int(os.environ.get('RENDER_MAX_RANGE', 100_000))                 # items in one range()
+RENDER_MAX_LOOP_ITERATIONS = int(os.environ.get('RENDER_MAX_LOOP_ITERATIONS', 10_000_000))  # for-loop items per render
+RENDER_MAX_SEQUENCE_ITEMS = int(os.environ.get('RENDER_MAX_SEQUENCE_ITEMS', 1_000_000))     # items in one repeated list
+
+
+class RenderAborted(Exception):
+    """A render exceeded one of the configured limits and was stopped"""
+
+    def __init__(self, reason):
+        super().__init__(f'Render aborted: {reason}')
+        self.reason = reason
+
+
+class _RenderBudget:
+    """Limits of the render running in this context; checked from the sandbox hooks"""
+    __slots__ = ('deadline', 'iterations', 'ticks')
+
+    def __init__(self):
+        self.deadline = time.thread_time() + RENDER_CPU_SECONDS
+        self.iterations = 0
+        self.ticks = 0
+
+    def check_time(self):
+        if time.thread_time() > self.deadline:
+            raise RenderAborted(f'CPU time limit of {RENDER_CPU_SECONDS:g}s exceeded')
+
+    def add_iterations(self, count):
+        self.iterations += count
+        if self.iterations > RENDER_MAX_LOOP_ITERATIONS:
+            raise RenderAborted(f'more than {RENDER_MAX_LOOP_ITERATIONS} loop iterations')
+
+
+_budget = contextvars.ContextVar('render_budget', default=None)
+# Set while a group renders incrementally; see render_group
+_fragments = contextvars.ContextVar('row_fragments', default=None)
+
+
+class _LimitedLoop:
+    """The iterable of a template for-loop: its items count toward the render's loop limit
+    and CPU budget (checked every 256 items, so even a loop with an empty body is bounded)"""
+    __slots__ = ('_iterable', '_budget')
+
+    def __init__(self, iterable, budget):
+        self._iterable = iterable
+        self._budget = budget
+
+    def __iter__(self):
+        iterator, budget = iter(self._iterable), self._budget
+        while True:
+            batch = list(islice(iterator, 256))
+            if not batch:
+                return
+            budget.add_iterations(len(batch))
+            budget.check_time()
+            yield from batch
+
+    def __len__(self):
+        # loop.length / loop.last use this; unsized iterables raise TypeError as before
+        return len(self._iterable)
+
+
+def limited_range(*args):
+    items = range(*args)
+    if len(items) > RENDER_MAX_RANGE:
+        raise RenderAborted(f'range() of {len(items)} items exceeds the limit of {RENDER_MAX_RANGE}')
+    return items
+
+
+def _check_width(width, what):
+    """Stop a padding width (center, ljust, zfill, ...) that alone would exceed the output limit"""
+    if isinstance(width, int) and width > RENDER_MAX_OUTPUT_CHARS:
+        raise RenderAborted(f'{what} width of {width} exceeds the output limit')
+
+
+_SPEC_NUMBER = re.compile(r'\d+')
+# A printf conversion up to its width and precision; %% first so it is skipped whole
+_PRINTF_FIELD = re.compile(r'%%|%(?:\([^)]*\))?[-#0 +]*(\*|\d*)(?:\.(\*|\d*))?')
+_MAX_DIGITS = len(str(RENDER_MAX_OUTPUT_CHARS))
+
+
+def _check_spec_number(number, what):
+    if len(number) > _MAX_DIGITS or int(number) > RENDER_MAX_OUTPUT_CHARS:
+        raise RenderAborted(f'{what} width or precision of {number} exceeds the output limit')
+
+
+def _check_printf(template, values):
+    """Widths/precisions of `template % values`, checked before the string is built"""
+    starred = False
+    for match in _PRINTF_FIELD.finditer(template):
+        for number in match.groups():
+            if number == '*':
+                starred = True
+            elif number:
+                _check_spec_number(number, 'format')
+    if starred:
+        for value in values if isinstance(values, tuple) else (values,):
+            _check_width(value, 'format')
+
+
+class _LimitedFormatter(SandboxedFormatter):
+    """str.format for templates: field widths and precisions are checked once resolved"""
+
+    def format_field(self, value, format_spec):
+        for number in _SPEC_NUMBER.findall(format_spec):
+            _check_spec_number(number, 'format')
+        return super().format_field(value, format_spec)
+
+
+class _LimitedEscapeFormatter(_LimitedFormatter, SandboxedEscapeFormatter):
+    pass
+
+
+def limited_center(value, width=80):
+    _check_width(width, 'center')
+    return do_center(value, width)
+
+
+def limited_indent(s, width=4, first=False, blank=False):
+    indentation = width if isinstance(width, int) else len(str(width))
+    _check_width(indentation * (str(s).count('\n') + 1), 'indent')
+    return do_indent(s, width, first, blank)
+
+
+def limited_format(value, *args, **kwargs):
+    _check_printf(str(value), kwargs or args)
+    return do_format(value, *args, **kwargs)
+
+
+# str methods whose first argument is the width of the result
+_PADDING_METHODS = frozenset(['center', 'ljust', 'rjust', 'zfill'])
+
+
+class _LimitedCodeGenerator(SandboxedEnvironment.code_generator_class):
+    """Compiles `{% for x in seq %}` as `for x in environment.limit_loop(seq)`"""
+
+    def visit_For(self, node, frame):
+        limited = nodes.Call(nodes.EnvironmentAttribute('limit_loop'), [node.iter], [], None, None,
+                             lineno=node.iter.lineno)
+        node = nodes.For(node.target, limited, node.body, node.else_, node.test, node.recursive,
+                         lineno=node.lineno)
+        super().visit_For(node, frame)
+
+
+class LimitedEnvironment(SandboxedEnvironment):
+    """Sandboxed environment that also bounds the work a single render may do.
+
+    The sandbox blocks unsafe attribute access; on top of that `*`, `**` and `%`
+    are checked before they run (no 'x' * 10**9, [0] * 10**8, 10**10**10 or
+    '%0999999999d' % 1), as are the widths given to center/indent/format and to
+    str.format/center/ljust/rjust/zfill. range() is capped, every for-loop item
+    counts toward the loop limit, and every call, attribute and item lookup
+    counts against the render's CPU budget.
+    """
+    intercepted_binops = frozenset(['*', '**', '%'])
+    code_generator_class = _LimitedCodeGenerator
+    # Part of the stored-code fingerprint (TemplateCodeStore); bump when the generated code changes
+    code_version = 2
+
+    def __init__(self, **options):
+        super().__init__(**options)
+        self.globals['range'] = limited_range
+        self.filters['center'] = limited_center
+        self.filters['indent'] = limited_indent
+        self.filters['format'] = limited_format
+
+    def call_binop(self, context, operator, left, right):
+        if operator == '*':
+            for sequence, count in ((left, right), (right, left)):
+                if not isinstance(count, int):
+                    continue
+                if isinstance(sequence, str) and len(sequence) * count > RENDER_MAX_OUTPUT_CHARS:
+                    raise RenderAborted(f'repeating a string {count} times exceeds the output limit')
+                if isinstance(sequence, (list, tuple)) and len(sequence) * count > RENDER_MAX_SEQUENCE_ITEMS:
+                    raise RenderAborted(f'repeating a sequence {count} times exceeds '
+                                        f'the limit of {RENDER_MAX_SEQUENCE_ITEMS} items')
+        elif operator == '%' and isinstance(left, str):
+            _check_printf(left, right)
+        elif operator == '**' and isinstance(left, int) and isinstance(right, int) and right > 0 \
+                and abs(left) > 1 and left.bit_length() * right > 65536:
+            raise RenderAborted(f'{left} ** {right} is too large')
+        return super().call_binop(context, operator, left, right)
+
+    def limit_loop(self, iterable):
+        budget = _budget.get()
+        if budget is None:
+            return iterable
+        return _LimitedLoop(iterable, budget)
+
+    def wrap_str_format(self, value):
+        """As SandboxedEnvironment.wrap_str_format, with formatters that check field widths"""
+        if not isinstance(value, (types.MethodType, types.BuiltinMethodType)) \
+                or value.__name__ not in ('format', 'format_map') or not isinstance(value.__self__, str):
+            return None
+        f_self = value.__self__
+        if isinstance(f_self, Markup):
+            formatter = _LimitedEscapeFormatter(self, escape=f_self.escape)
+        else:
+            formatter = _LimitedFormatter(self)
+        is_format_map = value.__name__ == 'format_map'
+
+        def wrapper(*args, **kwargs):
+            if is_format_map:
+                if kwargs:
+                    raise TypeError('format_map() takes no keyword arguments')
+                if len(args) != 1:
+                    raise TypeError(f'format_map() takes exactly one argument ({len(args)} given)')
+                kwargs, args = args[0], ()
+            return type(f_self)(formatter.vformat(f_self, args, kwargs))
+        return functools.update_wrapper(wrapper, value)
+
+    # These hooks run for every call and lookup in a template: count them inline and look at
+    # the (cheap but not free) thread CPU clock every 256
+
+    def call(__self, __context, __obj, *args, **kwargs):
+        budget = _budget.get()
+        if budget is not None:
+            budget.ticks += 1
+            if not budget.ticks & 255:
+                budget.check_time()
+        if __obj.__class__ is LoopContext and args:
+            # loop(children) in a recursive for-loop iterates like the loop itself
+            args = (__self.limit_loop(args[0]),) + args[1:]
+        elif __obj.__class__ is Macro and __obj.name == ROW_MACRO:
+            prefix = _fragments.get()
+            if prefix is not None and 'caller' not in kwargs:
+                return _call_row_macro(__self, __context, __obj, prefix, args, kwargs)
+        elif __obj.__class__ is types.BuiltinMethodType and __obj.__name__ in _PADDING_METHODS \
+                and isinstance(__obj.__self__, str):
+            _check_width(args[0] if args else kwargs.get('width'), __obj.__name__)
+        return SandboxedEnvironment.call(__self, __context, __obj, *args, **kwargs)
+
+    def getattr(self, obj, attribute):
+        budget = _budget.get()
+        if budget is not None:
+            budget.ticks += 1
+            if not budget.ticks & 255:
+                budget.check_time()
+        return SandboxedEnvironment.getattr(self, obj, attribute)
+
+    def getitem(self, obj, argument):
+        budget = _budget.get()
+        if budget is not None:
+            budget.ticks += 1
+            if not budget.ticks & 255:
+                budget.check_time()
+        return SandboxedEnvironment.getitem(self, obj, argument)
+
+
+# Shared environment for every render path so compiled templates are interchangeable
+render_env = LimitedEnvironment()
+
+
+def render_limited(template, context):
+    """template.render(**context) within the render limits; raises RenderAborted when one is hit"""
+    budget = _RenderBudget()
+    token = _budget.set(budget)
+    try:
+        chunks = []
+        size = 0
+        output = template.root_render_func(template.new_context(context))
+        # Pull output in batches so the per-chunk work stays in C; limits are checked per batch
+        while True:
+            batch = list(islice(output, 512))
+            if not batch:
+                break
+            size += sum(map(len, batch))
+            if size > RENDER_MAX_OUTPUT_CHARS:
+                raise RenderAborted(f'output exceeds {RENDER_MAX_OUTPUT_CHARS} characters')
+            budget.check_time()
+            chunks += batch
+        return ''.join(chunks)
+    except RenderAborted:
+        raise
+    except Exception:
+        # As Template.render does: point the traceback at the template source
+        template.environment.handle_exception()
+    finally:
+        _budget.reset(token)
+
+# Compiled templates keyed by (template_id, active_version, content hash)
+compiled_templates = LRUCache(max_entries=int(os.environ.get('TEMPLATE_CACHE_SIZE', 256)))
+
+# Ad-hoc templates (Jinja Tester) keyed by a hash of their source
+source_templates = LRUCache(
+    max_entries=int(os.environ.get('SOURCE_CACHE_SIZE', 512)),
+    max_bytes=int(os.environ.get('SOURCE_CACHE_MAX_BYTES', 8 * 1024 * 1024))
+)
+
+COMPILE_SECONDS = metrics.Histogram(
+    'template_compile_duration_seconds', 'Time to compile template source (cache misses only)', ['kind'])
+RENDER_SECONDS = metrics.Histogram(
+    'template_render_duration_seconds', 'Time spent in template.render', ['path'])
+RENDER_OUTPUT_BYTES = metrics.Histogram(
+    'template_render_output_bytes', 'Size of rendered output', ['path'], buckets=metrics.SIZE_BUCKETS)
+RENDER_ROWS = metrics.Histogram(
+    'template_render_rows', 'Rows rendered per template group', buckets=metrics.ROW_BUCKETS)
+
+
+def record_output(path, output, row_count=None):
+    """Record the size of a rendered output (and its group's row count)"""
+    if not metrics.is_enabled() or output is None:
+        return
+    RENDER_OUTPUT_BYTES.observe(len(output.encode('utf-8')), path=path)
+    if row_count is not None:
+        RENDER_ROWS.observe(row_count)
+
+
+class TemplateCodeStore:
+    """Compiled template code persisted on disk, so templates compile once per source, not per process.
+
+    Files hold the marshalled module code Jinja generates for a template, in the
+    format of Jinja's own bytecode cache: a header tied to the Jinja and Python
+    versions, then the code. They are named by a hash of the environment type and
+    the template source, so an edited template never loads stale code and an
+    upgrade simply recompiles.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.loads = 0
+        self.saves = 0
+
+    def _path(self, env, source):
+        fingerprint = (f'{type(env).__module__}.{type(env).__qualname__}:{getattr(env, "code_version", None)}:'
+                       f'{sorted(getattr(env, "intercepted_binops", ()))}')
+        name = hashlib.sha256(f'{fingerprint}\0{source}'.encode('utf-8')).hexdigest()
+        return os.path.join(self.directory, f'{name}.jbc')
+
+    def load(self, env, source):
+        """The stored code for source, or None"""
+        if not self.directory:
+            return None
+        try:
+            with open(self._path(env, source), 'rb') as f:
+                data = f.read()
+        except OSError:
+            return None
+        if not data.startswith(bc_magic):
+            return None
+        try:
+            code = marshal.loads(data[len(bc_magic):])
+        except (EOFError, ValueError, TypeError):
+            return None
+        self.loads += 1
+        return code
+
+    def save(self, env, source, code):
+        if not self.directory:
+            return
+        path = self._path(env, source)
+        try:
+            atomic_write(path, bc_magic + marshal.dumps(code))
+            self.saves += 1
+        except OSError:
+            pass
+
+    def contains(self, env, source):
+        return bool(self.directory) and os.path.exists(self._path(env, source))
+
+    def prune(self, env, keep_sources):
+        """Delete stored code for every source not in keep_sources; returns the number removed"""
+        if not self.directory or not os.path.isdir(self.directory):
+            return 0
+        keep = {os.path.basename(self._path(env, source)) for source in keep_sources}
+        removed = 0
+        for name in os.listdir(self.directory):
+            if name.endswith('.jbc') and name not in keep:
+                try:
+                    os.remove(os.path.join(self.directory, name))
+                    removed += 1
+                except OSError:
+                    pass
+        return removed
+
+    def stats(self):
+        files = [n for n in os.listdir(self.directory) if n.endswith('.jbc')] \
+            if self.directory and os.path.isdir(self.directory) else []
+        return {'directory': self.directory, 'files': len(files), 'loads': self.loads, 'saves': self.saves}
+
+
+# Stored template versions compiled to Python code (TEMPLATE_CODE_DIR='' keeps them in memory only)
+template_code_store = TemplateCodeStore(os.environ.get('TEMPLATE_CODE_DIR', 'data/compiled_templates') or None)
+
+
+def _compile(template_content, kind, persistent):
+    """Build a Template, loading its code from template_code_store when stored there"""
+    code = template_code_store.load(render_env, template_content) if persistent else None
+    if code is None:
+        with COMPILE_SECONDS.time(kind=kind):
+            code = render_env.compile(template_content)
+        if persistent:
+            template_code_store.save(render_env, template_content, code)
+    template = render_env.template_class.from_code(render_env, code, render_env.make_globals(None))
+    template.fragment_key = row_fragment_key(template_content)
+    return template
+
+
+def precompile(template_content):
+    """Compile a saved template's source into the code store now, ahead of its first render.
+
+    Returns False when it was already stored; raises TemplateSyntaxError for invalid source.
+    """
+    if template_code_store.contains(render_env, template_content):
+        return False
+    with COMPILE_SECONDS.time(kind='stored'):
+        code = render_env.compile(template_content)
+    template_code_store.save(render_env, template_content, code)
+    return True
+
+
+def compile_source(template_content, persistent=False):
+    """Return a compiled Template for arbitrary source, reusing it while the source is unchanged.
+
+    persistent also uses the on-disk code store (stored templates rendered in a process pool).
+    """
+    source_bytes = template_content.encode('utf-8')
+    key = hashlib.sha256(source_bytes).hexdigest()
+    template = source_templates.get(key)
+    if template is None:
+        template = _compile(template_content, 'source', persistent)
+        source_templates.put(key, template, size=len(source_bytes))
+    return template
+
+
+def get_compiled_template(template_id, version, template_content):
+    """Return a compiled Template for a stored template version, compiling (or loading) on first use.
+
+    The key includes a hash of the content: a version edited in place by another
+    worker process (whose invalidate_template() only ran there) is recompiled here
+    instead of rendering the old source.
+    """
+    key = (template_id, version, hashlib.sha256(template_content.encode('utf-8')).hexdigest())
+    template = compiled_templates.get(key)
+    if template is None:
+        template = _compile(template_content, 'stored', True)
+        # Drop the code of this version's earlier content, if any
+        compiled_templates.invalidate(lambda cached: cached[:2] == key[:2])
+        compiled_templates.put(key, template)
+    return template
+
+
+def invalidate_template(template_id):
+    """Forget every compiled version of a template (and its cached outputs)"""
+    compiled_templates.invalidate(lambda key: key[0] == template_id)
+    output_cache.invalidate_template(template_id)
+
+
+def rows_digest(rows):
+    """Stable hash of a group's rows (key order and value types do not depend on the caller)"""
+    encoded = json.dumps(rows, sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.sha256(encoded.encode('utf-8')).hexdigest()
+
+
+class OutputCache:
+    """Rendered group output keyed by (template id, version, content hash, rows hash).
+
+    Held in memory (LRU, bounded by entries and bytes) and, when `directory` is set,
+    also written to disk so outputs survive restarts and are shared by every worker
+    process; the disk copy is pruned oldest-first once it exceeds max_disk_bytes.
+    The content hash keeps an entry valid only for the exact source it was rendered
+    from, since a version's content can be edited in place.
+    """
+
+    def __init__(self, max_entries=1024, max_bytes=64 * 1024 * 1024, directory=None, max_disk_bytes=None):
+        self.memory = LRUCache(max_entries=max_entries, max_bytes=max_bytes)
+        self.directory = directory
+        self.max_disk_bytes = max_disk_bytes
+        self.disk_hits = 0
+        self._disk_bytes = None
+        self._disk_lock = threading.Lock()
+
+    @staticmethod
+    def key(template_obj, rows):
+        content_hash = hashlib.sha256((template_obj['template_content'] or '').encode('utf-8')).hexdigest()
+        return template_obj['id'], template_obj['active_version'], content_hash, rows_digest(rows)
+
+    def get(self, key):
+        output = self.memory.get(key)
+        if output is None and self.directory:
+            output = self._read(key)
+            if output is not None:
+                self.disk_hits += 1
+                self.memory.put(key, output, size=len(output.encode('utf-8')))
+        return output
+
+    def put(self, key, output):
+        data = output.encode('utf-8')
+        self.memory.put(key, output, size=len(data))
+        if self.directory:
+            self._write(key, data)
+
+    def invalidate_template(self, template_id):
+        # Disk entries are left to age out; their content hash no longer matches the template
+        self.memory.invalidate(lambda key: key[0] == template_id)
+
+    def clear(self):
+        self.memory.clear()
+        if self.directory and os.path.isdir(self.directory):
+            for path, _, _ in self._disk_files():
+                os.remove(path)
+            self._disk_bytes = 0
+
+    def stats(self):
+        stats = self.memory.stats()
+        stats['disk_hits'] = self.disk_hits
+        stats['directory'] = self.directory
+        stats['disk_bytes'] = self._disk_bytes
+        return stats
+
+    def _path(self, key):
+        name = hashlib.sha256(repr(key).encode('utf-8')).hexdigest()
+        return os.path.join(self.directory, name[:2], f'{name}.cfg')
+
+    def _read(self, key):
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                output = f.read().decode('utf-8')
+            os.utime(path)  # recently used entries survive pruning
+            return output
+        except OSError:
+            return None
+
+    def _write(self, key, data):
+        path = self._path(key)
+        try:
+            atomic_write(path, data)
+        except OSError:
+            return
+        if self.max_disk_bytes:
+            with self._disk_lock:
+                if self._disk_bytes is None:
+                    self._disk_bytes = sum(size for _, size, _ in self._disk_files())
+                else:
+                    self._disk_bytes += len(data)
+                if self._disk_bytes > self.max_disk_bytes:
+                    self._prune()
+
+    def _disk_files(self):
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                yield path, stat.st_size, stat.st_mtime
+
+    def _prune(self):
+        """Delete least recently used files until the directory is at 90% of its bound"""
+        files = sorted(self._disk_files(), key=lambda f: f[2])
+        total = sum(size for _, size, _ in files)
+        target = self.max_disk_bytes * 0.9
+        for path, size, _ in files:
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except OSError:
+                pass
+        self._disk_bytes = total
+
+
+# Rendered configs for /api/generate-configs and friends: re-runs only render changed groups
+output_cache = OutputCache(
+    max_entries=int(os.environ.get('OUTPUT_CACHE_SIZE', 1024)),
+    max_bytes=int(os.environ.get('OUTPUT_CACHE_MAX_BYTES', 64 * 1024 * 1024)),
+    directory=os.environ.get('OUTPUT_CACHE_DIR') or None,
+    max_disk_bytes=int(os.environ.get('OUTPUT_CACHE_DISK_MAX_BYTES', 512 * 1024 * 1024))
+)
+
+
+# Incremental rendering: a template that defines {% macro port_row(port) %} and calls it once per
+# row has each call's output cached, so a group re-render only runs the macro for changed rows
+ROW_MACRO = 'port_row'
+
+row_fragments = LRUCache(
+    max_entries=int(os.environ.get('FRAGMENT_CACHE_SIZE', 100_000)),
+    max_bytes=int(os.environ.get('FRAGMENT_CACHE_MAX_BYTES', 64 * 1024 * 1024))
+)
+
+
+def _free_names(node, params=()):
+    """Names node reads without assigning them first; Macro bodies are skipped except for node itself"""
+    loaded, stored = set(), set(params)
+    todo = [node]
+    while todo:
+        current = todo.pop()
+        for child in current.iter_child_nodes():
+            if isinstance(child, nodes.Macro):
+                continue
+            if isinstance(child, nodes.Name):
+                (loaded if child.ctx == 'load' else stored).add(child.name)
+            todo.append(child)
+    return loaded - stored, stored
+
+
+def row_fragment_key(template_content):
+    """Hash of the source when its port_row macro can be cached per row, else None.
+
+    The macro's output may only depend on its arguments and the group-level
+    fields: it must not read ports/switches, names set at the top level of the
+    template (which may be derived from all rows, or be a namespace it writes
+    to), or call a macro of this template that does. Blocks (self.<block>(),
+    super()) and included/imported templates see the whole context, so using
+    any of them also rules the cache out.
+    """
+    try:
+        ast = render_env.parse(template_content)
+    except TemplateSyntaxError:
+        return None
+    macros = {macro.name: macro for macro in ast.find_all(nodes.Macro)}
+    if ROW_MACRO not in macros:
+        return None
+    _, top_level = _free_names(ast)
+    unsafe = top_level | {'ports', 'switches', 'self', 'super'}
+
+    checked, todo = set(), [ROW_MACRO]
+    while todo:
+        macro = macros[todo.pop()]
+        checked.add(macro.name)
+        if any(True for _ in macro.find_all((nodes.NSRef, nodes.Block, nodes.Include, nodes.Import,
+                                              nodes.FromImport))):
+            return None
+        free, _ = _free_names(macro, [arg.name for arg in macro.args])
+        if free & unsafe:
+            return None
+        todo += [name for name in free & macros.keys() if name not in checked]
+    return hashlib.sha256(template_content.encode('utf-8')).hexdigest()
+
+
+def _fields_key(fields):
+    """Hashable, exact stand-in for a row: types are kept so 1, 1.0 and True stay distinct.
+
+    Key order is kept too; rows of one sheet share it, and a different order only costs a miss.
+    """
+    try:
+        key = (tuple(fields.items()), tuple(map(type, fields.values())))
+        hash(key)
+        return key
+    except TypeError:
+        return rows_digest(fields)
+
+
+def _call_row_macro(env, context, macro, prefix, args, kwargs):
+    kwargs.pop('_loop_vars', None)
+    kwargs.pop('_block_vars', None)
+    if len(args) == 1 and not kwargs and args[0].__class__ is dict:
+        key = (prefix, _fields_key(args[0]))
+    else:
+        key = (prefix, tuple([_fields_key(arg) if isinstance(arg, dict) else arg for arg in args]),
+               _fields_key(kwargs))
+    try:
+        fragment = row_fragments.get(key)
+    except TypeError:  # an unhashable non-dict argument
+        return SandboxedEnvironment.call(env, context, macro, *args, **kwargs)
+    if fragment is None:
+        fragment = SandboxedEnvironment.call(env, context, macro, *args, **kwargs)
+        row_fragments.put(key, fragment, size=len(fragment))
+    return fragment
+
+
+def render_group(template, rows, incremental=True):
+    """Render one template group: all rows as ports/switches plus the first row's fields.
+
+    With incremental, port_row macro calls are served from row_fragments (see
+    row_fragment_key); the cache key also covers the group-level fields.
+    """
+    render_context = rows[0].copy() if rows else {}
+    render_context['ports'] = rows
+    render_context['switches'] = rows  # Keep for backward compatibility
+    content_key = getattr(template, 'fragment_key', None) if incremental and rows else None
+    # One string per group (its hash is computed once), then one lookup per row
+    token = _fragments.set(f'{content_key}:{rows_digest(rows[0])}' if content_key else None)
+    try:
+        # Observations made in a process-pool worker stay in that worker; sizes are recorded by the caller
+        with RENDER_SECONDS.time(path='generate'):
+            return render_limited(template, render_context)
+    finally:
+        _fragments.reset(token)
+
+
+def _render_stored(template_obj, rows, incremental=True):
+    """Render a group in this process; returns (output, error message)"""
+    try:
+        template = get_compiled_template(
+            template_obj['id'], template_obj['active_version'], template_obj['template_content'])
+        return render_group(template, rows, incremental), None
+    except Exception as e:
+        return None, str(e)
+
+
+def _render_source(template_content, rows, incremental=True):
+    """Process-pool entry point: only plain strings cross the process boundary"""
+    try:
+        return render_group(compile_source(template_content, persistent=True), rows, incremental), None
+    except Exception as e:
+        return None, str(e)
+
+
+# Worker pools are created lazily and shared by all requests in this process
+_executors = {}
+_executors_lock = threading.Lock()
+# Process pools stopped because a render overran its timeout (see _discard_executor)
+_recycled_pools = weakref.WeakSet()
+
+
+def _process_context():
+    """Start render processes from a clean server process, not by forking this one.
+
+    Forking a threaded gunicorn worker copies whatever locks its other threads
+    (log listener, job runner, requests) hold at that moment, which can deadlock
+    the child. forkserver (spawn where unavailable) avoids that; the server
+    preloads this module so each render process starts with it imported.
+    """
+    if 'forkserver' in multiprocessing.get_all_start_methods():
+        context = multiprocessing.get_context('forkserver')
+        context.set_forkserver_preload([__name__])
+        return context
+    return multiprocessing.get_context('spawn')
+
+
+def get_executor(kind, workers):
+    with _executors_lock:
+        executor = _executors.get(kind)
+        if executor is None:
+            if kind == 'process':
+                executor = ProcessPoolExecutor(max_workers=workers, mp_context=_process_context())
+            else:
+                executor = ThreadPoolExecutor(max_workers=workers)
+            _executors[kind] = executor
+        return executor
+
+
+def _discard_executor(kind, executor=None, terminate=False):
+    """Stop using the pool of this kind (only if it is still executor, when given).
+
+    terminate also stops its worker processes: a task that is already running
+    cannot be cancelled, and would otherwise keep a worker busy until it ends.
+    """
+    with _executors_lock:
+        if executor is None or _executors.get(kind) is executor:
+            executor = _executors.pop(kind, None)
+        elif not terminate:
+            executor = None
+    if executor is None:
+        return
+    processes = []
+    if terminate:
+        _recycled_pools.add(executor)
+        # No public way to reach the workers before Python 3.14 (terminate_workers())
+        processes = list((getattr(executor, '_processes', None) or {}).values())
+    executor.shutdown(wait=False, cancel_futures=True)
+    for process in processes:
+        process.terminate()
+
+
+def shutdown_executors():
+    for kind in list(_executors):
+        _discard_executor(kind)
+
+
+def reset_after_fork():
+    """In a forked child: forget the parent's worker pools, their threads did not survive the fork"""
+    global _executors_lock
+    _executors_lock = threading.Lock()
+    _executors.clear()
+
+
+def _group_result(future, pool, deadline, template_obj, rows, workers, timeout, incremental):
+    """Wait for one submitted group until its deadline; returns (output, error message)"""
+    while True:
+        try:
+            return future.result(timeout=max(deadline - time.monotonic(), 0) if deadline is not None else None)
+        except FutureTimeoutError:
+            if not future.cancel() and pool is not None:
+                _discard_executor('process', pool, terminate=True)
+            return None, f'Render timed out after {timeout} seconds'
+        except (BrokenProcessPool, CancelledError):
+            _discard_executor('process', pool)
+            if pool not in _recycled_pools:
+                # A worker died; render this group here and stop using the broken pool
+                return _render_stored(template_obj, rows, incremental)
+            # Stopped along with a group that overran: run it again in a fresh pool, in the time left
+            if deadline is not None and time.monotonic() >= deadline:
+                return None, f'Render timed out after {timeout} seconds'
+            pool = get_executor('process', workers)
+            try:
+                future = pool.submit(_render_source, template_obj['template_content'], rows, incremental)
+            except (BrokenProcessPool, OSError, RuntimeError):
+                _discard_executor('process', pool)
+                return _render_stored(template_obj, rows, incremental)
+
+
+def render_groups(groups, parallel=False, executor='process', workers=None, timeout=None, incremental=True):
+    """Render (template_obj, rows) pairs, yielding (output, error message) in input order.
+
+    Sequential by default. With parallel=True groups are submitted to a process pool
+    (or a thread pool when executor='thread'); if the process pool cannot be used the
+    remaining groups fall back to threads. timeout is counted for each group from
+    its submission, so the whole batch is given up after timeout seconds at most.
+    A process-pool render that overruns is stopped by recycling the pool, and the
+    other groups it held are resubmitted in the time they have left; a thread
+    cannot be stopped, and runs on until the render limits (RENDER_CPU_SECONDS)
+    end it.
+    incremental=False re-renders every port_row fragment.
+    """
+    groups = list(groups)
+    if not parallel or len(groups) < 2:
+        for template_obj, rows in groups:
+            yield _render_stored(template_obj, rows, incremental)
+        return
+
+    futures = []  # (future, process pool or None, deadline)
+    kind = executor
+    for template_obj, rows in groups:
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        if kind == 'process':
+            pool = get_executor('process', workers)
+            try:
+                futures.append((pool.submit(_render_source, template_obj['template_content'], rows, incremental),
+                                pool, deadline))
+                continue
+            except (BrokenProcessPool, OSError, RuntimeError):
+                _discard_executor('process', pool)
+                kind = 'thread'
+        futures.append((get_executor('thread', workers).submit(_render_stored, template_obj, rows, incremental),
+                        None, deadline))
+
+    try:
+        for (template_obj, rows), (future, pool, deadline) in zip(groups, futures):
+            yield _group_result(future, pool, deadline, template_obj, rows, workers, timeout, incremental)
+    finally:
+        # The caller stopped early (cancelled job, closed stream): drop groups not yet started
+        for future, _, _ in futures:
+            future.cancel()
@@ -0,0 +1,94 @@
+"""
+Parsed spreadsheets shared by every worker process (data/sheets.db).
+
+/api/excel-configs hands out a token for an uploaded sheet so configs can be
+regenerated (or queued as a job) without uploading it again. The follow-up
+request may reach any gunicorn worker, so the rows are kept in SQLite rather
+than in one process's memory. Sheets expire after their TTL, and the oldest are
+dropped once the stored rows exceed max_bytes.
+"""
+import json
+import os
+import time
+from database import ConnectionPool
+
+
+class SheetStore:
+    def __init__(self, db_path='data/sheets.db', pool_size=2, max_bytes=None):
+        os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        self.db_path = db_path
+        self.max_bytes = max_bytes
+        self.pool = ConnectionPool(db_path, pool_size)
+        self.init_db()
+
+    def init_db(self):
+        conn = self.pool.acquire()
+        try:
+            conn.execute('PRAGMA journal_mode = WAL')
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS sheets (
+                    token TEXT PRIMARY KEY,
+                    filename TEXT,
+                    columns TEXT NOT NULL,
+                    rows TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    created REAL NOT NULL,
+                    expires REAL NOT NULL
+                )
+            ''')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_sheets_expires ON sheets(expires)')
+            conn.commit()
+        finally:
+            conn.close()
+
+    def put(self, token, sheet, rows_json):
+        """Store sheet (filename, columns, expires_at) with its rows already encoded as rows_json"""
+        now = time.time()
+        conn = self.pool.acquire()
+        try:
+            conn.execute('INSERT OR REPLACE INTO sheets (token, filename, columns, rows, size, created, expires) '
+                         'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                         (token, sheet['filename'], json.dumps(sheet['columns'], default=str), rows_json,
+                          len(rows_json), now, sheet['expires_at']))
+            conn.execute('DELETE FROM sheets WHERE expires < ?', (now,))
+            if self.max_bytes:
+                # Oldest first, until the rest fit; the sheet just stored is always kept
+                conn.execute('''
+                    DELETE FROM sheets WHERE token IN (
+                        SELECT token FROM (
+                            SELECT token, SUM(size) OVER (ORDER BY created DESC, token) AS running FROM sheets
+                        ) WHERE running > ?
+                    ) AND token != ?
+                ''', (self.max_bytes, token))
+            conn.commit()
+        finally:
+            conn.close()
+
+    def get(self, token):
+        """The sheet stored under token ({rows, columns, filename, expires_at, size}), or None once expired"""
+        conn = self.pool.acquire()
+        try:
+            row = conn.execute('SELECT filename, columns, rows, size, expires FROM sheets '
+                               'WHERE token = ? AND expires >= ?', (token, time.time())).fetchone()
+        finally:
+            conn.close()
+        if row is None:
+            return None
+        return {
+            'rows': json.loads(row['rows']),
+            'columns': json.loads(row['columns']),
+            'filename': row['filename'],
+            'expires_at': row['expires'],
+            'size': row['size']
+        }
+
+    def stats(self):
+        conn = self.pool.acquire()
+        try:
+            row = conn.execute('SELECT COUNT(*) AS sheets, COALESCE(SUM(size), 0) AS bytes FROM sheets').fetchone()
+        finally:
+            conn.close()
+        return {'sheets': row['sheets'], 'total_bytes': row['bytes'], 'max_bytes': self.max_bytes}
+
+    def close(self):
+        self.pool.close()
@@ -1,6 +1,7 @@
 // Global variables
 let variablesEditor, templateEditor;
 let uploadedData = null;
+let sheetToken = null;         // Server-side copy of the uploaded rows; dropped once a cell is edited
 let currentTemplateId = null;
 let currentTemplateVersion = null;
 let isEditMode = false;
@@ -125,9 +126,12 @@ function switchTab(tabName) {
         }, 100);
     }
 
-    // Load logs if switching to logs tab
+    // Load logs and follow new entries live while the logs tab is open
     if (tabName === 'logs') {
         refreshLogs();
+        startLogStream();
+    } else {
+        stopLogStream();
     }
 }
 
@@ -332,6 +336,7 @@ async function handleFileUpload(event) {
             });
 
             uploadedData = sortedData;
+            sheetToken = result.token || null;
 
             const generateBtn = document.getElementById('generateBtn');
             if (generateBtn) generateBtn.disabled = false;
@@ -661,8 +666,9 @@ async function displayEditablePreview(data, columns) {
 async function handleCellEdit(rowIndex, column, value) {
     if (!uploadedData || !uploadedData[rowIndex]) return;
 
-    // Update the data
+    // Update the data; the server's copy of the sheet no longer matches it
     uploadedData[rowIndex][column] = value;
+    sheetToken = null;
 }
 
 async function generateConfigs() {
@@ -673,19 +679,70 @@ async function generateConfigs() {
     }
 
     try {
-        const response = await fetch('/api/generate-configs', {
+        // Stream one NDJSON record per template group and render results as they arrive
+        const requestConfigs = (body) => fetch('/api/generate-configs/stream', {
             method: 'POST',
             headers: {'Content-Type': 'application/json'},
-            body: JSON.stringify({excel_data: data})
+            body: JSON.stringify(body)
         });
 
-        const result = await response.json();
+        // Unedited rows in upload order are already on the server: send the sheet token, not the rows
+        const useToken = sheetToken && !sortState && data.length === uploadedData.length;
+        let response = await requestConfigs(useToken ? {token: sheetToken} : {excel_data: data});
+        if (useToken && response.status === 404) {
+            // The stored sheet expired; fall back to posting the rows
+            sheetToken = null;
+            response = await requestConfigs({excel_data: data});
+        }
 
-        if (result.success) {
-            generatedConfigs = result.configs;
-            displayConfigs(result.configs, result.success_row_count, result.error_row_count, result.skipped_row_count);
-        } else {
+        if (!response.ok) {
+            const result = await response.json();
             alert('Error generating configs: ' + result.error);
+            return;
+        }
+
+        generatedConfigs = [];
+        let successRowCount = 0;
+        let errorRowCount = 0;
+        let skippedRowCount = 0;
+
+        const handleRecord = (record) => {
+            if (record.type === 'start') {
+                skippedRowCount = record.skipped_row_count;
+            } else if (record.type === 'group') {
+                record.configs.forEach(config => {
+                    generatedConfigs.push(config);
+                    if (config.success) {
+                        successRowCount += config.row_count;
+                    } else {
+                        errorRowCount += 1;
+                    }
+                });
+            } else if (record.type === 'summary') {
+                successRowCount = record.success_row_count;
+                errorRowCount = record.error_row_count;
+                skippedRowCount = record.skipped_row_count;
+            } else if (record.type === 'error') {
+                throw new Error(record.error);
+            }
+        };
+
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = '';
+
+        while (true) {
+            const {done, value} = await reader.read();
+            buffer += decoder.decode(value || new Uint8Array(), {stream: !done});
+
+            const lines = buffer.split('\n');
+            buffer = done ? '' : lines.pop();
+            lines.filter(line => line.trim()).forEach(line => handleRecord(JSON.parse(line)));
+
+            // Redraw once per received chunk rather than once per record
+            displayConfigs(generatedConfigs, successRowCount, errorRowCount, skippedRowCount);
+
+            if (done) break;
         }
     } catch (error) {
         alert('Error generating configs: ' + error.message);
@@ -1787,14 +1844,26 @@ document.addEventListener("DOMContentLoaded", () => {
 
 // ========== Logs Tab ==========
 let allLogs = [];
+let logCursor = null;  // id of the newest log entry already loaded
+const MAX_LOGS_IN_VIEW = 5000;
 
 async function refreshLogs() {
     try {
-        const response = await fetch('/api/logs');
+        // First load fetches the latest entries; later refreshes only fetch entries newer than the cursor
+        const url = logCursor === null ? '/api/logs/query?limit=1000' : `/api/logs/query?since_id=${logCursor}&limit=1000`;
+        const response = await fetch(url);
         const result = await response.json();
 
         if (result.success) {
-            allLogs = result.logs;
+            allLogs = logCursor === null ? result.logs : allLogs.concat(result.logs);
+            if (allLogs.length > MAX_LOGS_IN_VIEW) {
+                allLogs = allLogs.slice(-MAX_LOGS_IN_VIEW);
+            }
+            logCursor = result.next_since_id;
+            if (result.has_more) {
+                // More new entries than one page: keep reading until caught up
+                return refreshLogs();
+            }
             filterLogs();
         } else {
             document.getElementById('logsContainer').innerHTML = '<div style="color: #f44336;">Error loading logs</div>';
@@ -1805,8 +1874,56 @@ async function refreshLogs() {
     }
 }
 
+let logStream = null;
+let logRedrawTimer = null;
+
+function startLogStream() {
+    if (logStream || !window.EventSource) return;
+
+    logStream = new EventSource('/api/logs/stream');
+
+    logStream.onmessage = (event) => {
+        const entry = JSON.parse(event.data);
+        if (entry.id != null) {
+            // Before the first load, or already fetched by refreshLogs(): skip it
+            if (logCursor === null || entry.id <= logCursor) return;
+            // Advance the cursor so the next refresh does not fetch streamed entries again
+            logCursor = entry.id;
+        }
+        allLogs.push(entry);
+        scheduleLogRedraw();
+    };
+
+    // The server dropped entries because this tab fell behind
+    logStream.addEventListener('dropped', (event) => {
+        const dropped = JSON.parse(event.data).dropped;
+        const now = new Date().toISOString().slice(0, 19).replace('T', ' ');
+        allLogs.push({timestamp: now, level: 'WARNING', message: `${dropped} live log entries dropped (browser fell behind)`, module: 'logs', line: 0});
+        scheduleLogRedraw();
+    });
+}
+
+function stopLogStream() {
+    if (logStream) {
+        logStream.close();
+        logStream = null;
+    }
+}
+
+function scheduleLogRedraw() {
+    // Batch bursts of records into a single redraw
+    if (logRedrawTimer) return;
+    logRedrawTimer = setTimeout(() => {
+        logRedrawTimer = null;
+        if (allLogs.length > MAX_LOGS_IN_VIEW) {
+            allLogs = allLogs.slice(-MAX_LOGS_IN_VIEW);
+        }
+        filterLogs();
+    }, 250);
+}
+
 function filterLogs() {
-    if (!allLogs || allLogs.length === 0) {
+    if (logCursor === null) {
         refreshLogs();
         return;
     }
@@ -1956,6 +2073,7 @@ async function confirmClearLogs() {
 
         if (result.success) {
             showNotification('Success', 'Logs cleared successfully', 'success');
+            allLogs = [];
             refreshLogs();
         } else {
             showNotification('Error', 'Error clearing logs: ' + result.error, 'error');
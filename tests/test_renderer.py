@@ -0,0 +1,102 @@
+import pytest
+from jinja2.exceptions import SecurityError
+
+import renderer
+
+PORT_ROW = '{% macro port_row(p) %}{{ p.port }}@{{ switch_name }} {% endmacro %}'
+
+
+@pytest.fixture(autouse=True)
+def empty_fragment_cache():
+    renderer.row_fragments.clear()
+    yield
+    renderer.row_fragments.clear()
+
+
+def rows(*ports):
+    return [{'switch_name': 'S', 'port': port} for port in ports]
+
+
+def test_edited_row_re_renders_only_that_row():
+    template = renderer.compile_source(PORT_ROW + '{% for p in ports %}{{ port_row(p) }}{% endfor %}')
+    assert template.fragment_key
+
+    assert renderer.render_group(template, rows(1, 2, 3)) == '1@S 2@S 3@S '
+    misses = renderer.row_fragments.misses
+    assert renderer.render_group(template, rows(1, 2, 4)) == '1@S 2@S 4@S '
+    assert renderer.row_fragments.misses - misses == 1
+
+
+@pytest.mark.parametrize('source', [
+    # port_row calls a block through self
+    '{% macro port_row(p) %}{{ p.port }}/{{ self.total() }} {% endmacro %}'
+    '{% block total %}{{ ports|length }}{% endblock %}|{% for p in ports %}{{ port_row(p) }}{% endfor %}',
+    # ... through another macro
+    '{% macro helper() %}{{ self.total() }}{% endmacro %}{% macro port_row(p) %}{{ p.port }}/{{ helper() }} {% endmacro %}'
+    '{% block total %}{{ ports|length }}{% endblock %}|{% for p in ports %}{{ port_row(p) }}{% endfor %}',
+    # ... or defines one
+    '{% macro port_row(p) %}{{ p.port }}/{% block n %}{{ ports|length }}{% endblock %} {% endmacro %}'
+    '{% for p in ports %}{{ port_row(p) }}{% endfor %}',
+])
+def test_template_using_blocks_is_not_served_stale_rows(source):
+    template = renderer.compile_source(source)
+    assert template.fragment_key is None
+
+    renderer.render_group(template, rows(1, 2))
+    output = renderer.render_group(template, rows(1, 2, 3))
+    assert output == renderer.render_group(template, rows(1, 2, 3), incremental=False)
+    assert '1/3' in output and '2/3' in output and '3/3' in output
+
+
+def render(source, **context):
+    return renderer.render_limited(renderer.render_env.from_string(source), context)
+
+
+def test_iteration_cap_counts_nested_loops(monkeypatch):
+    monkeypatch.setattr(renderer, 'RENDER_MAX_LOOP_ITERATIONS', 10_000)
+    assert len(render('{% for a in range(50) %}{% for b in range(100) %}.{% endfor %}{% endfor %}')) == 5000
+    with pytest.raises(renderer.RenderAborted, match='loop iterations'):
+        render('{% for a in range(200) %}{% for b in range(200) %}{% endfor %}{% endfor %}')
+
+
+def test_iteration_cap_counts_recursive_loops(monkeypatch):
+    monkeypatch.setattr(renderer, 'RENDER_MAX_LOOP_ITERATIONS', 10_000)
+    tree = [{'name': 'a', 'kids': [{'name': 'b', 'kids': []}]}]
+    source = '{% for n in tree recursive %}[{{ n.name }}{% if n.kids %}{{ loop(n.kids) }}{% endif %}]{% endfor %}'
+    assert render(source, tree=tree) == '[a[b]]'
+    with pytest.raises(renderer.RenderAborted, match='loop iterations'):
+        render('{% for n in [1] recursive %}{{ loop([1] * 5000) if loop.depth < 3 }}{% endfor %}')
+
+
+def test_cpu_time_cap(monkeypatch):
+    monkeypatch.setattr(renderer, 'RENDER_CPU_SECONDS', 0.2)
+    monkeypatch.setattr(renderer, 'RENDER_MAX_LOOP_ITERATIONS', 10 ** 12)
+    with pytest.raises(renderer.RenderAborted, match='CPU time'):
+        render('{% for a in range(100000) %}{% for b in range(100000) %}{% endfor %}{% endfor %}')
+
+
+def test_dunder_attributes_are_blocked():
+    assert render("{{ ''.__class__ }}") == ''
+    with pytest.raises(SecurityError):
+        render("{{ ''.__class__.__mro__ }}")
+
+
+def test_small_widths_and_repetition_still_render():
+    assert render("{{ 'x'|center(5) }}|{{ '%03d' % 7 }}|{{ '{:>4}'.format(1) }}|{{ ([0] * 3)|length }}") == \
+        '  x  |007|   1|3'
+
+
+@pytest.mark.parametrize('source', [
+    "{{ 'x'|center(300000000) }}",
+    "{{ 'x'|indent(300000000, true) }}",
+    "{{ '%0300000000d' % 1 }}",
+    "{{ '%*d' % (300000000, 1) }}",
+    "{{ '%0300000000d'|format(1) }}",
+    "{{ '{:>300000000}'.format(1) }}",
+    "{{ '{:>{w}}'.format(1, w=300000000) }}",
+    "{{ 'x'.rjust(300000000) }}",
+    "{{ ([0] * 40000000)|length }}",
+])
+def test_oversized_widths_and_repetition_are_refused(source):
+    with pytest.raises(renderer.RenderAborted):
+        render(source)
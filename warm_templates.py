@@ -0,0 +1,59 @@
+"""
+Precompile every template's active version into the compiled template store
+(renderer.template_code_store, data/compiled_templates by default), so no worker
+compiles templates from source after a deploy or restart.
+
+Usage: python warm_templates.py [db_path] [--prune]
+
+--prune also deletes stored code that no active version uses any more.
+"""
+import argparse
+import time
+
+import renderer
+
+
+def warm(database, prune=False, log=print):
+    """Load (or compile and store) every active version into the in-memory cache.
+
+    Returns counts of templates compiled now, already stored, failed and pruned files.
+    """
+    start = time.perf_counter()
+    stats = {'compiled': 0, 'stored': 0, 'failed': 0, 'pruned': 0}
+    versions = database.get_active_versions()
+    for version in versions:
+        already_stored = renderer.template_code_store.contains(renderer.render_env, version['template_content'])
+        try:
+            renderer.get_compiled_template(version['id'], version['active_version'], version['template_content'])
+        except Exception as e:
+            log(f"Template '{version['name']}' v{version['active_version']} does not compile: {e}")
+            stats['failed'] += 1
+            continue
+        stats['stored' if already_stored else 'compiled'] += 1
+
+    if prune:
+        stats['pruned'] = renderer.template_code_store.prune(
+            renderer.render_env, [version['template_content'] for version in versions])
+
+    stats['seconds'] = round(time.perf_counter() - start, 3)
+    log(f"Template warm-up: {stats['compiled']} compiled, {stats['stored']} already stored, "
+        f"{stats['failed']} failed, {stats['pruned']} pruned in {stats['seconds']}s")
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Precompile the active version of every template')
+    parser.add_argument('db_path', nargs='?', default='data/templates.db')
+    parser.add_argument('--prune', action='store_true', help='delete stored code no active version uses')
+    args = parser.parse_args()
+
+    from database import Database
+    database = Database(args.db_path)
+    try:
+        warm(database, prune=args.prune)
+    finally:
+        database.close()
+
+
+if __name__ == '__main__':
+    main()